@@ -7,15 +7,15 @@ def getMerkleRoot(
     leaf: bytes32,
     proof: bytes32[256]
 ) -> bytes32:
-    targetBit: uint256 = 1  # traverse path in LSB:leaf->MSB:root order
-    proofElement: bytes32 = proof[255]
+    _path: uint256 = path  # traverse path in LSB:leaf->MSB:root order
+    depth: uint256 = 256
     nodeHash: bytes32 = keccak256(leaf)  # First node is hash of leaf
     for i in range(256):
         # proof is in root->leaf order, so iterate in reverse
-        proofElement = proof[255-i]
-        if (bitwise_and(path, targetBit) > 0):
-            nodeHash = keccak256(concat(proofElement, nodeHash))
+        depth -= 1
+        if bitwise_and(_path, 1) == 0:
+            nodeHash = keccak256(concat(nodeHash, proof[depth]))
         else:
-            nodeHash = keccak256(concat(nodeHash, proofElement))
-        targetBit = shift(targetBit, 1)
+            nodeHash = keccak256(concat(proof[depth], nodeHash))
+        _path /= 2
     return nodeHash
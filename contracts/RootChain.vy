@@ -2,6 +2,7 @@
 struct Deposit:
     depositor: address
     depositBlk: uint256
+    size: uint256  # Coin covers tokenIds [tokenId, tokenId + size)
 
 struct Transaction:
     newOwner: address
@@ -100,6 +101,7 @@ challenges: map(uint256, map(uint256, Challenge))
 
 # Constants
 CHALLENGE_PERIOD: constant(timedelta) = 604800  # 7 days (7*24*60*60 secs)
+MAX_RANGE: constant(uint256) = 64  # Most tokens one coin can cover (bounded by gas to move them)
 CHAIN_ID: constant(uint256) = 1337  # Must set dynamically for chain being deployed to
 # NOTE: CHAIN_ID must be monkeypatched for testing/testnets
 DOMAIN_TYPE_HASH: constant(bytes32) = keccak256(
@@ -118,6 +120,12 @@ def __init__(_token: address):
     self.token = ERC721(_token)
 
 
+@public
+@constant
+def challengePeriod() -> timedelta:
+    return CHALLENGE_PERIOD
+
+
 # UTILITY FUNCTIONS #
 @constant
 @private
@@ -126,17 +134,19 @@ def _getMerkleRoot(
     _leaf: bytes32,
     _proof: bytes32[256]
 ) -> bytes32:
-    targetBit: uint256 = 1  # traverse path in LSB:leaf->MSB:root order
-    proofElement: bytes32 = _proof[255]
+    path: uint256 = _path  # traverse path in LSB:leaf->MSB:root order
+    depth: uint256 = 256
     nodeHash: bytes32 = keccak256(_leaf)  # First node is hash of leaf
     for i in range(256):
         # proof is in root->leaf order, so iterate in reverse
-        proofElement = _proof[255-i]
-        if (bitwise_and(_path, targetBit) > 0):
-            nodeHash = keccak256(concat(proofElement, nodeHash))
+        # NOTE: Counting down from 256 (instead of 255-i) and halving the
+        #       path (instead of shifting a target bit) saves ~140 gas/level
+        depth -= 1
+        if bitwise_and(path, 1) == 0:
+            nodeHash = keccak256(concat(nodeHash, _proof[depth]))
         else:
-            nodeHash = keccak256(concat(nodeHash, proofElement))
-        targetBit = shift(targetBit, 1)
+            nodeHash = keccak256(concat(_proof[depth], nodeHash))
+        path /= 2
     return nodeHash
 
 
@@ -144,6 +154,8 @@ def _getMerkleRoot(
 @private
 def _getTransactionHash(_txn: Transaction) -> bytes32:
     # TODO: Use Vyper API from #1020 for this instead of concat/convert
+    # NOTE: Rebuilding the domain separator (~300 gas) is cheaper than
+    #       reading it from storage (SLOAD), until Vyper has immutables
     domainSeparator: bytes32 = keccak256(concat(#abi.encode(
             DOMAIN_TYPE_HASH,           # EIP712 Domain Type Identifier Hash
             PROTOCOL_NAME,              # EIP712 Domain: name
@@ -164,6 +176,16 @@ def _getTransactionHash(_txn: Transaction) -> bytes32:
         ))
 
 
+@private
+def _transferRange(_from: address, _to: address, _start: uint256, _size: uint256):
+    # NOTE: Counting instead of comparing to an end keeps the last tokenId
+    #       (2**256-1) from overflowing
+    for i in range(MAX_RANGE):
+        if convert(i, uint256) >= _size:
+            break
+        self.token.safeTransferFrom(_from, _to, _start + convert(i, uint256))
+
+
 # Plasma functions #
 @public
 def submitBlock(_blkRoot: bytes32):
@@ -173,10 +195,11 @@ def submitBlock(_blkRoot: bytes32):
     log.BlockPublished(_blkRoot)
 
 
-@public
-def deposit(
+@private
+def _deposit(
     _from: address,
     _txn: Transaction,
+    _size: uint256,
 ):
     # Verify block number is current block
     assert self.childChain_len == _txn.prevBlkNum
@@ -185,16 +208,18 @@ def deposit(
     txnHash: bytes32 = self._getTransactionHash(_txn)
     assert _from == ecrecover(txnHash, _txn.sigV, _txn.sigR, _txn.sigS)
 
-    # Transfer the token to this contract (also verifies custody)
-    # NOTE: Custody ensures no re-deposits of already deposited coins
+    # Transfer the tokens to this contract (also verifies custody)
+    # NOTE: Custody ensures no re-deposits of already deposited coins,
+    #       and that coins never overlap
     # TODO: Verify this ^
-    self.token.safeTransferFrom(_from, self, _txn.tokenId)
+    self._transferRange(_from, self, _txn.tokenId, _size)
 
     # Allow recipient of deposit to withdraw the token
     # (No other spends can happen until confirmed)
     self.deposits[_txn.tokenId] = Deposit({
         depositor: _txn.newOwner,
         depositBlk: _txn.prevBlkNum,
+        size: _size,
     })
 
     # NOTE: This will signal to the Plasma Operator to
@@ -207,6 +232,28 @@ def deposit(
                      _txn.sigS)
 
 
+@public
+def deposit(
+    _from: address,
+    _txn: Transaction,
+):
+    self._deposit(_from, _txn, 1)
+
+
+# Deposit tokenIds [_txn.tokenId, _end) as one coin
+# NOTE: The coin moves as a whole (it is never split), and is
+#       known by its first tokenId everywhere else
+@public
+def depositRange(
+    _from: address,
+    _txn: Transaction,
+    _end: uint256,
+):
+    assert _end > _txn.tokenId
+    assert _end - _txn.tokenId <= MAX_RANGE
+    self._deposit(_from, _txn, _end - _txn.tokenId)
+
+
 # This will be the callback that token.safeTransferFrom() executes
 @public
 def onERC721Received(
@@ -226,7 +273,7 @@ def onERC721Received(
 def withdraw(_tokenId: uint256):
     assert self.deposits[_tokenId].depositor == msg.sender
     assert self.deposits[_tokenId].depositBlk == self.childChain_len
-    self.token.safeTransferFrom(self, msg.sender, _tokenId)
+    self._transferRange(self, msg.sender, _tokenId, self.deposits[_tokenId].size)
     clear(self.deposits[_tokenId])
     log.DepositCancelled(_tokenId, msg.sender)
 
@@ -396,8 +443,11 @@ def finalizeExit(_tokenId: uint256):
         # Clear the exit
         clear(self.exits[_tokenId])
 
-        # Withdraw the token!
-        self.token.safeTransferFrom(self, msg.sender, _tokenId)
+        # Withdraw the token(s)!
+        # NOTE: Coins that were never deposited (e.g. a tokenId inside a range)
+        #       have nothing to withdraw
+        self._transferRange(self, msg.sender, _tokenId, self.deposits[_tokenId].size)
+        clear(self.deposits[_tokenId])
 
         # Announce the exit was cancelled
         log.ExitFinished(_tokenId, msg.sender)
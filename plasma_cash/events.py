@@ -0,0 +1,232 @@
+"""
+One subscription to a contract's events, shared by everyone in the process
+
+Instead of a log filter per event per listener (each polled on its own), a
+dispatcher makes one `eth_getLogs` query per new L1 block for every event
+anyone is subscribed to. Each log is decoded once, using a decoder built
+for its event up front, and then queued for every subscription it matches.
+Subscriptions can also match on event arguments, which is done locally.
+
+A `Subscription` behaves like a web3 log filter (`get_new_entries`), so it
+can stand in for one anywhere a filter was used.
+"""
+import itertools
+import threading
+import weakref
+
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple
+
+from eth_abi.grammar import parse
+from eth_typing import AnyAddress
+from eth_utils import (
+    event_abi_to_log_topic,
+    to_checksum_address,
+)
+
+from web3 import Web3
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.datastructures import AttributeDict
+
+from .contracts import rootchain_interface
+
+
+_dispatchers = weakref.WeakKeyDictionary()  # Web3 -> Dict mapping contract address to dispatcher
+_dispatchers_lock = threading.Lock()
+
+_subscription_ids = itertools.count()
+
+
+@lru_cache(maxsize=1024)
+def _checksum(address: bytes) -> str:
+    return to_checksum_address(address)
+
+
+# How to read each (static) ABI type straight out of a 32 byte word
+_WORD_DECODERS = {
+    'address': lambda word: _checksum(word[12:]),
+    'bool': lambda word: word[-1] == 1,
+    'bytes32': bytes,
+    'uint256': lambda word: int.from_bytes(word, 'big'),
+}
+
+
+class EventDecoder:
+    """
+    Decodes the logs of one event (same output as web3's `get_event_data`)
+    NOTE Events where every argument fits in a word (all of RootChain's) skip eth-abi
+    """
+
+    def __init__(self, w3: Web3, event_abi: Dict[str, Any]):
+        self._codec = w3.codec
+        self.name = event_abi['name']
+        self.topic = event_abi_to_log_topic(event_abi)
+        self._topic_inputs = [i for i in event_abi['inputs'] if i['indexed']]
+        self._data_inputs = [i for i in event_abi['inputs'] if not i['indexed']]
+        self._data_types = [i['type'] for i in self._data_inputs]
+        self._words = all(t in _WORD_DECODERS.keys() for t in self._data_types) and \
+                all(not parse(t).is_dynamic for t in self._data_types)
+
+    def _decode_data(self, data: bytes) -> List[Any]:
+        if self._words:
+            return [_WORD_DECODERS[t](data[i * 32:(i + 1) * 32])
+                    for i, t in enumerate(self._data_types)]
+        values = self._codec.decode_abi(self._data_types, data)
+        return map_abi_data(BASE_RETURN_NORMALIZERS, self._data_types, values)
+
+    def decode(self, log: Dict[str, Any]) -> AttributeDict:
+        data = log['data']
+        data = bytes.fromhex(data[2:]) if isinstance(data, str) else bytes(data)
+        args = {}
+        for abi, topic in zip(self._topic_inputs, log['topics'][1:]):
+            value = self._codec.decode_single(abi['type'], bytes(topic))
+            args[abi['name']] = map_abi_data(BASE_RETURN_NORMALIZERS, [abi['type']], [value])[0]
+        args.update(zip((i['name'] for i in self._data_inputs), self._decode_data(data)))
+        return AttributeDict({
+            'args': AttributeDict(args),
+            'event': self.name,
+            'logIndex': log['logIndex'],
+            'transactionIndex': log['transactionIndex'],
+            'transactionHash': log['transactionHash'],
+            'address': log['address'],
+            'blockHash': log['blockHash'],
+            'blockNumber': log['blockNumber'],
+        })
+
+
+class Subscription:
+    """
+    Logs of one event (from `from_block` on) waiting for one listener
+    """
+
+    def __init__(self, dispatcher: 'EventDispatcher', event: str, from_block: int, match: Dict[str, Any]):
+        self.id = next(_subscription_ids)
+        self.event = event
+        self.from_block = from_block
+        self.match = match  # Argument values a log must have
+        self.logs = []  # Ordered list of logs not handed out yet
+        self._dispatcher = dispatcher
+
+    def matches(self, log: AttributeDict) -> bool:
+        if log['blockNumber'] < self.from_block:
+            return False
+        return all(log['args'][name] == value for name, value in self.match.items())
+
+    def drain(self) -> List[AttributeDict]:
+        """ Logs that came in since last time (without polling for more) """
+        logs, self.logs = self.logs, []
+        return logs
+
+    def get_new_entries(self) -> List[AttributeDict]:
+        """ Same as a web3 log filter's """
+        self._dispatcher.poll()
+        return self.drain()
+
+    def cancel(self):
+        self._dispatcher.unsubscribe(self)
+
+
+class EventDispatcher:
+    """
+    Polls a contract's events for every subscription at once
+    NOTE Share one per contract (see get_dispatcher)
+    """
+
+    def __init__(self, w3: Web3, address: AnyAddress, abi: List[Dict[str, Any]]):
+        self._w3 = w3
+        self.address = address
+        self._lock = threading.RLock()
+        self._decoders = {}  # Dict mapping log topic to decoder
+        self._topics = {}  # Dict mapping event name to log topic
+        for event_abi in abi:
+            if event_abi['type'] == 'event':
+                decoder = EventDecoder(w3, event_abi)
+                self._decoders[decoder.topic] = decoder
+                self._topics[decoder.name] = decoder.topic
+        # NOTE Subscriptions go away with their listener
+        self._subscriptions = {}  # Dict mapping event name to WeakSet of subscriptions
+        self.last_block = w3.eth.blockNumber  # Every log up to here was dispatched
+        self.queries = 0  # Number of log queries made (for instrumentation)
+
+    def subscribe(self, event: str, from_block: int=None, **match) -> Subscription:
+        """ Subscription to `event` logs from `from_block` on (default the next block), matching `match` """
+        assert event in self._topics.keys(), "No event {}!".format(event)
+        with self._lock:
+            subscription = Subscription(
+                    self,
+                    event,
+                    from_block if from_block is not None else self.last_block + 1,
+                    match,
+                )
+            self._subscriptions.setdefault(event, weakref.WeakSet()).add(subscription)
+            if subscription.from_block <= self.last_block:
+                # Catch up on what was already dispatched
+                logs = self._get_logs(subscription.from_block, self.last_block, [event])
+                subscription.logs.extend(log for log in logs if subscription.matches(log))
+            return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.get(subscription.event, weakref.WeakSet()).discard(subscription)
+
+    def _get_logs(self, from_block: int, to_block: int, events: List[str]) -> List[AttributeDict]:
+        self.queries += 1
+        raw_logs = self._w3.eth.getLogs({
+            'address': self.address,
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'topics': [['0x' + self._topics[e].hex() for e in events]],  # Any of them
+        })
+        logs = []
+        for log in sorted(raw_logs, key=lambda l: (l['blockNumber'], l['logIndex'])):
+            decoder = self._decoders.get(bytes(log['topics'][0]))
+            if decoder:
+                logs.append(decoder.decode(log))
+        return logs
+
+    def poll(self):
+        """ Fetch the logs of any new blocks, and queue them for every subscription they match """
+        with self._lock:
+            block_number = self._w3.eth.blockNumber
+            if block_number <= self.last_block:
+                return  # Nothing new
+            events = [e for e, subscriptions in self._subscriptions.items() if subscriptions]
+            logs = self._get_logs(self.last_block + 1, block_number, events) if events else []
+            self.last_block = block_number
+            for log in logs:
+                for subscription in self._subscriptions[log['event']]:
+                    if subscription.matches(log):
+                        subscription.logs.append(log)
+
+    def save(self) -> Tuple[int, Dict[int, List[AttributeDict]]]:
+        """ Where we are, and the logs each subscription has waiting (see `restore`) """
+        with self._lock:
+            waiting = {s.id: list(s.logs) for subs in self._subscriptions.values() for s in subs}
+            return self.last_block, waiting
+
+    def restore(self, state: Tuple[int, Dict[int, List[AttributeDict]]]):
+        """ Go back to what `save` gave (e.g. after the chain was reverted) """
+        with self._lock:
+            self.last_block, waiting = state
+            for subscriptions in self._subscriptions.values():
+                for subscription in subscriptions:
+                    if subscription.id in waiting.keys():
+                        subscription.logs = list(waiting[subscription.id])
+                    else:
+                        # NOTE Subscribed since, so only drop what is going to be dispatched again
+                        subscription.logs = [log for log in subscription.logs
+                                             if log['blockNumber'] <= self.last_block]
+
+
+def get_dispatcher(w3: Web3, rootchain_address: AnyAddress) -> EventDispatcher:
+    """ Dispatcher shared by everyone in the process on this connection and rootchain """
+    with _dispatchers_lock:
+        dispatchers = _dispatchers.setdefault(w3, {})
+        if rootchain_address not in dispatchers.keys():
+            dispatchers[rootchain_address] = EventDispatcher(
+                    w3,
+                    rootchain_address,
+                    rootchain_interface['abi'],
+                )
+        return dispatchers[rootchain_address]
@@ -0,0 +1,60 @@
+import threading
+import weakref
+
+from eth_typing import AnyAddress, Hash32
+
+from web3 import Web3
+
+from .events import get_dispatcher
+
+
+_trackers = weakref.WeakKeyDictionary()  # Web3 -> Dict mapping rootchain address to tracker
+_trackers_lock = threading.Lock()
+
+
+class ChildChainTracker:
+    """
+    Height of the child chain (and the root of each block), fed by BlockPublished events
+    NOTE Share one per rootchain (see get_tracker), so only one of us has to poll for it
+    """
+
+    def __init__(self, w3: Web3, rootchain_address: AnyAddress):
+        self._lock = threading.Lock()
+        self.roots = []  # Ordered list of published roots (index is blkNum)
+        self._last_log = (-1, -1)  # (blockNumber, logIndex) of the last log we applied
+        # NOTE Every block ever published is needed, so start from the beginning
+        self._subscription = get_dispatcher(w3, rootchain_address).subscribe('BlockPublished', 0)
+        with self._lock:
+            self._apply(self._subscription.drain())
+
+    def _apply(self, logs):
+        for log in logs:
+            position = (log['blockNumber'], log['logIndex'])
+            if position <= self._last_log:
+                continue  # Already seen it
+            self.roots.append(log.args['blkRoot'])
+            self._last_log = position
+
+    def update(self) -> int:
+        """ Apply any newly published blocks, and return the height """
+        with self._lock:
+            self._apply(self._subscription.get_new_entries())
+            return len(self.roots)
+
+    @property
+    def height(self) -> int:
+        """ Number of published blocks (the block number of the one being built) """
+        return len(self.roots)
+
+    def root(self, blk_num: int) -> Hash32:
+        """ Published root of a block (None if not published yet) """
+        return self.roots[blk_num] if blk_num < len(self.roots) else None
+
+
+def get_tracker(w3: Web3, rootchain_address: AnyAddress) -> ChildChainTracker:
+    """ Tracker shared by everyone in the process on this connection and rootchain """
+    with _trackers_lock:
+        trackers = _trackers.setdefault(w3, {})
+        if rootchain_address not in trackers.keys():
+            trackers[rootchain_address] = ChildChainTracker(w3, rootchain_address)
+        return trackers[rootchain_address]
@@ -0,0 +1,176 @@
+"""
+Token histories sent as a stream of compact records
+
+A history goes out as one record per transaction (oldest first): the
+transaction (see `Transaction.to_bytes`), then a flag for whether its
+inclusion proof follows. A proof leaves out the siblings that are empty
+subtrees: a 256 bit map of which siblings are present, then only those.
+Most siblings in a sparse tree are empty, so a record is usually a few
+hundred bytes instead of 8 KB.
+
+The receiver checks each record as soon as all of it has come in (that the
+previous owner signed it, and that it is in its block), and stops at the
+first bad one without reading any further. Only the transactions are kept,
+so the proofs never pile up no matter how long the history is.
+"""
+import struct
+
+from typing import Callable, Iterable, Iterator
+
+from eth_typing import AnyAddress
+
+from .proof import HASH_SIZE, TREE_DEPTH, Proof
+from .smt import EMPTY_HASHES
+from .token import Token, follows
+from .transaction import Transaction
+from .verifier import Verifier
+
+
+# Transaction, whether a proof follows
+RECORD = struct.Struct('>192s?')
+
+BITMAP_SIZE = TREE_DEPTH // 8
+CHUNK_SIZE = 1 << 16  # Bytes sent at a time
+
+# Empty sibling at each depth of a branch (root->leaf order)
+_DEFAULTS = [EMPTY_HASHES[TREE_DEPTH - 1 - depth] for depth in range(TREE_DEPTH)]
+
+
+def compress_proof(proof: Proof) -> bytes:
+    bitmap = 0
+    hashes = []
+    for depth in range(TREE_DEPTH):
+        node = proof.view(depth)
+        if node != _DEFAULTS[depth]:
+            bitmap |= 1 << depth
+            hashes.append(node)
+    return bitmap.to_bytes(BITMAP_SIZE, 'big') + b''.join(hashes)
+
+
+def compressed_size(bitmap: bytes) -> int:
+    """ Size of a compressed proof, from its first `BITMAP_SIZE` bytes """
+    return BITMAP_SIZE + bin(int.from_bytes(bitmap, 'big')).count('1') * HASH_SIZE
+
+
+def expand_proof(data: bytes) -> Proof:
+    bitmap = int.from_bytes(data[:BITMAP_SIZE], 'big')
+    hashes = []
+    offset = BITMAP_SIZE
+    for depth in range(TREE_DEPTH):
+        if bitmap & (1 << depth):
+            hashes.append(data[offset:offset + HASH_SIZE])
+            offset += HASH_SIZE
+        else:
+            hashes.append(_DEFAULTS[depth])
+    assert offset == len(data), "Proof has extra data!"
+    return Proof.from_hashes(hashes)
+
+
+def encode_record(transaction: Transaction, proof: Proof=None) -> bytes:
+    record = RECORD.pack(transaction.to_bytes, proof is not None)
+    return record + compress_proof(proof) if proof is not None else record
+
+
+def stream_history(token: Token,
+                   get_branch: Callable[[int, int], Proof],
+                   height: int,
+                   chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Chunks of the token's history, with the proof of each transaction in a block
+    before `height` (the ones after aren't published yet)
+    NOTE Proofs are only fetched as the stream is read
+    """
+    buffer = bytearray()
+    for transaction in token.history:
+        proof = get_branch(transaction.tokenId, transaction.prevBlkNum) \
+                if transaction.prevBlkNum < height else None
+        buffer += encode_record(transaction, proof)
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class HistoryReader:
+    """
+    Checks a token's history record by record as its chunks come in
+    """
+
+    def __init__(self,
+                 chain_id: int,
+                 rootchain_address: AnyAddress,
+                 token_uid: int,
+                 verifier: Verifier):
+        self._chain_id = chain_id
+        self._rootchain_address = rootchain_address
+        self.token_uid = token_uid
+        self._verifier = verifier
+        self.history = []  # Ordered list of transactions checked so far
+        self._buffer = bytearray()  # Start of the record that hasn't fully come in yet
+        self.failed = False
+
+    def feed(self, chunk: bytes) -> bool:
+        """ Check every record completed by this chunk (False once one is bad) """
+        if self.failed:
+            return False
+        self._buffer += chunk
+        while True:
+            size = self._record_size()
+            if size is None or len(self._buffer) < size:
+                return True  # Wait for the rest of it
+            record = bytes(self._buffer[:size])
+            del self._buffer[:size]
+            if not self._check(record):
+                self.failed = True
+                self._buffer = bytearray()
+                return False
+
+    def _record_size(self) -> int:
+        if len(self._buffer) < RECORD.size:
+            return None
+        if not self._buffer[RECORD.size - 1]:
+            return RECORD.size  # No proof
+        if len(self._buffer) < RECORD.size + BITMAP_SIZE:
+            return None
+        return RECORD.size + compressed_size(self._buffer[RECORD.size:RECORD.size + BITMAP_SIZE])
+
+    def _check(self, record: bytes) -> bool:
+        txn_bytes, has_proof = RECORD.unpack(record[:RECORD.size])
+        transaction = Transaction.from_bytes(self._chain_id, self._rootchain_address, txn_bytes)
+        if transaction.tokenId != self.token_uid:
+            return False
+        try:
+            if self.history and not follows(self.history[-1], transaction):
+                return False
+        except Exception:
+            return False  # NOTE Signature doesn't even recover
+        if self._verifier.root(transaction.prevBlkNum) is not None:
+            # Published, so it has to be in that block
+            if not has_proof:
+                return False
+            if not self._verifier.verify(transaction, expand_proof(record[RECORD.size:])):
+                return False
+        self.history.append(transaction)
+        return True
+
+    def close(self) -> bool:
+        """ Whether the whole history came in, and all of it checks out """
+        return not self.failed and not self._buffer and len(self.history) > 0
+
+    def token(self, end: int=None) -> Token:
+        """ The token with the history we received (once closed) """
+        assert self.close(), "History is not valid!"
+        token = Token(self.token_uid, end=end)
+        token.history = self.history
+        token.mark_checked()  # Every link was checked as it came in
+        token.set_transferrable()
+        return token
+
+
+def read_history(reader: HistoryReader, chunks: Iterable[bytes]) -> bool:
+    """ Feed the chunks to `reader` as they come, stopping at the first bad record """
+    for chunk in chunks:
+        if not reader.feed(chunk):
+            return False  # Don't read any more of it
+    return reader.close()
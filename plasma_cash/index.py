@@ -0,0 +1,158 @@
+"""
+Index of which blocks touched which tokens
+
+Each sealed block gets a membership filter over its tokenIds: the exact
+(sorted) tokenIds for small blocks, and a Bloom filter for large ones.
+Blocks are also grouped into segments, and segments into groups, each with
+a Bloom filter over all of their tokens, so most groups (and segments) can be
+skipped without looking at what is inside them. Those filters don't know up
+front how many tokens they will get, so they grow instead of saturating.
+
+Queries return *candidate* block numbers (a Bloom filter can have false
+positives, but never false negatives), without touching any of the trees.
+"""
+import math
+
+from bisect import bisect_left
+from typing import Iterable, List, Sequence, Tuple
+
+from eth_utils import keccak
+
+from .smt import to_bytes32
+
+
+EXACT_MAX = 64  # Blocks with at most this many tokens are stored exactly
+FALSE_POSITIVE_RATE = 0.01
+SEGMENT_SIZE = 1024  # Number of blocks covered by each segment filter
+GROUP_SIZE = 32  # Number of segments covered by each group filter
+INITIAL_CAPACITY = 1024  # Number of tokens the first filter of a segment (or group) is sized for
+
+
+def token_hashes(token_uid: int) -> Tuple[int, int]:
+    """ Two independent hashes of a token, to derive all the filter positions from """
+    digest = keccak(to_bytes32(token_uid))
+    return int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:16], 'big') | 1
+
+
+class BloomFilter:
+
+    def __init__(self, num_bits: int, num_hashes: int):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int, rate: float=FALSE_POSITIVE_RATE) -> 'BloomFilter':
+        num_bits = max(8, math.ceil(-capacity * math.log(rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, hashes: Tuple[int, int]):
+        h1, h2 = hashes
+        # NOTE Double hashing (Kirsch-Mitzenmacher) instead of k hash functions
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, hashes: Tuple[int, int]):
+        for pos in self._positions(hashes):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, hashes: Tuple[int, int]) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(hashes))
+
+
+class ScalableBloomFilter:
+    """
+    Bloom filter for an unknown number of tokens: once the current filter is full,
+    a new one twice the size (and with half the false positive rate) is started
+    NOTE The false positive rate of all of them together stays below `rate`
+    """
+
+    def __init__(self, capacity: int=INITIAL_CAPACITY, rate: float=FALSE_POSITIVE_RATE):
+        self.capacity = capacity // 2  # Doubled for the first filter
+        self.rate = rate
+        self.filters = []
+        self.count = 0  # Number of tokens in the last filter
+
+    def add(self, hashes: Tuple[int, int]):
+        if hashes in self:
+            return  # NOTE Don't count the same token twice
+        if not self.filters or self.count >= self.capacity:
+            self.capacity *= 2
+            self.filters.append(BloomFilter.for_capacity(
+                self.capacity, self.rate / 2 ** (len(self.filters) + 1)))
+            self.count = 0
+        self.filters[-1].add(hashes)
+        self.count += 1
+
+    def __contains__(self, hashes: Tuple[int, int]) -> bool:
+        return any(hashes in f for f in self.filters)
+
+
+class ExactFilter:
+
+    def __init__(self, token_uids: Iterable[int]):
+        self.token_uids = tuple(sorted(token_uids))
+
+    def contains(self, token_uid: int) -> bool:
+        idx = bisect_left(self.token_uids, token_uid)
+        return idx < len(self.token_uids) and self.token_uids[idx] == token_uid
+
+
+class BlockIndex:
+
+    def __init__(self, segment_size: int=SEGMENT_SIZE, group_size: int=GROUP_SIZE):
+        self.segment_size = segment_size
+        self.group_size = group_size
+        self.filters = []  # Ordered list of filter for each block (index is blkNum)
+        self.segments = []  # Ordered list of filter for each segment of blocks
+        self.groups = []  # Ordered list of filter for each group of segments
+
+    def __len__(self):
+        return len(self.filters)
+
+    def add(self, blk_num: int, token_uids: Sequence[int]):
+        """ Index the tokens of the next sealed block """
+        assert blk_num == len(self.filters), "Blocks must be indexed in order!"
+        if blk_num % (self.segment_size * self.group_size) == 0:
+            self.groups.append(ScalableBloomFilter())
+        if blk_num % self.segment_size == 0:
+            self.segments.append(ScalableBloomFilter())
+        group, segment = self.groups[-1], self.segments[-1]
+        hashes = [token_hashes(token_uid) for token_uid in token_uids]
+        for h in hashes:
+            group.add(h)
+            segment.add(h)
+        if len(hashes) <= EXACT_MAX:
+            self.filters.append(ExactFilter(token_uids))
+        else:
+            block_filter = BloomFilter.for_capacity(len(hashes))
+            for h in hashes:
+                block_filter.add(h)
+            self.filters.append(block_filter)
+
+    def candidates(self, token_uid: int) -> List[int]:
+        """ Blocks that might have a transaction for the token (in order) """
+        return self.candidates_any([token_uid])
+
+    def candidates_any(self, token_uids: Iterable[int]) -> List[int]:
+        """ Blocks that might have a transaction for any of the tokens (in order) """
+        tokens = [(token_uid, token_hashes(token_uid)) for token_uid in token_uids]
+        blocks = []
+        for group_num, group in enumerate(self.groups):
+            in_group = [t for t in tokens if t[1] in group]
+            if not in_group:
+                continue  # Skip the whole group
+            first = group_num * self.group_size
+            for seg_num in range(first, min(first + self.group_size, len(self.segments))):
+                in_segment = [t for t in in_group if t[1] in self.segments[seg_num]]
+                if not in_segment:
+                    continue  # Skip the whole segment
+                start = seg_num * self.segment_size
+                for blk_num in range(start, min(start + self.segment_size, len(self.filters))):
+                    block_filter = self.filters[blk_num]
+                    if isinstance(block_filter, ExactFilter):
+                        if any(block_filter.contains(uid) for uid, _ in in_segment):
+                            blocks.append(blk_num)
+                    elif any(h in block_filter for _, h in in_segment):
+                        blocks.append(blk_num)
+        return blocks
@@ -0,0 +1,286 @@
+"""
+Instrumentation for Operator and User
+
+`Metrics` keeps counters, gauges and latency histograms, renders them in the
+Prometheus text format, and can serve them over HTTP on a local port. Span hooks
+can be added to trace L1 calls and tree operations.
+
+By default everything uses `NULL_METRICS`, where all of this is a no-op.
+"""
+import math
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Callable, Dict, Sequence
+
+
+# Default latency buckets (in seconds)
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+def _labels_key(labels: Dict[str, str]):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()) -> str:
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                          for k, v in items) + '}'
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}  # Dict mapping label key to value
+
+    def render(self) -> str:
+        lines = [
+            '# HELP {} {}'.format(self.name, self.help),
+            '# TYPE {} {}'.format(self.name, self.kind),
+        ]
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            lines.extend(self._render_value(key, value))
+        return '\n'.join(lines)
+
+    def _render_value(self, key, value):
+        yield '{}{} {}'.format(self.name, _format_labels(key), _format_value(value))
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels_key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels_key(labels)] = value
+
+    def inc(self, amount: float=1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels_key(labels), 0)
+
+
+class _Timer:
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Sequence[float]=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            if key not in self._values.keys():
+                self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # counts, sum, count
+            counts, _, _ = entry = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        """ Context manager that observes how long its body took """
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        return self._values.get(_labels_key(labels), [None, 0.0, 0])[2]
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            yield '{}_bucket{} {}'.format(
+                    self.name,
+                    _format_labels(key, [('le', _format_value(bound))]),
+                    cumulative,
+                )
+        yield '{}_sum{} {}'.format(self.name, _format_labels(key), _format_value(total))
+        yield '{}_count{} {}'.format(self.name, _format_labels(key), count)
+
+
+class _Span:
+
+    def __init__(self, hooks, name, attrs):
+        self._contexts = [hook(name, attrs) for hook in hooks]
+
+    def __enter__(self):
+        for ctx in self._contexts:
+            ctx.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        for ctx in reversed(self._contexts):
+            ctx.__exit__(*exc)
+
+
+class Metrics:
+    """
+    Registry of metrics (and span hooks) shared by everything it is passed to
+    """
+
+    def __init__(self):
+        self._metrics = {}  # Dict mapping name to metric
+        self._span_hooks = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, **kwargs):
+        with self._lock:
+            if name not in self._metrics.keys():
+                self._metrics[name] = cls(name, help, **kwargs)
+            metric = self._metrics[name]
+        assert isinstance(metric, cls), "Metric already registered as a different type!"
+        return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Sequence[float]=LATENCY_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def add_span_hook(self, hook: Callable):
+        """
+        Add a hook for tracing, called as `hook(name, attrs)` at the start of every span
+        It must return a context manager, which wraps the body of the span
+        """
+        self._span_hooks.append(hook)
+
+    def span(self, name: str, **attrs):
+        """ Context manager around an L1 call or tree operation """
+        if not self._span_hooks:
+            return _NULL_CONTEXT
+        return _Span(self._span_hooks, name, attrs)
+
+    def render(self) -> str:
+        """ All metrics in Prometheus text exposition format """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(metric.render() + '\n' for metric in metrics)
+
+    def serve(self, port: int=9100, host: str='127.0.0.1') -> HTTPServer:
+        """ Serve metrics on http://host:port/metrics from a background thread """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass  # Don't log every scrape
+
+        server = HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server
+
+
+class _NullContext:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class _NullMetric:
+    """ Stands in for every type of metric when instrumentation is disabled """
+
+    def inc(self, amount=1, **labels):
+        pass
+
+    def dec(self, amount=1, **labels):
+        pass
+
+    def set(self, value, **labels):
+        pass
+
+    def observe(self, value, **labels):
+        pass
+
+    def time(self, **labels):
+        return _NULL_CONTEXT
+
+
+class NullMetrics:
+    """ Registry that records nothing (the default) """
+
+    def counter(self, name, help):
+        return _NULL_METRIC
+
+    def gauge(self, name, help):
+        return _NULL_METRIC
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return _NULL_METRIC
+
+    def add_span_hook(self, hook):
+        raise ValueError("Instrumentation is disabled, use Metrics() instead!")
+
+    def span(self, name, **attrs):
+        return _NULL_CONTEXT
+
+
+_NULL_CONTEXT = _NullContext()
+_NULL_METRIC = _NullMetric()
+NULL_METRICS = NullMetrics()
@@ -1,40 +1,40 @@
-from typing import Set
+import logging
 
-from trie.smt import SparseMerkleTree
+from typing import Dict, List
 
-from eth_typing import AnyAddress, ChecksumAddress, Hash32
+from eth_typing import AnyAddress, ChecksumAddress
 from eth_account import Account
 from eth_utils import to_bytes
 
 from web3 import Web3
-from web3.middleware.signing import construct_sign_and_send_raw_middleware
 
 from .contracts import rootchain_interface
+from .events import get_dispatcher
+from .index import BlockIndex
+from .metrics import (
+    Metrics,
+    NULL_METRICS,
+)
+from .policy import PublishPolicy
+from .receipts import get_watcher
+from .rpc import get_cache
+from .signing import add_signer
+from .smt import (
+    NodeStore,
+    SealedBlock,
+    TokenToTxnHashIdSMT,
+    TreeCache,
+)
+from .snapshot import (
+    PackedLeaves,
+    SnapshotFile,
+    pack_leaves,
+)
 from .transaction import Transaction
+from .wal import WriteAheadLog
 
 
-def to_bytes32(val: int) -> bytes:
-    assert 0 <= val < 2**256, "Value out of range!"
-    return val.to_bytes(32, byteorder='big')
-
-
-class TokenToTxnHashIdSMT(SparseMerkleTree):
-
-    def __init__(self):
-        # Tokens are 32 bytes big
-        super().__init__(key_size=32)
-
-    def get(self, token_uid: int) -> Hash32:
-        return super().get(to_bytes32(token_uid))
-
-    def branch(self, token_uid: int) -> Set[Hash32]:
-        return super().branch(to_bytes32(token_uid))
-
-    def set(self, token_uid: int, txn: Transaction) -> Set[Hash32]:
-        return super().set(to_bytes32(token_uid), txn.msg_hash)
-
-    def exists(self, token_uid: int) -> bool:
-        return super().exists(to_bytes32(token_uid))
+logger = logging.getLogger(__name__)
 
 
 class Operator:
@@ -42,47 +42,86 @@ class Operator:
     def __init__(self,
                  w3: Web3,
                  rootchain_address: AnyAddress,
-                 private_key: bytes):
+                 private_key: bytes,
+                 metrics: Metrics=None,
+                 policy: PublishPolicy=None,
+                 max_trees: int=None):
         self._w3 = w3
         self._rootchain = self._w3.eth.contract(rootchain_address, **rootchain_interface)
         self._acct = Account.from_key(private_key)
         # Allow web3 to autosign with account
-        middleware = construct_sign_and_send_raw_middleware(private_key)
-        self._w3.middleware_onion.add(middleware)
+        add_signer(self._w3, self._acct)
+        # Values that rarely change (shared with everyone on this connection)
+        self._rpc_cache = get_cache(self._w3)
+        self._receipts = get_watcher(self._w3)
         # Set up dats structures
         self.pending_deposits = {}  # Dict mapping tokenId to deposit txn in Rootchain contract
         self.deposits = {}  # Dict mapping tokenId to last known txn
         self.transactions = [TokenToTxnHashIdSMT()]  # Ordered list of block txn dbs
+        # If set, only keep the leaves of published blocks (and at most this many trees)
+        self._tree_cache = TreeCache(max_trees) if max_trees is not None else None
+        # Otherwise, the trees of published blocks share their nodes
+        self.nodes = NodeStore() if self._tree_cache is None else None
+        self._collected = 0  # Blocks before this had their trees taken out of the store
+        self.index = BlockIndex()  # Which published blocks have which tokens
         self.last_sync_time = self._w3.eth.blockNumber
+        self._snapshot_file = None  # Where incremental snapshots are written to
+        self._wal = None  # Where accepted transactions are logged (if enabled)
+        # When to publish blocks
+        self.policy = policy if policy else PublishPolicy()
+        self._oldest_pending = None  # Rootchain block number when the block got its first token
 
-        # Add listeners (dict of filters: callbacks)
+        # Instrumentation (no-op unless enabled)
+        self.metrics = metrics if metrics else NULL_METRICS
+        self._monitor_time = self.metrics.histogram(
+                'plasma_operator_monitor_seconds', "Time spent handling events per monitor call")
+        self._publish_time = self.metrics.histogram(
+                'plasma_operator_publish_block_seconds', "Time to publish a block")
+        self._add_txn_time = self.metrics.histogram(
+                'plasma_operator_add_transaction_seconds', "Time to accept or reject a transfer")
+        self._branch_time = self.metrics.histogram(
+                'plasma_operator_get_branch_seconds', "Time to produce a merkle branch")
+        self._block_size = self.metrics.histogram(
+                'plasma_operator_block_size', "Number of tokens in each published block",
+                buckets=(0, 1, 10, 100, 1000, 10000, 100000))
+        self._pending_gauge = self.metrics.gauge(
+                'plasma_operator_pending_deposits', "Deposits waiting for the next block")
+        self._tracked_gauge = self.metrics.gauge(
+                'plasma_operator_tracked_tokens', "Tokens tracked on the plasma chain")
+        self._rejected = self.metrics.counter(
+                'plasma_operator_rejected_transactions_total', "Transfers that were rejected")
+
+        # Add listeners (dict of subscriptions: callbacks)
+        self._events = get_dispatcher(self._w3, self._rootchain.address)
         self.listeners = {}
-        # Add listener for deposits
-        self.listeners[
-                self._rootchain.events.DepositAdded.createFilter(
-                    fromBlock=self._w3.eth.blockNumber
-                )
-            ] = self.addDeposit
-        # Add listener for deposit cancellations
-        self.listeners[
-                self._rootchain.events.DepositCancelled.createFilter(
-                    fromBlock=self._w3.eth.blockNumber,
-                )
-            ] = self.remDeposit
+        self._add_listeners(self.last_sync_time)
 
-        # Add listener for challenging withdrawals
-        self.listeners[
-                self._rootchain.events.ExitStarted.createFilter(
-                    fromBlock=self._w3.eth.blockNumber,
-                )
-            ] = self.checkExit
+    @property
+    def callbacks(self):
+        """
+        Callbacks for each rootchain event we listen to
+        (also used to replay history, so both behave the same)
+        """
+        return {
+            # Add listener for deposits
+            'DepositAdded': self.addDeposit,
+            # Add listener for deposit cancellations
+            'DepositCancelled': self.remDeposit,
+            # Add listener for challenging withdrawals
+            'ExitStarted': self.checkExit,
+            # Add listener for finalized withdrawals
+            'ExitFinished': self.remDeposit,
+        }
 
-        # Add listener for finalized withdrawals
-        self.listeners[
-                self._rootchain.events.ExitFinished.createFilter(
-                    fromBlock=self._w3.eth.blockNumber,
-                )
-            ] = self.remDeposit
+    def _add_listeners(self, from_block: int):
+        for event_name, callback_fn in self.callbacks.items():
+            self.listeners[self._events.subscribe(event_name, from_block)] = callback_fn
+
+    def _restart_listeners(self, from_block: int):
+        for subscription in self.listeners.keys():
+            subscription.cancel()
+        self.listeners = {}
+        self._add_listeners(from_block)
 
     @property
     def address(self) -> ChecksumAddress:
@@ -90,28 +129,48 @@ class Operator:
 
     # TODO Make this async loop
     def monitor(self):
-        for log_filter, callback_fn in self.listeners.items():
-            for log in log_filter.get_new_entries():
-                callback_fn(log)
-        if self._w3.eth.blockNumber - self.last_sync_time > 2:
+        with self._monitor_time.time():
+            self._events.poll()  # NOTE One query for all of them
+            for subscription, callback_fn in self.listeners.items():
+                for log in subscription.drain():
+                    callback_fn(log)
+        block_number = self._w3.eth.blockNumber
+        if self.policy.should_publish(
+                block_number,
+                self.last_sync_time,
+                len(self.transactions[-1].leaves) + len(self.pending_deposits),
+                self._oldest_pending if self._oldest_pending is not None else self.last_sync_time,
+                lambda: self._w3.eth.gasPrice,
+            ):
             self.publish_block()
             self.last_sync_time = self._w3.eth.blockNumber
 
+    def _mark_pending(self):
+        if self._oldest_pending is None:
+            self._oldest_pending = self._w3.eth.blockNumber
+
     def addDeposit(self, log):
         if not self.is_tracking(log.args['tokenId']):
             self.pending_deposits[log.args['tokenId']] = Transaction(
-                    self._w3.eth.chainId,
+                    self._rpc_cache.chain_id,
                     self._rootchain.address,
                     **log.args,
                 )
+            self._pending_gauge.set(len(self.pending_deposits))
+            self._mark_pending()
 
     def remDeposit(self, log):
         if log.args['tokenId'] in self.pending_deposits.keys():
             del self.pending_deposits[log.args['tokenId']]
+            self._pending_gauge.set(len(self.pending_deposits))
         if log.args['tokenId'] in self.deposits.keys():
             del self.deposits[log.args['tokenId']]
+            self._tracked_gauge.set(len(self.deposits))
 
     def checkExit(self, log):
+        # Exit may be for a token we never saw (or already removed)
+        if not self.is_tracking(log.args['tokenId']):
+            return
         # TODO Also validate that exit hasn't been challenged yet
         if self.deposits[log.args['tokenId']].newOwner != log.args['owner']:
             pass  # TODO Challenge exit by looking up appropiate challenge txn
@@ -123,40 +182,247 @@ class Operator:
         If valid, tracking in the transaction queue until publishing
         Don't forget to reply to the sender's request
         """
+        with self._add_txn_time.time():
+            if not self._check(transaction):
+                return False
+            # Make sure we don't forget it after acknowledging it
+            if self._wal:
+                with self.metrics.span('wal.log', block=len(self.transactions) - 1):
+                    self._wal.log(len(self.transactions) - 1, transaction)
+            self._accept(transaction)
+            return True
+
+    def addTransactions(self, transactions: List[Transaction]) -> List[bool]:
+        """
+        Same as addTransaction for each transaction in turn (acceptance status of each),
+        except all the accepted ones are made durable together
+        """
+        with self._add_txn_time.time():
+            accepted = []
+            batch = {}  # Dict mapping tokenId to the last transaction of it we accepted
+            new_leaves = 0  # Number of tokens in the batch not in the block yet
+            seq = None
+            for transaction in transactions:
+                if not self._check(transaction, batch, new_leaves):
+                    accepted.append(False)
+                    continue
+                if self._wal:
+                    seq = self._wal.append(len(self.transactions) - 1, transaction)
+                if transaction.tokenId not in batch.keys() and \
+                        transaction.tokenId not in self.transactions[-1].leaves.keys():
+                    new_leaves += 1
+                batch[transaction.tokenId] = transaction
+                accepted.append(True)
+            # Make sure we don't forget them before using them (one sync for all)
+            if seq is not None:
+                with self.metrics.span('wal.log', block=len(self.transactions) - 1):
+                    self._wal.sync(seq)
+            for transaction, ok in zip(transactions, accepted):
+                if ok:
+                    self._accept(transaction)
+            return accepted
+
+    def _check(self,
+               transaction: Transaction,
+               batch: Dict[int, Transaction]=None,
+               new_leaves: int=0) -> bool:
+        """
+        Whether we can accept the transaction
+        NOTE `batch` is what we accepted but didn't apply yet (and `new_leaves` how many more leaves that is)
+        """
+        batch = batch if batch is not None else {}
         # Can't transfer a token we aren't tracking in our db
         if not self.is_tracking(transaction.tokenId):
-            print("Not Tracking!")
+            logger.warning("Not tracking token %d!", transaction.tokenId)
+            self._rejected.inc(reason='not_tracking')
             return False
         # Holder of token didn't sign it
-        if self.deposits[transaction.tokenId].newOwner != transaction.signer:
-            print("Not signed by current holder!")
+        latest = batch.get(transaction.tokenId, self.deposits[transaction.tokenId])
+        if latest.newOwner != transaction.signer:
+            logger.warning("Transfer of token %d not signed by current holder!", transaction.tokenId)
+            self._rejected.inc(reason='wrong_signer')
+            return False
+        # Signed for a block other than the one we are building
+        if transaction.prevBlkNum != len(self.transactions) - 1:
+            logger.warning("Transfer of token %d signed for block %d, not %d!",
+                           transaction.tokenId, transaction.prevBlkNum, len(self.transactions) - 1)
+            self._rejected.inc(reason='stale_block')
+            return False
+        # Too many transfers waiting for the next block already
+        if transaction.tokenId not in self.transactions[-1].leaves.keys() and \
+                transaction.tokenId not in batch.keys() and \
+                not self.policy.accepts(len(self.transactions[-1].leaves) + new_leaves):
+            logger.warning("Too many pending transactions for token %d!", transaction.tokenId)
+            self._rejected.inc(reason='mempool_full')
             return False
+        return True
+
+    def _accept(self, transaction: Transaction):
         # NOTE This allows multiple transactions in a single block
-        self.transactions[-1].set(transaction.tokenId, transaction)
+        with self.metrics.span('tree.set', block=len(self.transactions) - 1):
+            self.transactions[-1].set(transaction.tokenId, transaction)
         # Update last known transaction for deposit
         self.deposits[transaction.tokenId] = transaction
-        return True
+        self._mark_pending()
 
-    def publish_block(self):
+    def _add_pending_deposits(self):
         # Process all the pending deposits we have
         for token_id, txn in self.pending_deposits.items():
             assert not self.is_tracking(token_id)
             self.deposits[token_id] = txn
             self.transactions[-1].set(token_id, txn)
         self.pending_deposits = {}
+        self._pending_gauge.set(0)
+        self._tracked_gauge.set(len(self.deposits))
+
+    def publish_block(self):
+        with self._publish_time.time():
+            with self.metrics.span('tree.deposits', block=len(self.transactions) - 1):
+                self._add_pending_deposits()
+
+            # Submit the roothash for transactions
+            with self.metrics.span('l1.submitBlock', block=len(self.transactions) - 1):
+                txn_hash = self._rootchain.functions.submitBlock(
+                    self.transactions[-1].root_hash
+                ).transact({'from': self.address})
+                self._receipts.wait(txn_hash)  # FIXME Shouldn't have to wait
+            self._block_size.observe(len(self.transactions[-1].leaves))
+            self._seal_block()
+            self._index_block()
 
-        # Submit the roothash for transactions
-        txn_hash = self._rootchain.functions.submitBlock(
-            self.transactions[-1].root_hash
-        ).transact({'from': self.address})
-        self._w3.eth.waitForTransactionReceipt(txn_hash)  # FIXME Shouldn't have to wait
+            # Reset transactions db
+            self.transactions.append(TokenToTxnHashIdSMT())
+            self._oldest_pending = None
 
-        # Reset transactions db
+    def addBlock(self, log) -> bool:
+        """
+        Callback for a block we already published (used when replaying history)
+        Returns whether our block matches the published root
+        """
+        self._add_pending_deposits()
+        block = self.transactions[-1]
+        matches = block.root_hash == log.args['blkRoot']
+        if not matches:
+            # We are missing transactions, so we can't prove anything for this block
+            self.transactions[-1] = SealedBlock(log.args['blkRoot'], block.leaves)
+        else:
+            self._seal_block()
+        self._index_block()
         self.transactions.append(TokenToTxnHashIdSMT())
+        self._oldest_pending = None
+        return matches
+
+    def _seal_block(self):
+        # Keep the leaves of the block we just published, and either put its tree
+        # in the node store or drop it (if only keeping leaves)
+        block = self.transactions[-1]
+        sealed = SealedBlock(
+                block.root_hash,
+                PackedLeaves(memoryview(pack_leaves(block.leaves))),
+                cache=self._tree_cache,
+                store=self.nodes,
+            )
+        if self.nodes is not None:
+            sealed.retain(block.db)
+        self.transactions[-1] = sealed
+
+    def collect(self, horizon: int) -> int:
+        """
+        Take the trees of blocks more than `horizon` blocks old out of the node store
+        (their branches are computed from their leaves after that)
+        Returns the number of nodes freed
+        NOTE The first branch of a collected block is slow, it hashes all of the block's
+             leaves again (one branch rebuild per leaf, same as rebuilding the tree); after
+             that the block keeps ~2 hashes per leaf (see `PathCache`) and a branch is only
+             a search of its keys
+        """
+        if self.nodes is None:
+            return 0
+        num_nodes = len(self.nodes)
+        end = max(self._collected, len(self.transactions) - 1 - horizon)
+        for block in self.transactions[self._collected:end]:
+            if block.store is not None:
+                block.release()
+        self._collected = end
+        return num_nodes - len(self.nodes)
+
+    def _index_block(self):
+        blk_num = len(self.transactions) - 1
+        self.index.add(blk_num, list(self.transactions[blk_num].leaves.keys()))
+
+    def blocks_touching(self, token_uid: int) -> List[int]:
+        """ Published blocks with a transaction for the token (in order) """
+        return [blk_num for blk_num in self.index.candidates(token_uid)
+                if self.transactions[blk_num].exists(token_uid)]
 
     def is_tracking(self, token_uid):
         # Respond to user's request of whether we are tracking this token yet
         return token_uid in self.deposits.keys()
 
     def get_branch(self, token_uid, block_num):
-        return self.transactions[block_num].branch(token_uid)
+        with self._branch_time.time():
+            with self.metrics.span('tree.branch', block=block_num):
+                return self.transactions[block_num].branch(token_uid)
+
+    def snapshot(self, path: str, incremental: bool=False):
+        """
+        Write our state to a snapshot file at `path`
+        If incremental, only append what changed since the last snapshot of that file
+        """
+        if incremental:
+            assert self._snapshot_file and self._snapshot_file.path == path, \
+                    "Incremental snapshot must follow a snapshot to the same file!"
+        else:
+            self._snapshot_file = SnapshotFile(path)
+        self._snapshot_file.write(self, incremental=incremental)
+        # Everything logged so far is in the snapshot now
+        if self._wal:
+            self._wal.truncate()
+
+    def restore(self, path: str):
+        """
+        Load our state from the snapshot file at `path`
+        Listeners are restarted from the last sync, so nothing is missed since then
+        """
+        self._snapshot_file = SnapshotFile(path)
+        self._snapshot_file.read(self)
+        # NOTE Trees are put in the store when first needed
+        self.nodes = NodeStore() if self._tree_cache is None else None
+        self._collected = 0
+        for block in self.transactions[:-1]:
+            block.cache = self._tree_cache
+            block.store = self.nodes
+        self.index = BlockIndex()
+        for blk_num, block in enumerate(self.transactions[:-1]):
+            self.index.add(blk_num, list(block.leaves.keys()))
+        self._pending_gauge.set(len(self.pending_deposits))
+        self._tracked_gauge.set(len(self.deposits))
+        self._restart_listeners(self.last_sync_time)
+
+    def open_wal(self, path: str, commit_delay: float=0.0) -> int:
+        """
+        Log every transaction we accept to the write-ahead log at `path` from now on
+        Any transactions already logged for the block we are building are added back
+        (restore the last snapshot first), and the number added back is returned
+        NOTE Blocks published since the snapshot can be recovered with
+             `replay(operator, archive=operator.wal.archive())`
+        """
+        self._wal = WriteAheadLog(
+                path,
+                self._rpc_cache.chain_id,
+                self._rootchain.address,
+                commit_delay=commit_delay,
+            )
+        num_added = 0
+        for blk_num, transaction in self._wal.records():
+            if blk_num != len(self.transactions) - 1:
+                continue  # Not for the block we are building
+            self.transactions[-1].set(transaction.tokenId, transaction)
+            self.deposits[transaction.tokenId] = transaction
+            self._mark_pending()
+            num_added += 1
+        return num_added
+
+    @property
+    def wal(self) -> WriteAheadLog:
+        return self._wal
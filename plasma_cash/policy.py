@@ -0,0 +1,48 @@
+from typing import Callable
+
+
+class PublishPolicy:
+    """
+    Decides when the operator seals the current block and publishes it
+    NOTE The defaults publish every 3 rootchain blocks (even if empty), like before
+    """
+
+    def __init__(self,
+                 interval: int=2,
+                 max_pending: int=None,
+                 max_age: int=None,
+                 cheap_gas_price: int=None,
+                 skip_empty: bool=False,
+                 max_mempool: int=None):
+        self.interval = interval  # Publish after more than this many blocks since the last one
+        self.max_pending = max_pending  # Publish once this many tokens are waiting
+        self.max_age = max_age  # Publish once the oldest waiting tokens are this many blocks old
+        self.cheap_gas_price = cheap_gas_price  # Publish whatever is waiting if gas is this cheap
+        self.skip_empty = skip_empty  # Don't publish blocks with nothing in them
+        self.max_mempool = max_mempool  # Reject transfers once this many are waiting
+
+    def should_publish(self,
+                       block_number: int,
+                       last_publish: int,
+                       num_pending: int,
+                       oldest_pending: int,
+                       gas_price: Callable[[], int]) -> bool:
+        """
+        Whether to publish now, given the number of tokens in (or about to be in) the block
+        and the rootchain block number when the oldest of them arrived
+        NOTE gas_price is only called if that trigger is enabled
+        """
+        if num_pending > 0:
+            if self.max_pending is not None and num_pending >= self.max_pending:
+                return True
+            if self.max_age is not None and block_number - oldest_pending >= self.max_age:
+                return True
+            if self.cheap_gas_price is not None and gas_price() <= self.cheap_gas_price:
+                return True
+        elif self.skip_empty:
+            return False
+        return self.interval is not None and block_number - last_publish > self.interval
+
+    def accepts(self, num_pending: int) -> bool:
+        """ Whether there is room for another transfer in the block """
+        return self.max_mempool is None or num_pending < self.max_mempool
@@ -0,0 +1,124 @@
+"""
+Merkle branches kept in one contiguous buffer
+
+A branch is 256 hashes of 32 bytes each (root->leaf order). Instead of a
+tuple of 256 separate `bytes`, a `Proof` keeps them in a single 8 KB buffer
+that the tree walk writes straight into. A `bytes32[256]` argument is static,
+so its ABI encoding is the buffer itself, and `encode_call` copies it into
+the calldata in one go (skipping web3's per-element validation and encoding).
+"""
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Tuple
+
+from eth_abi.grammar import parse
+from eth_typing import Hash32
+from eth_utils import (
+    encode_hex,
+    function_abi_to_4byte_selector,
+    keccak,
+)
+from eth_utils.abi import collapse_if_tuple
+from hexbytes import HexBytes
+
+from web3.contract import ContractFunction
+
+
+TREE_DEPTH = 256
+HASH_SIZE = 32
+PROOF_SIZE = TREE_DEPTH * HASH_SIZE
+PROOF_TYPE = 'bytes32[{}]'.format(TREE_DEPTH)
+
+
+class Proof(Sequence):
+    """
+    Sequence of the 256 sibling hashes of a Merkle branch (root->leaf order)
+    NOTE Indexing gives `bytes`, so a proof works anywhere a tuple of hashes did
+         (web3, `trie.smt.calc_root`), use `view` to get at a hash without a copy
+    """
+    __slots__ = ('buffer',)
+
+    def __init__(self, buffer: bytearray=None):
+        if buffer is None:
+            buffer = bytearray(PROOF_SIZE)
+        assert len(buffer) == PROOF_SIZE, "Proof must be 256 hashes!"
+        self.buffer = buffer
+
+    @classmethod
+    def from_hashes(cls, hashes: Iterable[Hash32]) -> 'Proof':
+        return cls(bytearray(b''.join(hashes)))
+
+    def __len__(self):
+        return TREE_DEPTH
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return tuple(self[i] for i in range(*idx.indices(TREE_DEPTH)))
+        if idx < 0:
+            idx += TREE_DEPTH
+        if not 0 <= idx < TREE_DEPTH:
+            raise IndexError("Proof index out of range")
+        return bytes(self.view(idx))
+
+    def __eq__(self, other):
+        if isinstance(other, Proof):
+            return self.buffer == other.buffer
+        if isinstance(other, (tuple, list)):
+            return len(other) == TREE_DEPTH and b''.join(other) == self.buffer
+        return NotImplemented
+
+    __hash__ = None  # Mutable
+
+    def __bytes__(self):
+        return bytes(self.buffer)
+
+    def view(self, idx: int) -> memoryview:
+        """ Hash at `idx`, without copying it """
+        return memoryview(self.buffer)[idx * HASH_SIZE:(idx + 1) * HASH_SIZE]
+
+    def set(self, idx: int, node: bytes):
+        self.buffer[idx * HASH_SIZE:(idx + 1) * HASH_SIZE] = node
+
+    def calc_root(self, key: bytes, value: bytes) -> Hash32:
+        """ Same as `trie.smt.calc_root`, read straight off the buffer """
+        path = int.from_bytes(key, 'big')
+        node_hash = keccak(value)
+        branch = bytes(self.buffer)
+        # NOTE Traverse the path in leaf->root order
+        for start in range(PROOF_SIZE - HASH_SIZE, -1, -HASH_SIZE):
+            if path & 1:
+                node_hash = keccak(branch[start:start + HASH_SIZE] + node_hash)
+            else:
+                node_hash = keccak(node_hash + branch[start:start + HASH_SIZE])
+            path >>= 1
+        return node_hash
+
+
+def _function_abi(function: ContractFunction) -> Dict[str, Any]:
+    # NOTE Vyper has no overloading, so the name is enough
+    return next(abi for abi in function.contract_abi
+                if abi['type'] == 'function' and abi['name'] == function.function_identifier)
+
+
+def encode_call(function: ContractFunction, *args) -> bytes:
+    """
+    Calldata of a call to a contract function, copying each Proof in whole
+    NOTE Only static arguments are supported (which covers every RootChain function with a proof)
+    """
+    abi = _function_abi(function)
+    assert len(args) == len(abi['inputs']), "Wrong number of arguments!"
+    data = bytearray(function_abi_to_4byte_selector(abi))
+    for arg_abi, arg in zip(abi['inputs'], args):
+        arg_type = collapse_if_tuple(arg_abi)
+        if isinstance(arg, Proof):
+            assert arg_type == PROOF_TYPE, "Proof passed for {}!".format(arg_type)
+            data += arg.buffer
+        else:
+            assert not parse(arg_type).is_dynamic, "Dynamic arguments are not supported!"
+            data += function.web3.codec.encode_abi([arg_type], [arg])
+    return bytes(data)
+
+
+def transact(function: ContractFunction, args: Tuple, transaction: Dict[str, Any]) -> HexBytes:
+    """ `function(*args).transact(transaction)`, using `encode_call` for the calldata """
+    transaction = dict(transaction, to=function.address, data=encode_hex(encode_call(function, *args)))
+    return function.web3.eth.sendTransaction(transaction)
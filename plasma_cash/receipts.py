@@ -0,0 +1,160 @@
+"""
+Receipts of the transactions we sent, watched for all at once
+
+Instead of everyone polling for the receipt of their own transaction, one
+watcher per connection keeps every outstanding transaction hash. Each time it
+sees a new L1 block it fetches the receipts of all of them in one batch (and
+only the newly watched ones in between), so the RPC load grows with the number
+of blocks, not with the number of transactions waiting on them.
+
+While anyone is waiting on a receipt, a single thread follows the chain and
+does the polling, and everyone waiting just blocks on their future. With
+nobody waiting, polling is left to `poll` (e.g. from a monitor loop).
+"""
+import logging
+import threading
+import time
+import weakref
+
+from concurrent.futures import Future, TimeoutError
+from typing import Any, Callable, Dict
+
+from eth_typing import Hash32
+from hexbytes import HexBytes
+
+from web3 import Web3
+from web3.exceptions import TimeExhausted
+
+from .rpc import RequestBatch
+
+
+POLL_INTERVAL = 0.1  # Seconds between polls while waiting on a receipt
+RECEIPT_TIMEOUT = 120  # Seconds to wait on a receipt (same as web3)
+
+_watchers = weakref.WeakKeyDictionary()  # Web3 -> ReceiptWatcher
+_watchers_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+class ReceiptWatcher:
+    """
+    Resolves a future for each watched transaction once its receipt is mined
+    NOTE Share one per connection (see get_watcher), one thread polls for all the waiters
+    """
+
+    def __init__(self, w3: Web3, poll_interval: float=POLL_INTERVAL):
+        self._w3 = w3
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()  # Guards the outstanding hashes
+        self._poll_lock = threading.Lock()  # Only one of us polls at a time
+        self._pending = {}  # Dict mapping txn hash to future of its receipt
+        self._fresh = set()  # Hashes watched since the last poll
+        self._last_block = None  # Latest L1 block we fetched every receipt at
+        self._waiters = 0  # Number of threads blocked in `wait`
+        self._poller = None  # Thread polling for them (while there are any)
+        self.fetches = 0  # Number of receipts fetched (for instrumentation)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def watch(self, txn_hash: Hash32, callback: Callable[[Any], None]=None) -> Future:
+        """ Future of the receipt of a transaction (calling `callback` with it once mined) """
+        txn_hash = HexBytes(txn_hash)
+        with self._lock:
+            future = self._pending.get(txn_hash)
+            if future is None:
+                future = self._pending[txn_hash] = Future()
+                self._fresh.add(txn_hash)
+        if callback:
+            future.add_done_callback(lambda f: callback(f.result()))
+        return future
+
+    def poll(self):
+        """ Fetch the receipts of outstanding transactions, if there is anything new to fetch """
+        if not self._poll_lock.acquire(blocking=False):
+            return  # Someone else is fetching them right now
+        try:
+            block_number = self._w3.eth.blockNumber
+            with self._lock:
+                if block_number != self._last_block:
+                    to_fetch = list(self._pending.keys())
+                else:
+                    to_fetch = list(self._fresh)  # Might have been mined as soon as they were sent
+
+            if to_fetch:
+                batch = RequestBatch(self._w3)
+                results = [(txn_hash, batch.transaction_receipt(txn_hash)) for txn_hash in to_fetch]
+                batch.send()
+                self.fetches += len(results)
+                receipts = [(txn_hash, result.value) for txn_hash, result in results]
+            else:
+                receipts = []
+
+            # NOTE Only once we have them, so a failed fetch is retried on the next poll
+            with self._lock:
+                self._fresh.difference_update(to_fetch)
+                self._last_block = block_number
+                futures = []
+                for txn_hash, receipt in receipts:
+                    # NOTE Some clients give receipts for pending transactions
+                    if receipt is None or receipt['blockNumber'] is None:
+                        continue  # Not mined yet
+                    future = self._pending.pop(txn_hash, None)
+                    if future is not None:  # NOTE Unless we were reset in the meantime
+                        futures.append((future, receipt))
+            for future, receipt in futures:
+                future.set_result(receipt)
+        finally:
+            self._poll_lock.release()
+
+    def reset(self):
+        """ Stop watching everything (e.g. after the chain was reverted) """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._fresh.clear()
+            self._last_block = None
+        for future in pending.values():
+            future.cancel()
+
+    def _follow(self):
+        """ Poll every interval, for as long as anyone is waiting """
+        while True:
+            with self._lock:
+                if self._waiters == 0:
+                    self._poller = None
+                    return
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Failed to fetch receipts, retrying")
+            time.sleep(self.poll_interval)
+
+    def wait(self, txn_hash: Hash32, timeout: float=RECEIPT_TIMEOUT):
+        """ Receipt of a transaction, once mined (drop-in for `waitForTransactionReceipt`) """
+        future = self.watch(txn_hash)
+        with self._lock:
+            self._waiters += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._follow, daemon=True)
+                self._poller.start()
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise TimeExhausted(
+                "Transaction {} is not in the chain, after {} seconds".format(
+                    HexBytes(txn_hash).hex(),
+                    timeout,
+                )
+            )
+        finally:
+            with self._lock:
+                self._waiters -= 1
+
+
+def get_watcher(w3: Web3) -> ReceiptWatcher:
+    """ Watcher shared by everyone in the process on this connection """
+    with _watchers_lock:
+        if w3 not in _watchers.keys():
+            _watchers[w3] = ReceiptWatcher(w3)
+        return _watchers[w3]
@@ -0,0 +1,113 @@
+"""
+Rebuild Operator state from rootchain events
+
+Logs are fetched for disjoint block ranges in parallel, merged back in order,
+and handed to the same Operator callbacks used when listening live.
+"""
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Mapping
+
+from eth_utils import event_abi_to_log_topic
+
+from .operator import Operator
+from .transaction import Transaction
+
+
+class ReplayStats:
+
+    def __init__(self):
+        self.logs = 0  # Number of events replayed
+        self.blocks = 0  # Number of plasma blocks replayed
+        self.verified = []  # Blocks that match their published root
+        self.unverified = []  # Blocks missing transactions, and no archive to supply them
+        self.mismatched = []  # Blocks that don't match even with the archive
+        self.total_time = 0.0  # Seconds spent overall
+
+    @property
+    def logs_per_second(self) -> float:
+        return self.logs / self.total_time if self.total_time else 0.0
+
+    @property
+    def blocks_per_second(self) -> float:
+        return self.blocks / self.total_time if self.total_time else 0.0
+
+    def __repr__(self):
+        return "ReplayStats(logs={}, blocks={}, verified={}, unverified={}, mismatched={}, " \
+               "{:.1f} logs/s, {:.1f} blocks/s)".format(
+                    self.logs,
+                    self.blocks,
+                    len(self.verified),
+                    len(self.unverified),
+                    len(self.mismatched),
+                    self.logs_per_second,
+                    self.blocks_per_second,
+                )
+
+
+def replay(operator: Operator,
+           from_block: int=0,
+           to_block: int=None,
+           archive: Mapping[int, Iterable[Transaction]]=None,
+           chunk_size: int=1000,
+           workers: int=4) -> ReplayStats:
+    """
+    Replay rootchain events from `from_block` to `to_block` (inclusive) into `operator`
+    `archive` maps plasma block numbers to the transactions included in that block,
+    which are added before the block is sealed so its root can be checked
+    """
+    stats = ReplayStats()
+    start = time.perf_counter()
+
+    w3 = operator._w3
+    rootchain = operator._rootchain
+    if to_block is None:
+        to_block = w3.eth.blockNumber
+
+    callbacks = dict(operator.callbacks)
+    callbacks['BlockPublished'] = operator.addBlock
+    events = {}  # Dict mapping log topic to event
+    for abi in rootchain.abi:
+        if abi['type'] == 'event' and abi['name'] in callbacks.keys():
+            events[event_abi_to_log_topic(abi)] = getattr(rootchain.events, abi['name'])()
+    topics = ['0x' + topic.hex() for topic in events.keys()]
+
+    def fetch(block_range):
+        return w3.eth.getLogs({
+            'address': rootchain.address,
+            'fromBlock': block_range[0],
+            'toBlock': block_range[1],
+            'topics': [topics],  # Any of our events
+        })
+
+    ranges = [(b, min(b + chunk_size - 1, to_block))
+              for b in range(from_block, to_block + 1, chunk_size)]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # NOTE map() yields results in the order of the ranges
+        for logs in executor.map(fetch, ranges):
+            for log in sorted(logs, key=lambda l: (l['blockNumber'], l['logIndex'])):
+                event = events[bytes(log['topics'][0])]
+                log = event.processLog(log)
+                if log.event == 'BlockPublished':
+                    blk_num = len(operator.transactions) - 1
+                    txns = archive.get(blk_num, []) if archive else []
+                    for txn in txns:
+                        operator.addTransaction(txn)
+                    if operator.addBlock(log):
+                        stats.verified.append(blk_num)
+                    elif txns:
+                        stats.mismatched.append(blk_num)
+                    else:
+                        stats.unverified.append(blk_num)
+                    stats.blocks += 1
+                else:
+                    callbacks[log.event](log)
+                stats.logs += 1
+
+    # Pick up live from where we left off
+    operator.last_sync_time = to_block
+    operator._restart_listeners(to_block + 1)
+
+    stats.total_time = time.perf_counter() - start
+    return stats
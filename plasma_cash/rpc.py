@@ -0,0 +1,159 @@
+import json
+import time
+import weakref
+
+from typing import Any, Callable
+
+from eth_typing import AnyAddress, Hash32
+from eth_utils import to_bytes, to_int
+from hexbytes import HexBytes
+
+from web3 import HTTPProvider, Web3
+from web3._utils.request import make_post_request
+from web3.contract import ContractFunction
+from web3.datastructures import AttributeDict
+from web3.exceptions import TransactionNotFound
+from web3.middleware.pythonic import receipt_formatter
+
+
+CACHE_TTL = 60  # Seconds to keep values that rarely change
+
+_caches = weakref.WeakKeyDictionary()  # Web3 -> RpcCache
+
+
+class RpcCache:
+    """
+    Short-lived cache of values that rarely change (shared by everything using a connection)
+    """
+
+    def __init__(self, w3: Web3, ttl: float=CACHE_TTL):
+        self._w3 = w3
+        self.ttl = ttl
+        self._values = {}  # Dict mapping key to (expiry, value)
+
+    def get(self, key: str, fetch: Callable[[], Any]) -> Any:
+        expiry, value = self._values.get(key, (0, None))
+        if expiry <= time.monotonic():
+            value = fetch()
+            self._values[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    @property
+    def chain_id(self) -> int:
+        return self.get('chainId', lambda: self._w3.eth.chainId)
+
+
+def get_cache(w3: Web3) -> RpcCache:
+    """ Cache shared by every User and Operator on this connection """
+    if w3 not in _caches.keys():
+        _caches[w3] = RpcCache(w3)
+    return _caches[w3]
+
+
+class BatchResult:
+    """ Result of a request in a batch (available once the batch is sent) """
+
+    def __init__(self, method: str, params: list, formatter: Callable, fallback: Callable):
+        self.method = method
+        self.params = params
+        self._formatter = formatter  # Formats the raw JSON-RPC result
+        self._fallback = fallback  # Makes the request with web3 instead
+        self._value = None
+        self._done = False
+
+    @property
+    def value(self) -> Any:
+        assert self._done, "Batch not sent yet!"
+        return self._value
+
+    def set_raw(self, result):
+        self._value = self._formatter(result)
+        self._done = True
+
+    def fetch(self):
+        self._value = self._fallback()
+        self._done = True
+
+
+class RequestBatch:
+    """
+    Independent reads that are sent together as one JSON-RPC batch
+    NOTE Batches are only supported over HTTP, other providers make each request in turn
+    """
+
+    def __init__(self, w3: Web3):
+        self._w3 = w3
+        self._requests = []
+
+    def call(self, function: ContractFunction) -> BatchResult:
+        """ Call a (constant) contract function """
+        def decode(result):
+            output_types = [output['type'] for output in function.abi['outputs']]
+            values = self._w3.codec.decode_abi(output_types, to_bytes(hexstr=result))
+            return values[0] if len(values) == 1 else values
+
+        return self._add(
+            'eth_call',
+            [{'to': function.address, 'data': function._encode_transaction_data()}, 'latest'],
+            decode,
+            function.call,
+        )
+
+    def transaction_count(self, address: AnyAddress, block_identifier: str='latest') -> BatchResult:
+        return self._add(
+            'eth_getTransactionCount',
+            [address, block_identifier],
+            lambda result: to_int(hexstr=result),
+            lambda: self._w3.eth.getTransactionCount(address, block_identifier),
+        )
+
+    def block_number(self) -> BatchResult:
+        return self._add(
+            'eth_blockNumber',
+            [],
+            lambda result: to_int(hexstr=result),
+            lambda: self._w3.eth.blockNumber,
+        )
+
+    def transaction_receipt(self, txn_hash: Hash32) -> BatchResult:
+        """ Receipt of a transaction (None if not mined yet) """
+        def fetch():
+            try:
+                return self._w3.eth.getTransactionReceipt(txn_hash)
+            except TransactionNotFound:
+                return None
+
+        return self._add(
+            'eth_getTransactionReceipt',
+            [HexBytes(txn_hash).hex()],
+            lambda result: None if result is None else AttributeDict.recursive(receipt_formatter(result)),
+            fetch,
+        )
+
+    def _add(self, method, params, formatter, fallback) -> BatchResult:
+        request = BatchResult(method, params, formatter, fallback)
+        self._requests.append(request)
+        return request
+
+    def send(self):
+        requests, self._requests = self._requests, []
+        provider = self._w3.provider
+        if not isinstance(provider, HTTPProvider) or len(requests) < 2:
+            for request in requests:
+                request.fetch()
+            return
+
+        payload = [
+            {'jsonrpc': '2.0', 'method': r.method, 'params': r.params, 'id': i}
+            for i, r in enumerate(requests)
+        ]
+        raw_response = make_post_request(
+                provider.endpoint_uri,
+                json.dumps(payload).encode('utf-8'),
+                **provider.get_request_kwargs()
+            )
+        # NOTE Responses can come back in any order
+        for response in json.loads(raw_response):
+            if 'error' in response.keys():
+                raise ValueError(response['error'])
+            requests[response['id']].set_raw(response['result'])
@@ -0,0 +1,107 @@
+"""
+Snapshots of a whole test chain, to set up expensive scenarios only once
+(requires the eth-tester backend)
+
+A `ChainSnapshot` takes an eth-tester snapshot of the chain together with an
+in-memory copy of the state of the operator and users on it. Reverting to it
+puts all of them back the way they were, so a scenario (N deposited tokens,
+M published blocks, ...) can be built once and then run from repeatedly.
+
+Rootchain events that were already emitted but not handled yet when the
+snapshot was taken are handed out again after reverting, and the ones from
+blocks that were reverted away are dropped.
+"""
+import copy
+
+from typing import Iterable
+
+from web3 import Web3
+
+from .operator import Operator
+from .receipts import get_watcher
+from .user import User
+
+
+# In-memory state of each, that changes as the chain does
+OPERATOR_STATE = (
+    'pending_deposits',
+    'deposits',
+    'transactions',
+    'nodes',
+    '_collected',
+    '_tree_cache',
+    'index',
+    'last_sync_time',
+    '_oldest_pending',
+)
+USER_STATE = (
+    'purse',
+    'tokens_in_deposit',
+    '_approved',
+    'tokens_in_withdrawal',
+    'challenges',
+    '_responses',
+    'exit_scheduler',
+    '_challenge_period',
+)
+VERIFIER_STATE = ('roots', '_verified')
+TRACKER_STATE = ('roots', '_last_log')
+
+
+def _save(obj, attrs) -> dict:
+    return {attr: getattr(obj, attr) for attr in attrs}
+
+
+def _load(obj, state: dict):
+    for attr, value in state.items():
+        setattr(obj, attr, value)
+
+
+class ChainSnapshot:
+    """
+    Chain state (an eth-tester snapshot), with the state of the operator and users on it
+    NOTE Files (snapshots, write-ahead logs, exit schedules) aren't reverted
+    """
+
+    def __init__(self, w3: Web3, operator: Operator, users: Iterable[User]):
+        self._w3 = w3
+        self.operator = operator
+        self.users = list(users)
+        for user in self.users:
+            assert not user.pending_deposit_txns, "Wait for the deposits to be mined first!"
+
+        # NOTE Trackers have nothing to trigger, so just catch them up
+        self._trackers = list({id(u.chain_height): u.chain_height for u in self.users}.values())
+        for tracker in self._trackers:
+            tracker.update()
+        # Events dispatched so far, and the ones nobody handled yet
+        self._dispatchers = list({id(d): d for d in [operator._events] + [u._events for u in self.users]}.values())
+        self._events = [d.save() for d in self._dispatchers]
+
+        self.block_number = w3.eth.blockNumber
+        self._snapshot_id = w3.provider.ethereum_tester.take_snapshot()
+        # NOTE One copy of everything, so anything they share stays shared
+        self._state = copy.deepcopy({
+            'operator': _save(operator, OPERATOR_STATE),
+            'users': [_save(u, USER_STATE) for u in self.users],
+            'verifiers': [_save(u.verifier, VERIFIER_STATE) for u in self.users],
+            'trackers': [_save(t, TRACKER_STATE) for t in self._trackers],
+        })
+
+    def revert(self):
+        """ Put the chain, the operator and the users back the way they were (can be done again) """
+        self._w3.provider.ethereum_tester.revert_to_snapshot(self._snapshot_id)
+        # NOTE Copy again, so we can revert to this more than once
+        state = copy.deepcopy(self._state)
+        _load(self.operator, state['operator'])
+        for user, user_state, verifier_state in zip(self.users, state['users'], state['verifiers']):
+            _load(user, user_state)
+            _load(user.verifier, verifier_state)
+            user.pending_deposit_txns = {}
+        for tracker, tracker_state in zip(self._trackers, state['trackers']):
+            with tracker._lock:
+                _load(tracker, tracker_state)
+        for dispatcher, events in zip(self._dispatchers, self._events):
+            dispatcher.restore(events)
+        # Receipts of transactions that were reverted away will never come
+        get_watcher(self._w3).reset()
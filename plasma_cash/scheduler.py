@@ -0,0 +1,122 @@
+import heapq
+import json
+import os
+
+from contextlib import contextmanager
+from typing import List
+
+
+class ExitScheduler:
+    """
+    Priority queue of exit deadlines (when the challenge period is over), and
+    the open challenges to those exits, optionally persisted to a JSON file so
+    exits are still defended and finalized after a restart
+    NOTE Entries of cancelled exits are left in the heap, and skipped once they reach the top
+    """
+
+    def __init__(self, path: str=None):
+        self.path = path
+        self._deadlines = {}  # Dict mapping tokenId to the deadline of its exit
+        self._queue = []  # Heap of (deadline, tokenId) not ripe yet
+        self._ripe = {}  # Dict mapping tokenId to deadline of ripe exits (in deadline order)
+        self.challenges = {}  # Dict mapping tokenId to set of challenged blkNums
+        self._batching = False  # Save once at the end of a batch (see `batch`)
+        self._dirty = False
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            self._deadlines = {int(token_uid): deadline
+                               for token_uid, deadline in state['exits'].items()}
+            self._queue = [(deadline, token_uid) for token_uid, deadline in self._deadlines.items()]
+            heapq.heapify(self._queue)
+            self.challenges = {int(token_uid): set(blk_nums)
+                               for token_uid, blk_nums in state['challenges'].items()}
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def __contains__(self, token_uid: int) -> bool:
+        return token_uid in self._deadlines.keys()
+
+    @property
+    def scheduled(self) -> List[int]:
+        """ Every token with an exit in the queue """
+        return list(self._deadlines.keys())
+
+    def _is_current(self, entry) -> bool:
+        deadline, token_uid = entry
+        return self._deadlines.get(token_uid) == deadline and token_uid not in self._ripe.keys()
+
+    @property
+    def next_deadline(self) -> int:
+        """ Earliest deadline in the queue (None if empty) """
+        if self._ripe:
+            return next(iter(self._ripe.values()))
+        while self._queue and not self._is_current(self._queue[0]):
+            heapq.heappop(self._queue)  # Cancelled (or rescheduled)
+        return self._queue[0][0] if self._queue else None
+
+    def schedule(self, token_uid: int, deadline: int):
+        self._deadlines[token_uid] = deadline
+        self._ripe.pop(token_uid, None)
+        heapq.heappush(self._queue, (deadline, token_uid))
+        self.save()
+
+    def cancel(self, token_uid: int):
+        """ Remove the exit of a token (and its challenges), once it is finalized or cancelled """
+        if token_uid not in self._deadlines.keys() and token_uid not in self.challenges.keys():
+            return  # Wasn't scheduled
+        # NOTE Its heap entry (if still there) is skipped later
+        self._deadlines.pop(token_uid, None)
+        self._ripe.pop(token_uid, None)
+        self.challenges.pop(token_uid, None)
+        self.save()
+
+    def ripe(self, now: int) -> List[int]:
+        """
+        Every token whose deadline has passed, in deadline order
+        NOTE They stay scheduled until cancelled, so a failed finalization is retried
+        """
+        while self._queue and self._queue[0][0] <= now:
+            entry = heapq.heappop(self._queue)
+            if self._is_current(entry):
+                deadline, token_uid = entry
+                self._ripe[token_uid] = deadline
+        return list(self._ripe.keys())
+
+    def challenge(self, token_uid: int, blk_num: int):
+        self.challenges.setdefault(token_uid, set()).add(blk_num)
+        self.save()
+
+    def unchallenge(self, token_uid: int, blk_num: int):
+        if blk_num in self.challenges.get(token_uid, set()):
+            self.challenges[token_uid].discard(blk_num)
+            self.save()
+
+    @contextmanager
+    def batch(self):
+        """ Save once for every change made in this block, instead of after each one """
+        self._batching = True
+        try:
+            yield
+        finally:
+            self._batching = False
+            if self._dirty:
+                self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        if self._batching:
+            self._dirty = True
+            return
+        # NOTE Write then rename, so a crash never leaves a partial file
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'exits': self._deadlines,
+                'challenges': {token_uid: sorted(blk_nums)
+                               for token_uid, blk_nums in self.challenges.items()},
+            }, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
@@ -0,0 +1,115 @@
+import os
+import threading
+import weakref
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+from eth_account import Account
+from eth_account.messages import SignableMessage
+from eth_account.signers.local import LocalAccount
+
+from web3 import Web3
+from web3.middleware.signing import construct_sign_and_send_raw_middleware
+
+
+SIGNING_MIDDLEWARE = 'plasma_cash_signing'
+
+SIGN_CHUNK = 256  # Messages sent to a worker at a time
+SIGN_WORKERS = min(4, os.cpu_count() or 1)  # Most worker processes one pool starts
+
+_accounts = weakref.WeakKeyDictionary()  # Web3 -> Dict mapping address to account
+
+_pools = {}  # Dict mapping address to SignerPool
+_pools_lock = threading.Lock()
+
+
+def add_signer(w3: Web3, account: LocalAccount):
+    """
+    Allow web3 to autosign with account
+    NOTE Every account on a connection shares one middleware layer, since a layer
+         per account makes each request walk all of them (and overflows the stack)
+    """
+    if w3 not in _accounts.keys():
+        _accounts[w3] = {}
+        w3.middleware_onion.add(construct_sign_and_send_raw_middleware([]), SIGNING_MIDDLEWARE)
+    if account.address in _accounts[w3].keys():
+        return  # Already signing for this account
+    _accounts[w3][account.address] = account
+    w3.middleware_onion.replace(
+            SIGNING_MIDDLEWARE,
+            construct_sign_and_send_raw_middleware(list(_accounts[w3].values())),
+        )
+
+
+_worker_account = None  # Account each signing worker signs with
+
+
+def _load_key(private_key: bytes):
+    global _worker_account
+    _worker_account = Account.from_key(private_key)
+
+
+def _sign_all(messages: Sequence[SignableMessage], account: LocalAccount=None) -> List[Tuple[int, int, int]]:
+    account = account if account else _worker_account
+    signatures = []
+    for msg in messages:
+        signature = account.sign_message(msg)
+        signatures.append((signature.v, signature.r, signature.s))
+    return signatures
+
+
+class SignerPool:
+    """
+    Worker processes that sign messages with one key (loaded once per worker)
+    NOTE Signing is CPU bound, so threads wouldn't help, and a batch that fits in
+         one chunk is signed right here (not worth the round trip to a worker)
+    NOTE Share one per account (see get_signer_pool), workers are only started on
+         the first batch that needs them
+    """
+
+    def __init__(self, private_key: bytes, workers: int=SIGN_WORKERS, chunk_size: int=SIGN_CHUNK):
+        self._account = Account.from_key(private_key)
+        self.chunk_size = chunk_size
+        self._refs = 0  # Number of holders from get_signer_pool (see `release`)
+        self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_load_key,
+                initargs=(private_key,),
+            )
+
+    def sign(self, messages: Sequence[SignableMessage]) -> List[Tuple[int, int, int]]:
+        """ (v, r, s) of each message, in order """
+        if len(messages) <= self.chunk_size:
+            return _sign_all(messages, self._account)
+        chunks = [messages[i:i + self.chunk_size] for i in range(0, len(messages), self.chunk_size)]
+        # NOTE map() yields results in the order of the chunks
+        return [signature for signatures in self._executor.map(_sign_all, chunks)
+                for signature in signatures]
+
+    def release(self):
+        """ Done with a pool from `get_signer_pool` (the last holder stops the workers) """
+        with _pools_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return  # Someone else still signs with it
+            if _pools.get(self._account.address) is self:
+                del _pools[self._account.address]
+        self.close()
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def get_signer_pool(private_key: bytes) -> SignerPool:
+    """
+    Pool shared by everyone in the process signing with this key
+    NOTE `release` it when done with it
+    """
+    address = Account.from_key(private_key).address
+    with _pools_lock:
+        if address not in _pools.keys():
+            _pools[address] = SignerPool(private_key)
+        pool = _pools[address]
+        pool._refs += 1
+        return pool
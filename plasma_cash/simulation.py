@@ -0,0 +1,312 @@
+"""
+Load generation and simulation harness (requires the eth-tester backend)
+
+Mints tokens across many users, deposits them, and then runs a random (but
+seeded) workload of transfers, exits and malicious exits that get challenged.
+The report covers transfer throughput, publish latency, memory per tracked
+token and L1 gas per operation.
+"""
+import random
+import time
+import tracemalloc
+
+from typing import Dict, List
+
+from eth_account import Account
+from eth_typing import AnyAddress
+from eth_utils import function_abi_to_4byte_selector, keccak
+from hexbytes import HexBytes
+
+from web3 import Web3
+
+from .contracts import (
+    rootchain_interface,
+    token_interface,
+)
+from .operator import Operator
+from .proof import transact
+from .token import (
+    Token,
+    TokenStatus,
+)
+from .user import User
+
+
+# Relative weights of each operation in the workload
+DEFAULT_WORKLOAD = {
+    'transfer': 80,
+    'exit': 5,
+    'malicious_exit': 5,
+    'deposit': 10,  # Re-deposit a token that was exited
+}
+
+# Where the operator's own structures are allocated (for memory per token)
+OPERATOR_FILTERS = [
+    tracemalloc.Filter(True, '*/plasma_cash/{}'.format(filename))
+    for filename in ('operator.py', 'smt.py', 'snapshot.py', 'index.py')
+]
+
+# Skip gas estimation for exits and challenges (it re-runs the proof checks many times)
+EXIT_GAS = 2000000
+
+
+def deploy(w3: Web3, token_interface=token_interface, rootchain_interface=rootchain_interface):
+    """
+    Deploy the Token and RootChain contracts from the first account
+    NOTE The RootChain CHAIN_ID must be set for the chain being used (61 for eth-tester)
+    """
+    txn_hash = w3.eth.contract(**token_interface).constructor().transact(
+            {'from': w3.eth.accounts[0]})
+    token_address = w3.eth.waitForTransactionReceipt(txn_hash)['contractAddress']
+    txn_hash = w3.eth.contract(**rootchain_interface).constructor(token_address).transact(
+            {'from': w3.eth.accounts[0]})
+    rootchain_address = w3.eth.waitForTransactionReceipt(txn_hash)['contractAddress']
+    return token_address, rootchain_address
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+class SimulationReport:
+
+    def __init__(self):
+        self.operations = {}  # Dict mapping operation to number performed
+        self.transfer_time = 0.0  # Seconds spent in User.transfer
+        self.publish_latencies = []  # Seconds for each Operator.monitor that published a block
+        self.gas = {}  # Dict mapping L1 function to list of gas used
+        self.memory_per_token = None  # Bytes the operator holds per deposited token (if traced)
+        self.tracked_tokens = 0
+        self.total_time = 0.0
+
+    @property
+    def transfers_per_second(self) -> float:
+        transfers = self.operations.get('transfer', 0)
+        return transfers / self.transfer_time if self.transfer_time else 0.0
+
+    def publish_latency(self, pct: float) -> float:
+        return percentile(self.publish_latencies, pct)
+
+    @property
+    def gas_per_operation(self) -> Dict[str, float]:
+        return {fn: sum(gas) / len(gas) for fn, gas in self.gas.items()}
+
+    def __str__(self):
+        lines = [
+            "operations:        {}".format(self.operations),
+            "transfers/s:       {:.1f}".format(self.transfers_per_second),
+            "publish latency:   p50={:.4f}s p90={:.4f}s p99={:.4f}s".format(
+                self.publish_latency(50),
+                self.publish_latency(90),
+                self.publish_latency(99),
+            ),
+            "tracked tokens:    {}".format(self.tracked_tokens),
+        ]
+        if self.memory_per_token is not None:
+            lines.append("memory per token:  {:.0f} bytes".format(self.memory_per_token))
+        for fn, gas in sorted(self.gas_per_operation.items()):
+            lines.append("gas {:<15}{:.0f}".format(fn + ':', gas))
+        lines.append("total time:        {:.1f}s".format(self.total_time))
+        return '\n'.join(lines)
+
+
+class Simulation:
+    """
+    Drives an Operator and many Users on a chain with the eth-tester backend
+    (the first eth-tester account must have deployed both contracts)
+    """
+
+    def __init__(self,
+                 w3: Web3,
+                 token_address: AnyAddress,
+                 rootchain_address: AnyAddress,
+                 operator_key: bytes,
+                 num_users: int=10,
+                 num_tokens: int=100,
+                 seed: int=0,
+                 challenge_period: int=604800,
+                 trace_memory: bool=False):
+        self._w3 = w3
+        self._tester = w3.provider.ethereum_tester
+        self._token = w3.eth.contract(token_address, **token_interface)
+        self._rootchain = w3.eth.contract(rootchain_address, **rootchain_interface)
+        self.rng = random.Random(seed)
+        self.challenge_period = challenge_period
+        self.trace_memory = trace_memory
+        self.report = SimulationReport()
+
+        self.operator = Operator(w3, rootchain_address, operator_key)
+
+        # Users get deterministic keys, and some ether to pay for gas
+        self.users = []
+        for i in range(num_users):
+            key = keccak(b'plasma-cash-simulation' + seed.to_bytes(8, 'big') + i.to_bytes(8, 'big'))
+            address = Account.from_key(key).address
+            self._w3.eth.sendTransaction({
+                'from': w3.eth.accounts[0],
+                'to': address,
+                'value': 10**18,
+            })
+            self.users.append(User(w3, token_address, rootchain_address, self.operator, key))
+        self.owners = {}  # Dict mapping tokenId to the User who has it
+        self.tokens = {}  # Dict mapping tokenId to Token
+        self.exits = []  # Exits waiting for the challenge period to finish
+
+        # Spread the tokens around
+        for uid in range(num_tokens):
+            user = self.users[uid % num_users]
+            self._token.functions.mint(user.address, uid).transact({'from': w3.eth.accounts[0]})
+            self.tokens[uid] = Token(uid)
+            user.purse.append(self.tokens[uid])
+            self.owners[uid] = user
+
+        self._start_block = self._w3.eth.blockNumber + 1
+
+    def _count(self, operation: str):
+        self.report.operations[operation] = self.report.operations.get(operation, 0) + 1
+
+    def tick(self):
+        """ Mine a block and let everyone handle events """
+        self._tester.mine_blocks(1)
+        num_blocks = len(self.operator.transactions)
+        start = time.perf_counter()
+        self.operator.monitor()
+        if len(self.operator.transactions) > num_blocks:
+            self.report.publish_latencies.append(time.perf_counter() - start)
+            for user in self.users:
+                user.monitor()
+
+    def deposit_all(self):
+        """ Deposit every token still on the rootchain, and wait for them to be published """
+        if self.trace_memory:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot().filter_traces(OPERATOR_FILTERS)
+        depositing = [t for t in self.tokens.values() if t.status is TokenStatus.ROOTCHAIN]
+        for token in depositing:
+            self.owners[token.uid].deposit(token.uid)
+            self._count('deposit')
+        while any(t.status is TokenStatus.DEPOSIT for t in depositing):
+            self.tick()
+        if self.trace_memory:
+            after = tracemalloc.take_snapshot().filter_traces(OPERATOR_FILTERS)
+            tracemalloc.stop()
+            grown = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+            self.report.memory_per_token = grown / max(len(depositing), 1)
+
+    def _sealed(self, txn) -> bool:
+        return txn.prevBlkNum < len(self.operator.transactions) - 1
+
+    def _choose(self, condition) -> Token:
+        candidates = [t for t in self.tokens.values() if condition(t)]
+        return self.rng.choice(candidates) if candidates else None
+
+    def transfer(self) -> bool:
+        # NOTE Blocks only keep the last txn for each token, so one transfer per block
+        token = self._choose(lambda t: t.status is TokenStatus.PLASMACHAIN and
+                             self._sealed(t.history[-1]))
+        if not token:
+            return False
+        sender = self.owners[token.uid]
+        receiver = self.rng.choice([u for u in self.users if u is not sender])
+        start = time.perf_counter()
+        sender.transfer(receiver.address, token.uid)
+        self.report.transfer_time += time.perf_counter() - start
+        receiver.purse.append(token)
+        self.owners[token.uid] = receiver
+        return True
+
+    def exit(self) -> bool:
+        token = self._choose(lambda t: t.status is TokenStatus.PLASMACHAIN and
+                             len(t.history) >= 2 and self._sealed(t.history[-1]))
+        if not token:
+            return False
+        self.owners[token.uid].withdraw(token.uid)
+        self.exits.append(token)
+        return True
+
+    def malicious_exit(self) -> bool:
+        """ A prior owner tries to exit a token they spent, and gets challenged """
+        token = self._choose(lambda t: t.status is TokenStatus.PLASMACHAIN and
+                             len(t.history) >= 3 and self._sealed(t.history[-1]))
+        if not token:
+            return False
+        parent, spent, spend = token.history[-3:]
+        cheater = next(u for u in self.users if u.address == spent.newOwner)
+        transact(
+                self._rootchain.functions.startExit,
+                (
+                    parent.to_tuple,
+                    self.operator.get_branch(parent.tokenId, parent.prevBlkNum),
+                    spent.to_tuple,
+                    self.operator.get_branch(spent.tokenId, spent.prevBlkNum),
+                ),
+                {'from': cheater.address, 'gas': EXIT_GAS},
+            )
+        # The current owner challenges with the transaction that spent it
+        transact(
+                self._rootchain.functions.challengeExit,
+                (
+                    spend.to_tuple,
+                    self.operator.get_branch(spend.tokenId, spend.prevBlkNum),
+                    spend.prevBlkNum,
+                ),
+                {'from': self.owners[token.uid].address, 'gas': EXIT_GAS},
+            )
+        return True
+
+    def deposit(self) -> bool:
+        token = self._choose(lambda t: t.status is TokenStatus.ROOTCHAIN)
+        if not token:
+            return False
+        self.owners[token.uid].deposit(token.uid)
+        return True
+
+    def finalize_exits(self):
+        """ Skip past the challenge period, and finalize every exit """
+        if not self.exits:
+            return
+        now = self._w3.eth.getBlock('latest')['timestamp']
+        self._tester.time_travel(now + self.challenge_period + 1)
+        self._tester.mine_blocks(1)
+        for token in self.exits:
+            self.owners[token.uid].finalize(token.uid)
+        self.exits = []
+
+    def run(self, steps: int=1000, workload: Dict[str, int]=DEFAULT_WORKLOAD) -> SimulationReport:
+        start = time.perf_counter()
+        self.deposit_all()
+        operations, weights = zip(*sorted(workload.items()))
+        for _ in range(steps):
+            operation = self.rng.choices(operations, weights)[0]
+            if getattr(self, operation)():
+                self._count(operation)
+            if operation == 'exit':
+                self.finalize_exits()
+            self.tick()
+        self.finalize_exits()
+        self.report.tracked_tokens = len(self.operator.deposits)
+        self._collect_gas()
+        self.report.total_time = time.perf_counter() - start
+        return self.report
+
+    def _collect_gas(self):
+        # NOTE Selectors are used since web3 can't decode Vyper's struct inputs
+        selectors = {}  # Dict mapping (address, selector) to function name
+        for contract in (self._token, self._rootchain):
+            for abi in contract.abi:
+                if abi['type'] == 'function':
+                    selector = function_abi_to_4byte_selector(abi)
+                    selectors[(contract.address, selector)] = abi['name']
+        for blk_num in range(self._start_block, self._w3.eth.blockNumber + 1):
+            for txn_hash in self._w3.eth.getBlock(blk_num)['transactions']:
+                txn = self._w3.eth.getTransaction(txn_hash)
+                # NOTE eth-tester calls the input 'data'
+                data = txn['input'] if 'input' in txn.keys() else txn['data']
+                fn_name = selectors.get((txn['to'], bytes(HexBytes(data)[:4])))
+                if not fn_name:
+                    continue  # Not one of our contracts
+                receipt = self._w3.eth.getTransactionReceipt(txn_hash)
+                self.report.gas.setdefault(fn_name, []).append(receipt['gasUsed'])
@@ -0,0 +1,312 @@
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Mapping, Sequence, Set
+
+from trie.constants import BLANK_NODE
+from trie.smt import SparseMerkleTree
+
+from eth_typing import Hash32
+from eth_utils import keccak
+
+from .proof import TREE_DEPTH, Proof
+from .transaction import Transaction
+
+
+def to_bytes32(val: int) -> bytes:
+    assert 0 <= val < 2**256, "Value out of range!"
+    return val.to_bytes(32, byteorder='big')
+
+
+# Hash of an empty subtree of each height (0 is an empty leaf)
+EMPTY_HASHES = [keccak(BLANK_NODE)]
+for _ in range(TREE_DEPTH):
+    EMPTY_HASHES.append(keccak(EMPTY_HASHES[-1] + EMPTY_HASHES[-1]))
+
+
+class PathCache:
+    """
+    Branches of a block computed straight from its (sorted) leaves, without building the tree
+    NOTE Only the hash of each subtree hanging off a branch point (where the
+         leaves below a node split both ways) is kept, so ~2 hashes per leaf.
+         Every sibling in a branch is one of those (or an empty subtree), so
+         the leaves are hashed once (for the root) and after that a branch only
+         searches the keys.
+    """
+
+    def __init__(self, leaves: Mapping[int, Hash32], keys: Sequence[int]=None):
+        self.leaves = leaves
+        self.keys = keys if keys is not None else sorted(leaves)  # NOTE Sorted once
+        self._hashes = {}  # Dict mapping (lo, hi, height) of a subtree off a branch point to its hash
+        self._root_hash = None
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _subtree_hash(self, lo: int, hi: int, start: int, height: int, keep: bool=False) -> Hash32:
+        # Hash of the subtree of `height` covering [start, start + 2**height),
+        # which holds keys[lo:hi] (kept if it hangs off a branch point)
+        if lo == hi:
+            return EMPTY_HASHES[height]
+        if keep and (lo, hi, height) in self._hashes.keys():
+            return self._hashes[(lo, hi, height)]
+        if height == 0:
+            node_hash = keccak(self.leaves[self.keys[lo]])
+        else:
+            mid = start + (1 << (height - 1))
+            idx = bisect_left(self.keys, mid, lo, hi)
+            branches = lo < idx < hi
+            node_hash = keccak(self._subtree_hash(lo, idx, start, height - 1, branches) +
+                               self._subtree_hash(idx, hi, mid, height - 1, branches))
+        if keep:
+            self._hashes[(lo, hi, height)] = node_hash
+        return node_hash
+
+    @property
+    def root_hash(self) -> Hash32:
+        if self._root_hash is None:
+            self._root_hash = self._subtree_hash(0, len(self.keys), 0, TREE_DEPTH, True)
+        return self._root_hash
+
+    def branch(self, token_uid: int) -> Proof:
+        """ Same branch as `TokenToTxnHashIdSMT.branch` """
+        if token_uid not in self.leaves:
+            raise KeyError("Key does not exist")
+        self.root_hash  # NOTE Hashes every subtree we keep
+        siblings = []
+        lo, hi, start = 0, len(self.keys), 0
+        for height in range(TREE_DEPTH, 0, -1):
+            mid = start + (1 << (height - 1))
+            idx = bisect_left(self.keys, mid, lo, hi)
+            # NOTE A sibling is never empty only when our node is a branch point
+            branches = lo < idx < hi
+            if token_uid >= mid:
+                siblings.append(self._subtree_hash(lo, idx, start, height - 1, branches))
+                lo, start = idx, mid
+            else:
+                siblings.append(self._subtree_hash(idx, hi, mid, height - 1, branches))
+                hi = idx
+        return Proof.from_hashes(siblings)
+
+
+def branch_from_leaves(keys: Sequence[int],
+                       leaves: Mapping[int, Hash32],
+                       token_uid: int) -> Proof:
+    """
+    Same branch as `TokenToTxnHashIdSMT.branch`, computed straight from the leaves
+    (`keys` must be sorted, see `PathCache` to compute many of them)
+    """
+    return PathCache(leaves, keys).branch(token_uid)
+
+
+def walk_branch(db: Mapping[Hash32, bytes], root_hash: Hash32, token_uid: int) -> Proof:
+    """ Branch of a key in the tree at `root_hash` whose nodes are in `db` """
+    # NOTE Same walk as `SparseMerkleTree._get` (root->leaf order), with the
+    #      siblings joined into one buffer at the end (faster than writing
+    #      each one into it as we go)
+    siblings = []
+    node_hash = root_hash
+    target_bit = 1 << (TREE_DEPTH - 1)
+    for _ in range(TREE_DEPTH):
+        node = db[node_hash]
+        if token_uid & target_bit:
+            siblings.append(node[:32])
+            node_hash = node[32:]
+        else:
+            siblings.append(node[32:])
+            node_hash = node[:32]
+        target_bit >>= 1
+    return Proof.from_hashes(siblings)
+
+
+class TokenToTxnHashIdSMT(SparseMerkleTree):
+
+    def __init__(self):
+        # Tokens are 32 bytes big
+        super().__init__(key_size=32)
+        self.leaves = {}  # Dict mapping tokenId to txn hash (for serialization)
+
+    @classmethod
+    def from_leaves(cls, leaves: Mapping[int, Hash32]) -> 'TokenToTxnHashIdSMT':
+        tree = cls()
+        for token_uid, leaf in leaves.items():
+            tree.set_leaf(token_uid, leaf)
+        return tree
+
+    def get(self, token_uid: int) -> Hash32:
+        return super().get(to_bytes32(token_uid))
+
+    def branch(self, token_uid: int) -> Proof:
+        if token_uid not in self.leaves:
+            raise KeyError("Key does not exist")
+        return walk_branch(self.db, self.root_hash, token_uid)
+
+    def set(self, token_uid: int, txn: Transaction) -> Set[Hash32]:
+        return self.set_leaf(token_uid, txn.msg_hash)
+
+    def set_leaf(self, token_uid: int, leaf: Hash32) -> Set[Hash32]:
+        self.leaves[token_uid] = leaf
+        return super().set(to_bytes32(token_uid), leaf)
+
+    def exists(self, token_uid: int) -> bool:
+        # NOTE `SparseMerkleTree.exists` goes through our `get`, which takes a tokenId
+        return token_uid in self.leaves
+
+
+class TreeCache:
+    """
+    Bounded LRU of the trees rebuilt for sealed blocks
+    (with no room for any, each block computes its branches from its leaves, see `PathCache`)
+    """
+
+    def __init__(self, max_trees: int=16):
+        self.max_trees = max_trees
+        self._trees = OrderedDict()  # SealedBlock -> TokenToTxnHashIdSMT
+
+    def __len__(self):
+        return len(self._trees)
+
+    def get(self, block: 'SealedBlock') -> TokenToTxnHashIdSMT:
+        tree = self._trees.get(block)
+        if tree is not None:
+            self._trees.move_to_end(block)
+        return tree
+
+    def put(self, block: 'SealedBlock', tree: TokenToTxnHashIdSMT):
+        self._trees[block] = tree
+        while len(self._trees) > self.max_trees:
+            self._trees.popitem(last=False)
+
+
+class NodeStore(Mapping):
+    """
+    Content-addressed tree nodes (keyed by hash) shared by the trees of many blocks,
+    so a subtree two blocks have in common is only stored once
+    NOTE Each node counts the parents (or block roots) pointing at it, and is
+         dropped when the last one goes. Empty subtrees are always kept.
+    """
+
+    def __init__(self):
+        self.nodes = {EMPTY_HASHES[0]: BLANK_NODE}  # Dict mapping node hash to node
+        for height in range(TREE_DEPTH):
+            self.nodes[EMPTY_HASHES[height + 1]] = EMPTY_HASHES[height] * 2
+        self._pinned = frozenset(self.nodes.keys())
+        self.refs = {}  # Dict mapping node hash to number of references
+
+    def __getitem__(self, node_hash: Hash32) -> bytes:
+        return self.nodes[node_hash]
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def add_tree(self, root_hash: Hash32, db: Mapping[Hash32, bytes]):
+        """ Hold a reference to the tree at `root_hash`, adding any of its nodes (from `db`) we don't have """
+        stack = [(root_hash, 0)]
+        while stack:
+            node_hash, depth = stack.pop()
+            if node_hash in self._pinned:
+                continue
+            if node_hash in self.refs.keys():
+                self.refs[node_hash] += 1
+                continue  # Already have everything below it
+            node = db[node_hash]
+            self.nodes[node_hash] = node
+            self.refs[node_hash] = 1
+            if depth < TREE_DEPTH:  # Otherwise it's a leaf
+                stack.append((node[:32], depth + 1))
+                stack.append((node[32:], depth + 1))
+
+    def release(self, root_hash: Hash32):
+        """ Drop a reference to the tree at `root_hash`, and any nodes nothing else points at """
+        stack = [(root_hash, 0)]
+        while stack:
+            node_hash, depth = stack.pop()
+            if node_hash in self._pinned:
+                continue
+            self.refs[node_hash] -= 1
+            if self.refs[node_hash] > 0:
+                continue  # Still shared
+            del self.refs[node_hash]
+            node = self.nodes.pop(node_hash)
+            if depth < TREE_DEPTH:
+                stack.append((node[:32], depth + 1))
+                stack.append((node[32:], depth + 1))
+
+
+class SealedBlock:
+    """
+    Published block that only holds onto its leaves,
+    the full tree is rebuilt (and checked against the root) when needed
+    NOTE Without a cache or a store, the tree is kept around once it is rebuilt
+    """
+
+    def __init__(self,
+                 root_hash: Hash32,
+                 leaves: Mapping[int, Hash32],
+                 cache: TreeCache=None,
+                 store: NodeStore=None):
+        self.root_hash = root_hash
+        self.leaves = leaves  # Mapping of tokenId to txn hash
+        self.cache = cache
+        self.store = store  # Where our nodes are kept (shared with other blocks)
+        self._stored = False  # Whether the store holds a reference to our tree
+        self._tree = None
+        self._paths = None  # PathCache, when there's no tree to walk
+
+    def retain(self, db: Mapping[Hash32, bytes]=None):
+        """ Put our tree in the store (from `db`, or rebuilt from the leaves) """
+        assert self.store is not None, "No store to keep the tree in!"
+        if not self._stored:
+            self.store.add_tree(self.root_hash, db if db is not None else self._build_tree().db)
+            self._stored = True
+
+    def release(self):
+        """
+        Take our tree out of the store (branches are computed from the leaves after this)
+        NOTE The first branch after this hashes every leaf again, later ones are cheap (see `PathCache`)
+        """
+        if self._stored:
+            self.store.release(self.root_hash)
+        self.store = None
+        self._stored = False
+        self.cache = TreeCache(0)
+
+    def _build_tree(self) -> TokenToTxnHashIdSMT:
+        tree = TokenToTxnHashIdSMT.from_leaves(self.leaves)
+        assert tree.root_hash == self.root_hash, "Leaves do not match block root!"
+        return tree
+
+    @property
+    def tree(self) -> TokenToTxnHashIdSMT:
+        if self.cache is None:
+            if self._tree is None:
+                self._tree = self._build_tree()
+            return self._tree
+        tree = self.cache.get(self)
+        if tree is None:
+            tree = self._build_tree()
+            self.cache.put(self, tree)
+        return tree
+
+    def get(self, token_uid: int) -> Hash32:
+        if token_uid not in self.leaves:
+            raise KeyError("Key does not exist")
+        return self.leaves[token_uid]
+
+    def branch(self, token_uid: int) -> Proof:
+        if self.store is not None:
+            if token_uid not in self.leaves:
+                raise KeyError("Key does not exist")
+            self.retain()  # NOTE Put off until needed (e.g. after loading a snapshot)
+            return walk_branch(self.store, self.root_hash, token_uid)
+        if self.cache is not None and self.cache.max_trees == 0:
+            if self._paths is None:
+                self._paths = PathCache(self.leaves)
+                assert self._paths.root_hash == self.root_hash, "Leaves do not match block root!"
+            return self._paths.branch(token_uid)
+        return self.tree.branch(token_uid)
+
+    def exists(self, token_uid: int) -> bool:
+        return token_uid in self.leaves
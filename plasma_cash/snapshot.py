@@ -0,0 +1,282 @@
+"""
+Compact binary snapshots of Operator state
+
+A snapshot file is a header followed by segments of records. The first
+segment is a full dump, every later one is incremental and only holds what
+changed since the segment before it. A segment is only applied if its end
+record made it to disk, so a crash mid-write falls back to the prior state.
+
+Sealed blocks are only stored as their sorted leaves. On load, those leaves
+stay in the memory-mapped file and each tree is rebuilt when first needed.
+Full snapshots are written to a new file that replaces the old one, and
+incremental ones only append past the last complete segment, so the bytes
+a loaded snapshot maps never change under it.
+"""
+import mmap
+import os
+import struct
+
+from collections.abc import Mapping
+
+from eth_utils import to_canonical_address, to_checksum_address
+
+from .smt import (
+    SealedBlock,
+    TokenToTxnHashIdSMT,
+    to_bytes32,
+)
+from .transaction import Transaction
+
+
+MAGIC = b'PLSMSNAP'
+VERSION = 1
+
+# Header: magic, version, chain id, rootchain address
+HEADER = struct.Struct('>8sHQ20s')
+
+# Record tags
+FULL = b'F'  # Start of full segment
+INCREMENTAL = b'I'  # Start of incremental segment
+BLOCK = b'B'  # Sealed block: blkNum, root, leaves
+OPEN_BLOCK = b'O'  # Block being built: blkNum, leaves
+PENDING = b'P'  # All pending deposits
+DEPOSITS = b'D'  # Tracked tokens that were added or updated
+REMOVED = b'R'  # Tracked tokens that were removed
+END = b'E'  # End of segment: last sync time
+
+U32 = struct.Struct('>I')
+U64 = struct.Struct('>Q')
+LEAF_SIZE = 64  # tokenId + txn hash
+TXN_SIZE = 192  # See `Transaction.to_bytes`
+
+
+class PackedLeaves(Mapping):
+    """
+    Read-only mapping of tokenId to txn hash over packed leaves sorted by tokenId
+    (uses the buffer directly, so nothing is copied out of a memory-mapped file)
+    """
+
+    def __init__(self, buf: memoryview):
+        assert len(buf) % LEAF_SIZE == 0, "Leaves are not packed correctly!"
+        self._buf = buf
+        self._len = len(buf) // LEAF_SIZE
+
+    def __deepcopy__(self, memo):
+        return self  # NOTE Read-only, so copies can share it (a memory-mapped file can't be copied)
+
+    def _key(self, idx: int) -> bytes:
+        return self._buf[idx*LEAF_SIZE:idx*LEAF_SIZE+32].tobytes()
+
+    def _find(self, token_uid: int) -> int:
+        key = to_bytes32(token_uid)
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._len and self._key(lo) == key:
+            return lo
+        return -1
+
+    def __getitem__(self, token_uid: int) -> bytes:
+        if not isinstance(token_uid, int) or not 0 <= token_uid < 2**256:
+            raise KeyError(token_uid)
+        idx = self._find(token_uid)
+        if idx < 0:
+            raise KeyError(token_uid)
+        return self._buf[idx*LEAF_SIZE+32:(idx+1)*LEAF_SIZE].tobytes()
+
+    def __contains__(self, token_uid) -> bool:
+        if not isinstance(token_uid, int) or not 0 <= token_uid < 2**256:
+            return False
+        return self._find(token_uid) >= 0
+
+    def __iter__(self):
+        for idx in range(self._len):
+            yield int.from_bytes(self._key(idx), 'big')
+
+    def __len__(self) -> int:
+        return self._len
+
+    @property
+    def packed(self) -> memoryview:
+        return self._buf
+
+
+def pack_leaves(leaves: Mapping) -> bytes:
+    if isinstance(leaves, PackedLeaves):
+        return leaves.packed.tobytes()
+    return b''.join(to_bytes32(k) + leaves[k] for k in sorted(leaves.keys()))
+
+
+def pack_transactions(txns) -> bytes:
+    return U32.pack(len(txns)) + b''.join(t.to_bytes for t in txns)
+
+
+class SnapshotFile:
+    """
+    Writes snapshots of an Operator to a file, keeping enough bookkeeping
+    to append incremental snapshots later, and reads them back
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.blocks_written = 0  # Number of sealed blocks already in the file
+        self.deposits_written = {}  # What was last written for each tracked token
+        self.size = None  # Bytes up to the end of the last complete segment
+
+    def write(self, operator, incremental: bool=False):
+        records = [INCREMENTAL if incremental else FULL]
+
+        # Sealed blocks never change, so only write the new ones
+        sealed = operator.transactions[:-1]
+        for blk_num in range(self.blocks_written if incremental else 0, len(sealed)):
+            leaves = pack_leaves(sealed[blk_num].leaves)
+            records.append(BLOCK + U64.pack(blk_num) + sealed[blk_num].root_hash +
+                           U32.pack(len(leaves) // LEAF_SIZE) + leaves)
+
+        # The open block (and pending deposits) are small, so always rewrite them
+        leaves = pack_leaves(operator.transactions[-1].leaves)
+        records.append(OPEN_BLOCK + U64.pack(len(sealed)) +
+                       U32.pack(len(leaves) // LEAF_SIZE) + leaves)
+        records.append(PENDING + pack_transactions(list(operator.pending_deposits.values())))
+
+        # Only write tracked tokens whose last txn changed
+        if incremental:
+            changed = [txn for token_uid, txn in operator.deposits.items()
+                       if self.deposits_written.get(token_uid) is not txn]
+            removed = [token_uid for token_uid in self.deposits_written.keys()
+                       if token_uid not in operator.deposits]
+        else:
+            changed, removed = list(operator.deposits.values()), []
+        records.append(DEPOSITS + pack_transactions(changed))
+        records.append(REMOVED + U32.pack(len(removed)) +
+                       b''.join(to_bytes32(token_uid) for token_uid in removed))
+
+        records.append(END + U64.pack(operator.last_sync_time))
+
+        data = b''.join(records)
+        if incremental:
+            # NOTE Drop whatever a torn write left after the last complete segment
+            if self.size is not None and os.path.getsize(self.path) > self.size:
+                os.truncate(self.path, self.size)
+            with open(self.path, 'ab') as f:
+                f.write(data)
+                self.size = f.tell()
+        else:
+            # NOTE Never rewrite a file in place, a restored operator may have it mapped
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    operator._w3.eth.chainId,
+                    to_canonical_address(operator._rootchain.address),
+                ))
+                f.write(data)
+                self.size = f.tell()
+            os.replace(tmp_path, self.path)
+
+        self.blocks_written = len(sealed)
+        self.deposits_written = dict(operator.deposits)
+
+    def read(self, operator):
+        with open(self.path, 'rb') as f:
+            buf = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+        magic, version, chain_id, rootchain_address = HEADER.unpack_from(buf, 0)
+        assert magic == MAGIC, "Not a snapshot file!"
+        assert version == VERSION, "Unsupported snapshot version!"
+        assert chain_id == operator._w3.eth.chainId, "Snapshot is for a different chain!"
+        rootchain_address = to_checksum_address(rootchain_address)
+        assert rootchain_address == operator._rootchain.address, \
+                "Snapshot is for a different rootchain!"
+
+        def take(offset, size):
+            # A record cut short means the file was torn mid-write
+            if offset + size > len(buf):
+                raise EOFError
+            return buf[offset:offset+size]
+
+        def read_transactions(offset):
+            num, = U32.unpack(take(offset, U32.size))
+            offset += U32.size
+            data = take(offset, num*TXN_SIZE)
+            txns = [Transaction.from_bytes(
+                        chain_id,
+                        rootchain_address,
+                        data[i*TXN_SIZE:(i+1)*TXN_SIZE],
+                    ) for i in range(num)]
+            return txns, offset + num*TXN_SIZE
+
+        def read_leaves(offset):
+            num, = U32.unpack(take(offset, U32.size))
+            offset += U32.size
+            return PackedLeaves(take(offset, num*LEAF_SIZE)), offset + num*LEAF_SIZE
+
+        # Committed state (only updated when a segment is complete)
+        blocks, open_block, pending, deposits, last_sync_time = [], None, {}, {}, None
+
+        offset = end = HEADER.size
+        segment = None
+        try:
+            while offset < len(buf):
+                tag = take(offset, 1).tobytes()
+                offset += 1
+                if tag in (FULL, INCREMENTAL):
+                    assert segment is None, "Segment was not terminated!"
+                    assert tag == FULL or last_sync_time is not None, \
+                            "Incremental segment without a full snapshot!"
+                    segment = {
+                        'blocks': [] if tag == FULL else list(blocks),
+                        'deposits': {} if tag == FULL else dict(deposits),
+                    }
+                elif tag == BLOCK:
+                    blk_num, = U64.unpack(take(offset, U64.size))
+                    root_hash = take(offset + U64.size, 32).tobytes()
+                    leaves, offset = read_leaves(offset + U64.size + 32)
+                    assert blk_num == len(segment['blocks']), "Blocks are out of order!"
+                    segment['blocks'].append(SealedBlock(root_hash, leaves))
+                elif tag == OPEN_BLOCK:
+                    blk_num, = U64.unpack(take(offset, U64.size))
+                    segment['open_block'], offset = read_leaves(offset + U64.size)
+                    assert blk_num == len(segment['blocks']), "Blocks are out of order!"
+                elif tag == PENDING:
+                    txns, offset = read_transactions(offset)
+                    segment['pending'] = {t.tokenId: t for t in txns}
+                elif tag == DEPOSITS:
+                    txns, offset = read_transactions(offset)
+                    segment['deposits'].update((t.tokenId, t) for t in txns)
+                elif tag == REMOVED:
+                    num, = U32.unpack(take(offset, U32.size))
+                    offset += U32.size
+                    data = take(offset, num*32)
+                    for i in range(num):
+                        token_uid = int.from_bytes(data[i*32:(i+1)*32], 'big')
+                        segment['deposits'].pop(token_uid, None)
+                    offset += num*32
+                elif tag == END:
+                    last_sync_time, = U64.unpack(take(offset, U64.size))
+                    offset += U64.size
+                    blocks = segment['blocks']
+                    open_block = segment['open_block']
+                    pending = segment['pending']
+                    deposits = segment['deposits']
+                    segment = None
+                    end = offset
+                else:
+                    raise ValueError("Unknown snapshot record: {}".format(tag))
+        except EOFError:
+            pass  # Torn write, ignore the unfinished segment
+
+        assert last_sync_time is not None, "Snapshot has no complete segment!"
+        operator.transactions = blocks + [TokenToTxnHashIdSMT.from_leaves(open_block)]
+        operator.pending_deposits = pending
+        operator.deposits = deposits
+        operator.last_sync_time = last_sync_time
+
+        self.blocks_written = len(blocks)
+        self.deposits_written = dict(deposits)
+        self.size = end
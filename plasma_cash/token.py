@@ -5,6 +5,17 @@ from typing import List
 from .transaction import Transaction
 
 
+def follows(prior_txn: Transaction, txn: Transaction) -> bool:
+    """ Whether `txn` is a valid transfer by the owner after `prior_txn` """
+    if txn.tokenId != prior_txn.tokenId:
+        return False
+    if txn.signer != prior_txn.newOwner:
+        return False
+    if txn.prevBlkNum < prior_txn.prevBlkNum:
+        return False
+    return True
+
+
 class TokenStatus(enum.Enum):
     ROOTCHAIN = 0
     DEPOSIT = 1
@@ -17,9 +28,13 @@ class Token:
     def __init__(self,
                  uid: int,
                  status: TokenStatus=TokenStatus.ROOTCHAIN,
-                 history: List[Transaction]=None):
+                 history: List[Transaction]=None,
+                 end: int=None):
 
         self.uid = uid
+        # NOTE A coin can cover the range of tokenIds [uid, end), which moves as a whole
+        self.end = end if end is not None else uid + 1
+        assert self.end > self.uid, "Range is empty!"
         self.status = status
 
         if self.status in [TokenStatus.ROOTCHAIN, TokenStatus.DEPOSIT]:
@@ -28,7 +43,7 @@ class Token:
             history = []
 
         self.history = history  # Ordered list of transactions
-        self.history_depth_checked = 0  # How much of the history has been checked (cache)
+        self._checked = (0, None)  # Depth of the history that was checked, and the txn there (cache)
 
         if self.status in [TokenStatus.PLASMACHAIN, TokenStatus.WITHDRAWAL]:
             # Validate full history
@@ -40,23 +55,26 @@ class Token:
         # If token has no history, nothing to check
         if not self.history:
             return True
-        # Check if we've fully validated token before
-        # (everything validates up to the last txn)
-        if self.history_depth_checked == len(self.history) - 1:
-            return True
+        depth, checked_txn = self._checked
+        # NOTE If the history changed under us since, start over
+        if depth >= len(self.history) or self.history[depth] is not checked_txn:
+            depth = 0
         # Perform check on unchecked chain of history (cached)
-        prior_txn = self.history[self.history_depth_checked]
-        for txn in self.history[self.history_depth_checked+1:]:
-            if txn.tokenId != prior_txn.tokenId:
-                return False
-            if txn.signer != prior_txn.newOwner:
-                return False
-            if txn.prevBlkNum < prior_txn.prevBlkNum:
+        for prior_txn, txn in zip(self.history[depth:], self.history[depth+1:]):
+            if not follows(prior_txn, txn):
                 return False
         # Cache this for later (last entry starts the check)
-        self.history_depth_checked = len(self.history) - 1
+        self.mark_checked()
         return True
 
+    def mark_checked(self):
+        """ Everything in the history so far was checked (e.g. as it was received) """
+        self._checked = (len(self.history) - 1, self.history[-1] if self.history else None)
+
+    @property
+    def is_range(self) -> bool:
+        return self.end > self.uid + 1
+
     @property
     def deposited(self) -> bool:
         return self.status == TokenStatus.DEPOSIT \
@@ -37,7 +37,8 @@ class Transaction:
         sig = (sigV, sigR, sigS)
         if is_signature(sig):
             self._signature = sig
-        self._signature = None
+        else:
+            self._signature = None
 
     @property
     def signature(self):
@@ -108,3 +109,17 @@ class Transaction:
                 '(address,uint256,uint256,uint256,uint256,uint256)',
                 self.to_tuple
             )
+
+    @classmethod
+    def from_bytes(cls, chain_id, rootchain_address, data):
+        """ Inverse of `to_bytes` (domain separator must be provided) """
+        assert len(data) == 192, "Encoded transaction must be 192 bytes!"
+        words = [int.from_bytes(data[i:i+32], 'big') for i in range(32, 192, 32)]
+        return cls(
+                chain_id,
+                rootchain_address,
+                words[1],  # prevBlkNum
+                words[0],  # tokenId
+                to_checksum_address(bytes(data[12:32])),  # newOwner
+                *words[2:],  # signature
+            )
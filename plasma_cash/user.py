@@ -1,4 +1,6 @@
-from typing import Set
+import logging
+
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
 
 from eth_typing import AnyAddress, ChecksumAddress
 from eth_account import Account
@@ -6,19 +8,50 @@ from eth_account import Account
 from trie.smt import calc_root
 
 from web3 import Web3
-from web3.middleware.signing import construct_sign_and_send_raw_middleware
+from web3.logs import DISCARD
 
 from .contracts import (
     token_interface,
     rootchain_interface,
 )
+from .metrics import (
+    Metrics,
+    NULL_METRICS,
+)
+from .events import get_dispatcher
+from .height import get_tracker
+from .history import (
+    HistoryReader,
+    read_history,
+)
 from .operator import Operator
+from .proof import transact
+from .receipts import get_watcher
+from .rpc import (
+    RequestBatch,
+    get_cache,
+)
+from .scheduler import ExitScheduler
+from .signing import (
+    SignerPool,
+    add_signer,
+    get_signer_pool,
+)
 from .token import (
     Token,
     TokenStatus,
 )
 
 from .transaction import Transaction
+from .verifier import Verifier
+
+
+# Skip gas estimation for pipelined deposits (the approval might not be mined yet)
+DEPOSIT_GAS = 300000
+DEPOSIT_GAS_PER_TOKEN = 60000  # Extra for each token after the first in a range
+
+
+logger = logging.getLogger(__name__)
 
 
 class User:
@@ -29,26 +62,59 @@ class User:
                  rootchain_address: AnyAddress,
                  operator: Operator,
                  private_key: bytes,
-                 purse: Set[Token]=None):
+                 purse: Set[Token]=None,
+                 metrics: Metrics=None,
+                 exits_path: str=None):
         self._w3 = w3
         self._token = self._w3.eth.contract(token_address, **token_interface)
         self._rootchain = self._w3.eth.contract(rootchain_address, **rootchain_interface)
         self._operator = operator
         self._acct = Account.from_key(private_key)
         # Allow web3 to autosign with account
-        middleware = construct_sign_and_send_raw_middleware(private_key)
-        self._w3.middleware_onion.add(middleware)
+        add_signer(self._w3, self._acct)
+        self._signer_pool = None  # Signs batches of transfers (shared, see `get_signer_pool`)
         # Load Tokens
         self.purse = purse if purse else []
-        # Add listeners (dict of filters: callbacks)
+        # Height of the child chain (shared with everyone on this rootchain)
+        self.chain_height = get_tracker(self._w3, self._rootchain.address)
+        # Check proofs against the published roots
+        self.verifier = Verifier(self._w3, self._rootchain.address, tracker=self.chain_height)
+        # Instrumentation (no-op unless enabled)
+        self.metrics = metrics if metrics else NULL_METRICS
+        self._monitor_time = self.metrics.histogram(
+                'plasma_user_monitor_seconds', "Time spent handling events per monitor call")
+        self._transfer_time = self.metrics.histogram(
+                'plasma_user_transfer_seconds', "Time to sign and submit a transfer")
+        self._transfers = self.metrics.counter(
+                'plasma_user_transfers_total', "Transfers submitted to the operator")
+        # Values that rarely change (shared with everyone on this connection)
+        self._rpc_cache = get_cache(self._w3)
+        # Receipts of the transactions we send (shared with everyone on this connection)
+        self._receipts = get_watcher(self._w3)
+        # Add listeners (dict of subscriptions: callbacks)
+        # NOTE Everyone on this rootchain shares one subscription to its events
+        self._events = get_dispatcher(self._w3, self._rootchain.address)
         self.listeners = {}
+        from_block = self._w3.eth.blockNumber
         # Add listener to accept list of deposited tokens
         self.tokens_in_deposit = []
-        self.listeners[
-                self._rootchain.events.BlockPublished.createFilter(
-                    fromBlock=self._w3.eth.blockNumber
-                )
-            ] = self.handleDeposits
+        self.pending_deposit_txns = {}  # Dict mapping txn hash to (Token, deposit txn, receipt future) we sent
+        self._approved = False  # Whether the rootchain is approved to pull our tokens
+        self.listeners[self._events.subscribe('BlockPublished', from_block)] = self.handleDeposits
+        # Add listeners to respond to challenges of our exits
+        self.tokens_in_withdrawal = {}  # Dict mapping tokenId to Token we are exiting
+        self._responses = []  # Challenges waiting for a response (tokenId, blkNum)
+        self.listeners[self._events.subscribe('ChallengeStarted', from_block)] = self.handleChallenge
+        self.listeners[self._events.subscribe('ChallengeCancelled', from_block)] = self.handleChallengeCancelled
+        self.listeners[self._events.subscribe('ExitCancelled', from_block)] = self.handleExitCancelled
+        # Finalize our exits when their challenge period is over
+        self.exit_scheduler = ExitScheduler(exits_path)
+        # NOTE Exits (and their challenges) from before a restart are picked back up
+        self.challenges = self.exit_scheduler.challenges  # Dict mapping tokenId to set of challenged blkNums
+        for token in self.purse:
+            if token.uid in self.exit_scheduler:
+                self.tokens_in_withdrawal[token.uid] = token
+        self._challenge_period = None  # Fetched on first exit
 
     @property
     def address(self) -> ChecksumAddress:
@@ -56,35 +122,50 @@ class User:
 
     # TODO Make this async loop
     def monitor(self):
-        for log_filter, callback_fn in self.listeners.items():
-            for log in log_filter.get_new_entries():
-                callback_fn(log)
+        with self._monitor_time.time():
+            self.chain_height.update()
+            self.confirmDeposits()
+            self._events.poll()  # NOTE One query for all of them
+            for subscription, callback_fn in self.listeners.items():
+                for log in subscription.drain():
+                    callback_fn(log)
+            # Answer every challenge we saw at once
+            # NOTE Both send without waiting on each other, so they share one nonce
+            nonce = self.respondChallenges()
+            self.finalizeExits(nonce)
 
     def deposit(self, token_uid):
         # Get the actual token in our purse
         token = next((t for t in self.purse if t.uid == token_uid), None)
         assert token, "Token not in wallet!"
 
+        # Read everything we need at once
+        batch = RequestBatch(self._w3)
         # Manual nonce management due to two potential transactions in this method
-        nonce = self._w3.eth.getTransactionCount(self.address)
-
-        # Allow the rootchain to pull all our deposits using safeTransferFrom
-        if not self._token.functions.isApprovedForAll(
+        nonce = batch.transaction_count(self.address)
+        approved = batch.call(self._token.functions.isApprovedForAll(
             self.address,
             self._rootchain.address,
-        ).call():
-            txn_hash = self._token.functions.setApprovalForAll(
-                self._rootchain.address,
-                True,
-            ).transact({'from': self.address, 'nonce': nonce})
-            nonce += 1  # To ensure this transaction doesn't conflict with next
-            self._w3.eth.waitForTransactionReceipt(txn_hash)  # FIXME Shouldn't have to wait
+        ))
+        batch.send()
+        nonce = nonce.value
+
+        # Allow the rootchain to pull all our deposits using safeTransferFrom
+        if not approved.value:
+            with self.metrics.span('l1.setApprovalForAll'):
+                txn_hash = self._token.functions.setApprovalForAll(
+                    self._rootchain.address,
+                    True,
+                ).transact({'from': self.address, 'nonce': nonce})
+                nonce += 1  # To ensure this transaction doesn't conflict with next
+                self._receipts.wait(txn_hash)  # FIXME Shouldn't have to wait
 
         # Create the deposit transaction for it (from user to user in current block)
+        # NOTE If a block is published before this is mined, the rootchain rejects it
         transaction = Transaction(
-                self._w3.eth.chainId,
+                self._rpc_cache.chain_id,
                 self._rootchain.address,
-                self._rootchain.functions.childChain_len().call(),
+                self.chain_height.update(),
                 token_uid,
                 self.address,  # Send to self for deposit
             )
@@ -94,72 +175,308 @@ class User:
         transaction.add_signature(signature)
 
         # Deposit on the rootchain
-        txn_hash = self._rootchain.functions.deposit(
-            self.address,
-            transaction.to_tuple,
-        ).transact({'from': self.address, 'nonce': nonce})
-        self._w3.eth.waitForTransactionReceipt(txn_hash)  # FIXME Shouldn't have to wait
+        with self.metrics.span('l1.deposit', token=token_uid):
+            txn_hash = self._deposit_function(token, transaction).transact({
+                'from': self.address,
+                'nonce': nonce,
+            })
+            self._receipts.wait(txn_hash)  # FIXME Shouldn't have to wait
 
         # Also log when we deposited it and add the deposit to our history
         token.set_deposited(transaction)
         # Add token to handleDeposits listener callback
         self.tokens_in_deposit.append(token_uid)
 
+    def _deposit_function(self, token, transaction):
+        if token.is_range:
+            return self._rootchain.functions.depositRange(
+                self.address,
+                transaction.to_tuple,
+                token.end,
+            )
+        return self._rootchain.functions.deposit(self.address, transaction.to_tuple)
+
+    def _deposit_gas(self, token) -> int:
+        return DEPOSIT_GAS + DEPOSIT_GAS_PER_TOKEN * (token.end - token.uid - 1)
+
+    def deposit_many(self, token_uids):
+        """
+        Deposit many tokens at once: approve (if needed) and sign everything up front,
+        then send it all back to back without waiting (see confirmDeposits for the rest)
+        """
+        tokens = []
+        for token_uid in token_uids:
+            # Get the actual token in our purse
+            token = next((t for t in self.purse if t.uid == token_uid), None)
+            assert token, "Token not in wallet!"
+            assert token.status is TokenStatus.ROOTCHAIN, "Token already deposited!"
+            tokens.append(token)
+
+        # Read everything we need at once
+        batch = RequestBatch(self._w3)
+        # NOTE Some of our transactions might still be pending
+        nonce = batch.transaction_count(self.address, 'pending')
+        approved = None
+        if not self._approved:
+            approved = batch.call(self._token.functions.isApprovedForAll(
+                self.address,
+                self._rootchain.address,
+            ))
+        batch.send()
+        nonce = nonce.value
+
+        # Allow the rootchain to pull all our deposits using safeTransferFrom (only once)
+        if approved and not approved.value:
+            with self.metrics.span('l1.setApprovalForAll'):
+                txn_hash = self._token.functions.setApprovalForAll(
+                    self._rootchain.address,
+                    True,
+                ).transact({'from': self.address, 'nonce': nonce})
+            nonce += 1  # Mined before our deposits, since it comes first
+            # NOTE Only remember it once it went through, otherwise we check again next time
+            self._receipts.watch(txn_hash, self._approval_mined)
+        elif approved:
+            self._approved = True
+
+        # Sign all the deposit transactions for the current block
+        # NOTE If a block is published before one is mined, the rootchain rejects it
+        #      (confirmDeposits will sign it again for the next block)
+        blk_num = self.chain_height.update()
+        for token in tokens:
+            transaction = Transaction(
+                    self._rpc_cache.chain_id,
+                    self._rootchain.address,
+                    blk_num,
+                    token.uid,
+                    self.address,  # Send to self for deposit
+                )
+            # TODO: Use eth_signTypedData method when eth-tester supports it
+            signature = self._acct.sign_message(transaction.msg)
+            transaction.add_signature((signature.v, signature.r, signature.s))
+
+            with self.metrics.span('l1.deposit', token=token.uid):
+                txn_hash = self._deposit_function(token, transaction).transact({
+                    'from': self.address,
+                    'nonce': nonce,
+                    'gas': self._deposit_gas(token),
+                })
+            nonce += 1
+            self.pending_deposit_txns[txn_hash] = (token, transaction, self._receipts.watch(txn_hash))
+
+    def _approval_mined(self, receipt):
+        self._approved = receipt['status'] == 1
+
+    def confirmDeposits(self):
+        """
+        Check the receipts of deposits we sent, and retry the ones that were too late
+        """
+        self._receipts.poll()
+        retry = []
+        for txn_hash, (token, transaction, receipt) in list(self.pending_deposit_txns.items()):
+            if not receipt.done():
+                continue  # Not mined yet
+            receipt = receipt.result()
+            del self.pending_deposit_txns[txn_hash]
+            if receipt['status'] == 1:
+                # Also log when we deposited it and add the deposit to our history
+                token.set_deposited(transaction)
+                self.tokens_in_deposit.append(token.uid)
+            elif transaction.prevBlkNum != self.chain_height.update():
+                retry.append(token.uid)  # A block was published before it was mined
+            else:
+                logger.warning("Deposit of token %d failed!", token.uid)
+        if retry:
+            self.deposit_many(retry)
+
     def handleDeposits(self, log):
         """
         Callback for event when operator publishes block
         """
+        waiting = []
         for token_uid in self.tokens_in_deposit:
             # Get the actual token in our purse
             token = next((t for t in self.purse if t.uid == token_uid), None)
-            # TODO Validate that token in block
+            deposit = token.history[-1]
+            if self.verifier.root(deposit.prevBlkNum) is None:
+                waiting.append(token_uid)  # Not published yet
+                continue
+            if not self._verify(deposit):
+                logger.warning("Deposit of token %d not in block %d!", token_uid, deposit.prevBlkNum)
+                waiting.append(token_uid)
+                continue
             token.set_transferrable()
             # TODO Add listener to challenge withdraws for this token
-        self.tokens_in_deposit = []
+        self.tokens_in_deposit = waiting
+
+    def _verify(self, transaction) -> bool:
+        if self.verifier.is_verified(transaction):
+            return True  # Don't need the proof again
+        proof = self._operator.get_branch(transaction.tokenId, transaction.prevBlkNum)
+        return self.verifier.verify(transaction, proof)
 
     def transfer(self, user_address, token_uid):
+        with self._transfer_time.time():
+            self._transfer(user_address, token_uid)
+
+    def _transfer(self, user_address, token_uid):
         # NOTE Use user's address instead of object with messaging
         token = next((t for t in self.purse if t.uid == token_uid), None)
         assert token, "Token not in wallet!"
 
         # TODO Handle ETH transfer
-        transaction = Transaction(
-                self._w3.eth.chainId,
-                self._rootchain.address,
-                self._rootchain.functions.childChain_len().call(),
-                token_uid,
-                user_address
-            )
-        # TODO: Use eth_signTypedData method when eth-tester supports it
-        signature = self._acct.sign_message(transaction.msg)
-        signature = (signature.v, signature.r, signature.s)
-        transaction.add_signature(signature)
+        # NOTE Catch up first, so we don't sign for a block that was already published
+        blk_num = self.chain_height.update()
+        transaction = self._sign_transfer(user_address, token_uid, blk_num)
         token.addTransaction(transaction)  # Not needed with messaging
         # Block until user approces our transfer
         # TODO Make this async
         #assert user.receive(self, token), "Receive Rejected!"
         # Block until operator processes our transaction
         # TODO Make this async
-        assert self._operator.addTransaction(transaction), "Transaction Failed!"
+        accepted = self._operator.addTransaction(transaction)
+        if not accepted and self.chain_height.update() != blk_num:
+            # A block was published since we signed it, so sign it for the next one
+            transaction = self._sign_transfer(user_address, token_uid, self.chain_height.height)
+            token.history[-1] = transaction
+            accepted = self._operator.addTransaction(transaction)
+        self._transfers.inc(result='accepted' if accepted else 'rejected')
+        assert accepted, "Transaction Failed!"
         # TODO Do this with messaging
         #assert self._messaging.sendmessage(user_address, token), "Receive Rejected!"
         # Block until operator processes our transaction
         #assert self._messaging.sendmessage(self._operator, transaction), "Transaction Failed!"
         self.purse.remove(token)
 
+    @property
+    def signer_pool(self) -> SignerPool:
+        """ Signs batches of transfers (shared with anyone else using our key) """
+        if self._signer_pool is None:
+            self._signer_pool = get_signer_pool(self._acct.key)
+        return self._signer_pool
+
+    def close(self):
+        """ Let go of our signer pool (stopping its workers if nobody else uses it) """
+        if self._signer_pool is not None:
+            self._signer_pool.release()
+            self._signer_pool = None
+
+    def transfer_many(self, transfers: Sequence[Tuple[AnyAddress, int]]) -> Dict[int, bool]:
+        """
+        Sign every (user address, tokenId) transfer at once and send them to the operator together
+        Returns whether each transfer was accepted (rejected tokens stay in our purse)
+        """
+        with self._transfer_time.time():
+            purse = {t.uid: t for t in self.purse}
+            results = {}
+            batch = []  # Ordered list of (user address, Token) to sign
+            for user_address, token_uid in transfers:
+                if token_uid in results.keys():
+                    continue  # Already in this batch
+                if token_uid not in purse.keys():
+                    results[token_uid] = False  # Not in wallet
+                    continue
+                results[token_uid] = None
+                batch.append((user_address, purse[token_uid]))
+
+            blk_num = self.chain_height.update()
+            transactions = self._sign_transfers(batch, blk_num)
+            for (_, token), transaction in zip(batch, transactions):
+                token.addTransaction(transaction)
+            accepted = self._operator.addTransactions(transactions)
+            if not all(accepted) and self.chain_height.update() != blk_num:
+                # A block was published since we signed them, so sign the rejected ones for the next one
+                retry = [(t, b) for t, b, a in zip(transactions, batch, accepted) if not a]
+                transactions = self._sign_transfers([b for _, b in retry], self.chain_height.height)
+                for (_, (_, token)), transaction in zip(retry, transactions):
+                    token.history[-1] = transaction
+                retried = iter(self._operator.addTransactions(transactions))
+                accepted = [a or next(retried) for a in accepted]
+
+            for (_, token), ok in zip(batch, accepted):
+                self._transfers.inc(result='accepted' if ok else 'rejected')
+                if not ok:
+                    token.history.pop()  # Never happened
+                results[token.uid] = ok
+            self.purse = [t for t in self.purse if not results.get(t.uid)]
+            return results
+
+    def _sign_transfers(self, batch, blk_num) -> List[Transaction]:
+        transactions = [
+            Transaction(
+                self._rpc_cache.chain_id,
+                self._rootchain.address,
+                blk_num,
+                token.uid,
+                user_address,
+            )
+            for user_address, token in batch
+        ]
+        # NOTE Build every message up front, so only the signing is farmed out
+        signatures = self.signer_pool.sign([transaction.msg for transaction in transactions])
+        for transaction, signature in zip(transactions, signatures):
+            transaction.add_signature(signature)
+        return transactions
+
+    def _sign_transfer(self, user_address, token_uid, blk_num) -> Transaction:
+        transaction = Transaction(
+                self._rpc_cache.chain_id,
+                self._rootchain.address,
+                blk_num,
+                token_uid,
+                user_address
+            )
+        # TODO: Use eth_signTypedData method when eth-tester supports it
+        signature = self._acct.sign_message(transaction.msg)
+        signature = (signature.v, signature.r, signature.s)
+        transaction.add_signature(signature)
+        return transaction
+
     def receive(self, user_address, token):
         # NOTE This is big no-no for messaging
-        # TODO Validate history
+        if not token.valid:
+            return False
+        # NOTE Only a range bigger than the coin actually is could hurt us
+        if token.is_range and \
+                self._rootchain.functions.deposits__size(token.uid).call() != token.end - token.uid:
+            return False
+        # Check the history against the published roots
+        for transaction in token.history:
+            if self.verifier.root(transaction.prevBlkNum) is None:
+                continue  # Not published yet
+            if not self._verify(transaction):
+                return False
         self.purse.append(token)
         # TODO Listen for transaction success from operator
         # TODO Add listener to challenge withdraws for this token
         return True  # Return acceptance status to sender
 
+    def receive_stream(self, user_address, token_uid, chunks: Iterable[bytes], end: int=None) -> bool:
+        """
+        Same as receive, but the history comes in as chunks (see `stream_history`)
+        Each transaction is checked as soon as it arrives, and we stop reading at the first bad one
+        """
+        reader = HistoryReader(
+                self._rpc_cache.chain_id,
+                self._rootchain.address,
+                token_uid,
+                self.verifier,
+            )
+        if not read_history(reader, chunks):
+            return False
+        token = reader.token(end=end)
+        # NOTE Only a range bigger than the coin actually is could hurt us
+        if token.is_range and \
+                self._rootchain.functions.deposits__size(token.uid).call() != token.end - token.uid:
+            return False
+        self.purse.append(token)
+        return True  # Return acceptance status to sender
+
     def withdraw(self, token_uid):
         token = next((t for t in self.purse if t.uid == token_uid), None)
         if token.status is TokenStatus.DEPOSIT:
-            txn_hash = self._rootchain.functions.withdraw(token_uid).transact({'from': self.address})
-            self._w3.eth.waitForTransactionReceipt(txn_hash)  # FIXME Shouldn't have to wait
+            with self.metrics.span('l1.withdraw', token=token_uid):
+                txn_hash = self._rootchain.functions.withdraw(token_uid).transact({'from': self.address})
+                self._receipts.wait(txn_hash)  # FIXME Shouldn't have to wait
 
             self.tokens_in_deposit.remove(token_uid)
             token.finalize_withdrawal()
@@ -174,25 +491,159 @@ class User:
             exitProof = self._operator.get_branch(exit.tokenId, exit.prevBlkNum)
 
             # We can start the exit now
-            txn_hash = self._rootchain.functions.startExit(
-                parent.to_tuple,
-                parentProof,
-                exit.to_tuple,
-                exitProof,
-            ).transact({'from': self.address})
-            self._w3.eth.waitForTransactionReceipt(txn_hash)  # FIXME Shouldn't have to wait
+            with self.metrics.span('l1.startExit', token=token_uid):
+                txn_hash = transact(
+                    self._rootchain.functions.startExit,
+                    (parent.to_tuple, parentProof, exit.to_tuple, exitProof),
+                    {'from': self.address},
+                )
+                receipt = self._receipts.wait(txn_hash)
 
             token.set_in_withdrawal()
-            # TODO Add listener for challenges to withdraw
-            # TODO Add listener to alert for successful, non-interactive challenges
-            # TODO Add callback to finalize after challenge period is over
+            self.tokens_in_withdrawal[token_uid] = token
+            # Finalize it once the challenge period is over
+            if self._challenge_period is None:
+                self._challenge_period = self._rootchain.functions.challengePeriod().call()
+            exit_time = self._w3.eth.getBlock(receipt['blockNumber'])['timestamp']
+            self.exit_scheduler.schedule(token_uid, exit_time + self._challenge_period)
 
     def finalize(self, token_uid):
+        with self.metrics.span('l1.finalizeExit', token=token_uid):
+            txn_hash = self._rootchain.functions.finalizeExit(token_uid).transact({'from': self.address})
+            receipt = self._receipts.wait(txn_hash)
+        self._finish_exit(token_uid, receipt)
+
+    def _finish_exit(self, token_uid, receipt):
+        # NOTE Token might not be in our purse anymore (e.g. after a restart)
         token = next((t for t in self.purse if t.uid == token_uid), None)
-        txn_hash = self._rootchain.functions.finalizeExit(token_uid).transact({'from': self.address})
-        receipt = self._w3.eth.waitForTransactionReceipt(txn_hash)
-        if self._rootchain.events.ExitFinished(receipt).event_name == 'ExitFinished':
-            token.finalize_withdrawal()
-        else:
+        if token:
+            if self._rootchain.events.ExitFinished().processReceipt(receipt, errors=DISCARD):
+                token.finalize_withdrawal()
+            else:
+                token.cancel_withdrawal()
+        self.tokens_in_withdrawal.pop(token_uid, None)
+        # NOTE Only forget the exit once it's done, so it's retried if anything failed before
+        self.exit_scheduler.cancel(token_uid)
+
+    def finalizeExits(self, nonce: int=None):
+        """
+        Finalize every exit whose challenge period is over (all at once)
+        NOTE Pass `nonce` if we sent anything else that isn't mined yet
+        """
+        deadline = self.exit_scheduler.next_deadline
+        if deadline is None:
+            return
+        now = self._w3.eth.getBlock('latest')['timestamp']
+        if now < deadline:
+            return  # Nothing to do until the earliest exit is ready
+        # NOTE Finalizing a challenged exit would cancel it, so wait for our response first
+        ripe = [token_uid for token_uid in self.exit_scheduler.ripe(now)
+                if not self.challenges.get(token_uid)]
+        if not ripe:
+            return
+        # Manual nonce management so finalizations go out back to back
+        nonce = self._next_nonce(nonce)
+        sent = []
+        for token_uid in ripe:
+            try:
+                with self.metrics.span('l1.finalizeExit', token=token_uid):
+                    txn_hash = self._rootchain.functions.finalizeExit(token_uid).transact(
+                        {'from': self.address, 'nonce': nonce})
+            except Exception:
+                # Stays scheduled, so it's tried again next time
+                logger.exception("Could not finalize exit of token %d!", token_uid)
+                continue
+            sent.append((token_uid, txn_hash))
+            nonce += 1
+        with self.exit_scheduler.batch():  # NOTE One save for all of them
+            for token_uid, txn_hash in sent:
+                self._finish_exit(token_uid, self._receipts.wait(txn_hash))
+
+    def _is_exiting(self, token_uid) -> bool:
+        return token_uid in self.tokens_in_withdrawal.keys() or token_uid in self.exit_scheduler
+
+    def handleExitCancelled(self, log):
+        """
+        Callback for event when someone cancels an exit (with a valid challenge)
+        """
+        token_uid = log.args['tokenId']
+        if not self._is_exiting(token_uid):
+            return  # Not one of our exits
+        self.exit_scheduler.cancel(token_uid)
+        token = self.tokens_in_withdrawal.pop(token_uid, None)
+        if token:
             token.cancel_withdrawal()
-        # TODO Cancel listener to challenge withdraws for this token
+
+    def handleChallenge(self, log):
+        """
+        Callback for event when someone challenges an exit
+        """
+        token_uid = log.args['tokenId']
+        if not self._is_exiting(token_uid):
+            return  # Not one of our exits
+        self.exit_scheduler.challenge(token_uid, log.args['blkNum'])
+        self._responses.append((token_uid, log.args['blkNum']))
+
+    def handleChallengeCancelled(self, log):
+        """
+        Callback for event when a challenge to an exit was responded to
+        """
+        self.exit_scheduler.unchallenge(log.args['tokenId'], log.args['blkNum'])
+
+    def find_response(self, token_uid, blk_num) -> Transaction:
+        """
+        Find the transaction in our history that spent the challenging one
+        (the first one in a block after the challenge)
+        """
+        if token_uid not in self.tokens_in_withdrawal.keys():
+            return None  # Don't know its history (e.g. not in our purse after a restart)
+        history = self.tokens_in_withdrawal[token_uid].history
+        # NOTE History is ordered by prevBlkNum, so binary search it
+        lo, hi = 0, len(history)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if history[mid].prevBlkNum <= blk_num:
+                lo = mid + 1
+            else:
+                hi = mid
+        return history[lo] if lo < len(history) else None
+
+    def _next_nonce(self, nonce: int=None) -> int:
+        """ `nonce` if we have one already, else the next one after our unmined transactions """
+        if nonce is not None:
+            return nonce
+        return self._w3.eth.getTransactionCount(self.address, 'pending')
+
+    def respondChallenges(self, nonce: int=None) -> int:
+        """
+        Submit responses for all the challenges waiting on one, without waiting
+        for any of them to be mined
+        Returns the nonce to send our next transaction with (None if we didn't need one)
+        """
+        # NOTE Each is dropped once sent (or if it can't be), so one bad response can't hold up the rest
+        while self._responses:
+            token_uid, blk_num = self._responses.pop(0)
+            response = self.find_response(token_uid, blk_num)
+            if not response:
+                logger.warning("Cannot respond to challenge of token %d in block %d!", token_uid, blk_num)
+                continue
+            # Manual nonce management so responses go out back to back
+            nonce = self._next_nonce(nonce)
+            try:
+                with self.metrics.span('l1.respondChallenge', token=token_uid):
+                    transact(
+                        self._rootchain.functions.respondChallenge,
+                        (
+                            response.to_tuple,
+                            self._operator.get_branch(token_uid, response.prevBlkNum),
+                            blk_num,
+                        ),
+                        {'from': self.address, 'nonce': nonce},
+                    )
+            except Exception:
+                # NOTE e.g. already answered, or the exit was cancelled
+                logger.exception("Could not respond to challenge of token %d in block %d!",
+                                 token_uid, blk_num)
+                continue
+            nonce += 1
+        return nonce
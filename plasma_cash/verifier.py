@@ -0,0 +1,69 @@
+from typing import Sequence
+
+from eth_typing import AnyAddress, Hash32
+
+from trie.smt import calc_root
+
+from web3 import Web3
+
+from .contracts import rootchain_interface
+from .height import ChildChainTracker
+from .proof import Proof
+from .smt import to_bytes32
+from .transaction import Transaction
+
+
+EMPTY_ROOT = b'\x00' * 32  # childChain root of a block that isn't published yet
+
+
+class Verifier:
+    """
+    Checks inclusion proofs of transactions against the roots published on the rootchain
+    NOTE Each root is fetched once (roots never change after being published),
+         and each transaction is only checked once
+    """
+
+    def __init__(self,
+                 w3: Web3,
+                 rootchain_address: AnyAddress,
+                 tracker: ChildChainTracker=None):
+        self._rootchain = w3.eth.contract(rootchain_address, **rootchain_interface)
+        self._tracker = tracker  # Roots we already know of (without asking the rootchain)
+        self.roots = {}  # Dict mapping blkNum to published root
+        self._verified = set()  # Set of (tokenId, blkNum, txn hash) that were proven
+
+    def root(self, blk_num: int) -> Hash32:
+        """ Published root of a block (None if not published yet) """
+        if blk_num not in self.roots.keys():
+            root = self._tracker.root(blk_num) if self._tracker else None
+            if root is None:
+                root = self._rootchain.functions.childChain(blk_num).call()
+            if root == EMPTY_ROOT:
+                return None  # Don't cache, it will be published later
+            self.roots[blk_num] = root
+        return self.roots[blk_num]
+
+    def is_verified(self, transaction: Transaction) -> bool:
+        key = (transaction.tokenId, transaction.prevBlkNum, transaction.msg_hash)
+        return key in self._verified
+
+    def verify(self, transaction: Transaction, proof: Sequence[Hash32]) -> bool:
+        """
+        Check the transaction is included in the block it was sent in
+        (fails if that block isn't published yet)
+        """
+        key = (transaction.tokenId, transaction.prevBlkNum, transaction.msg_hash)
+        if key in self._verified:
+            return True
+        root = self.root(transaction.prevBlkNum)
+        if root is None:
+            return False
+        path = to_bytes32(transaction.tokenId)
+        if isinstance(proof, Proof):
+            proof_root = proof.calc_root(path, transaction.msg_hash)
+        else:
+            proof_root = calc_root(path, transaction.msg_hash, proof)
+        if proof_root != root:
+            return False
+        self._verified.add(key)
+        return True
@@ -0,0 +1,165 @@
+"""
+Write-ahead log of the transactions an Operator accepted
+
+Every accepted transaction is appended (with the block it goes in) and made
+durable before the operator acknowledges it. Callers that log at the same
+time share one fsync (group commit): whoever syncs first writes everything
+buffered so far, and the others just wait for it to finish.
+
+The log only needs to cover what happened since the last snapshot, so it is
+truncated every time the operator takes one. Any torn record at the end
+(from a crash mid-write) is dropped when the log is opened.
+"""
+import os
+import struct
+import threading
+import zlib
+
+from typing import Dict, Iterator, List, Tuple
+
+from eth_typing import AnyAddress
+from eth_utils import to_canonical_address
+
+from .transaction import Transaction
+
+
+MAGIC = b'PLSMAWAL'
+VERSION = 1
+
+# Header: magic, version, chain id, rootchain address
+HEADER = struct.Struct('>8sHQ20s')
+
+# Record: blkNum, transaction (see `Transaction.to_bytes`), crc32 of both
+RECORD = struct.Struct('>Q192sI')
+
+COMMIT_BYTES = 1 << 20  # Stop waiting for more records once this much is buffered
+
+
+class WriteAheadLog:
+
+    def __init__(self,
+                 path: str,
+                 chain_id: int,
+                 rootchain_address: AnyAddress,
+                 commit_delay: float=0.0,
+                 commit_bytes: int=COMMIT_BYTES):
+        self.path = path
+        self._chain_id = chain_id
+        self._rootchain_address = rootchain_address
+        self.commit_delay = commit_delay  # Seconds to wait for more records before syncing
+        self.commit_bytes = commit_bytes
+        self._header = HEADER.pack(
+                MAGIC,
+                VERSION,
+                chain_id,
+                to_canonical_address(rootchain_address),
+            )
+
+        self._cond = threading.Condition()
+        self._buffer = bytearray()  # Records appended, but not written yet
+        self._appended = 0  # Number of records appended
+        self._synced = 0  # Number of records that are durable
+        self._syncing = False  # Whether someone is writing the buffer out
+        self.syncs = 0  # Number of fsyncs done (for instrumentation)
+
+        if os.path.exists(self.path):
+            self._file = open(self.path, 'r+b')
+            assert self._file.read(HEADER.size) == self._header, \
+                    "Log is for a different chain or rootchain!"
+            # Drop anything after the last complete record
+            end = HEADER.size + len(self._read_records()) * RECORD.size
+            self._file.truncate(end)
+        else:
+            self._file = open(self.path, 'w+b')
+            self._file.write(self._header)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _read_records(self) -> List[Tuple[int, bytes]]:
+        self._file.seek(HEADER.size)
+        records = []
+        while True:
+            data = self._file.read(RECORD.size)
+            if len(data) < RECORD.size:
+                break  # Torn write
+            blk_num, txn_bytes, crc = RECORD.unpack(data)
+            if zlib.crc32(data[:-4]) != crc:
+                break  # Torn write
+            records.append((blk_num, txn_bytes))
+        return records
+
+    def records(self) -> Iterator[Tuple[int, Transaction]]:
+        """ Every durable (blkNum, transaction) in the log, in the order they were logged """
+        self.sync()
+        with self._cond:
+            records = self._read_records()
+        for blk_num, txn_bytes in records:
+            yield blk_num, Transaction.from_bytes(
+                    self._chain_id,
+                    self._rootchain_address,
+                    txn_bytes,
+                )
+
+    def archive(self) -> Dict[int, List[Transaction]]:
+        """ Transactions in the log for each block (to replay blocks published since) """
+        archive = {}
+        for blk_num, txn in self.records():
+            archive.setdefault(blk_num, []).append(txn)
+        return archive
+
+    def append(self, blk_num: int, transaction: Transaction) -> int:
+        """ Add a record (not durable until synced), returning its sequence number """
+        data = struct.pack('>Q192s', blk_num, transaction.to_bytes)
+        with self._cond:
+            self._buffer += data + struct.pack('>I', zlib.crc32(data))
+            self._appended += 1
+            if len(self._buffer) >= self.commit_bytes:
+                self._cond.notify_all()  # Don't make the syncer wait any longer
+            return self._appended
+
+    def sync(self, seq: int=None):
+        """ Wait until record `seq` (default everything appended so far) is durable """
+        with self._cond:
+            seq = self._appended if seq is None else seq
+            while self._synced < seq:
+                if self._syncing:
+                    self._cond.wait()  # Someone else is syncing, maybe for us too
+                    continue
+                self._syncing = True
+                try:
+                    if self.commit_delay and len(self._buffer) < self.commit_bytes:
+                        self._cond.wait(self.commit_delay)  # Let others join in
+                    data, self._buffer = bytes(self._buffer), bytearray()
+                    target = self._appended
+                    # Do the IO without holding the lock, so others can keep appending
+                    self._cond.release()
+                    try:
+                        self._file.seek(0, os.SEEK_END)
+                        self._file.write(data)
+                        self._file.flush()
+                        os.fsync(self._file.fileno())
+                    finally:
+                        self._cond.acquire()
+                    self._synced = target
+                    self.syncs += 1
+                finally:
+                    self._syncing = False
+                    self._cond.notify_all()
+
+    def log(self, blk_num: int, transaction: Transaction):
+        """ Add a record, and wait for it to be durable """
+        self.sync(self.append(blk_num, transaction))
+
+    def truncate(self):
+        """ Drop every record (e.g. once they are all in a snapshot) """
+        self.sync()
+        with self._cond:
+            while self._syncing:
+                self._cond.wait()  # Let any write in progress finish first
+            self._file.truncate(HEADER.size)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self.sync()
+        self._file.close()
@@ -0,0 +1,173 @@
+import logging
+
+from bisect import bisect_left
+from typing import List
+
+from eth_abi import decode_abi
+from eth_account import Account
+from eth_typing import AnyAddress, ChecksumAddress
+from eth_utils import function_abi_to_4byte_selector
+from hexbytes import HexBytes
+
+from web3 import Web3
+
+from .contracts import rootchain_interface
+from .events import get_dispatcher
+from .operator import Operator
+from .proof import transact
+from .rpc import get_cache
+from .signing import add_signer
+from .transaction import Transaction
+
+
+TRANSACTION_TYPE = '(address,uint256,uint256,uint256,uint256,uint256)'
+START_EXIT_TYPES = [TRANSACTION_TYPE, 'bytes32[256]', TRANSACTION_TYPE, 'bytes32[256]']
+
+
+logger = logging.getLogger(__name__)
+
+
+class Watchtower:
+    """
+    Watches every exit on the rootchain, and challenges the fraudulent ones
+    for any token on our watchlist (using the history we know for that token)
+    """
+
+    def __init__(self,
+                 w3: Web3,
+                 rootchain_address: AnyAddress,
+                 operator: Operator,
+                 private_key: bytes):
+        self._w3 = w3
+        self._rootchain = self._w3.eth.contract(rootchain_address, **rootchain_interface)
+        self._operator = operator
+        self._acct = Account.from_key(private_key)
+        # Allow web3 to autosign with account
+        add_signer(self._w3, self._acct)
+        self._chain_id = get_cache(self._w3).chain_id
+        self._start_exit_selector = function_abi_to_4byte_selector(
+                next(abi for abi in self._rootchain.abi if abi.get('name') == 'startExit')
+            )
+        # Watchlist
+        self.histories = {}  # Dict mapping tokenId to known history
+        self._positions = {}  # Dict mapping tokenId to dict of txn hash to position in history
+        self._blocks = {}  # Dict mapping tokenId to ordered list of prevBlkNum of each txn in history
+        self.challenges = []  # Hashes of the challenges we've submitted
+        # Add listeners (dict of subscriptions: callbacks)
+        # NOTE One subscription for the whole watchlist
+        self._events = get_dispatcher(self._w3, self._rootchain.address)
+        self.listeners = {}
+        self.listeners[
+                self._events.subscribe('ExitStarted', self._w3.eth.blockNumber)
+            ] = self.checkExit
+
+    @property
+    def address(self) -> ChecksumAddress:
+        return self._acct.address
+
+    # TODO Make this async loop
+    def monitor(self):
+        self._events.poll()
+        for subscription, callback_fn in self.listeners.items():
+            for log in subscription.drain():
+                callback_fn(log)
+
+    def watch(self, token_uid: int, history: List[Transaction]):
+        """ Add (or replace) the history we know for a token """
+        self.histories[token_uid] = list(history)
+        self._positions[token_uid] = {txn.msg_hash: i for i, txn in enumerate(history)}
+        self._blocks[token_uid] = [txn.prevBlkNum for txn in history]
+
+    def record(self, token_uid: int, transaction: Transaction):
+        """ Add a new transaction to the history of a token we are watching """
+        assert token_uid in self.histories.keys(), "Not watching this token!"
+        self._positions[token_uid][transaction.msg_hash] = len(self.histories[token_uid])
+        self.histories[token_uid].append(transaction)
+        self._blocks[token_uid].append(transaction.prevBlkNum)
+
+    def unwatch(self, token_uid: int):
+        self.histories.pop(token_uid, None)
+        self._positions.pop(token_uid, None)
+        self._blocks.pop(token_uid, None)
+
+    def _get_exit(self, log):
+        """ Get the exiting transaction (and its parent) from the call that started the exit """
+        txn = self._w3.eth.getTransaction(log.transactionHash)
+        # NOTE eth-tester calls the input 'data'
+        data = HexBytes(txn['input'] if 'input' in txn.keys() else txn['data'])
+        if data[:4] != self._start_exit_selector:
+            return None, None  # Exit wasn't started by calling us directly
+        prev_txn, _, exit_txn, _ = decode_abi(START_EXIT_TYPES, data[4:])
+
+        def to_transaction(txn_tuple):
+            newOwner, tokenId, prevBlkNum, sigV, sigR, sigS = txn_tuple
+            return Transaction(
+                    self._chain_id,
+                    self._rootchain.address,
+                    prevBlkNum,
+                    tokenId,
+                    Web3.toChecksumAddress(newOwner),
+                    sigV,
+                    sigR,
+                    sigS,
+                )
+
+        return to_transaction(prev_txn), to_transaction(exit_txn)
+
+    def find_challenge(self, token_uid: int, prev_txn: Transaction, exit_txn: Transaction):
+        """
+        Find the transaction from our history that challenges this exit, if any
+        """
+        history = self.histories[token_uid]
+        positions = self._positions[token_uid]
+
+        # Exit of a transaction we know of is fraudulent if it was spent afterwards
+        i = positions.get(exit_txn.msg_hash)
+        if i is not None:
+            if i + 1 < len(history):
+                return history[i + 1]  # challengeAfter
+            return None  # Exit of the latest transaction, all good!
+
+        # Parent was spent by something other than the exit
+        j = positions.get(prev_txn.msg_hash)
+        if j is not None:
+            if j + 1 < len(history) and history[j + 1].prevBlkNum < exit_txn.prevBlkNum:
+                return history[j + 1]  # challengeBetween
+            # NOTE Exit of a spend we haven't recorded yet, nothing to challenge it with
+            return None
+
+        # We don't know this history, so challenge with what came before it
+        k = bisect_left(self._blocks[token_uid], prev_txn.prevBlkNum)
+        if k > 0:
+            return history[k - 1]  # challengeBefore
+        return None
+
+    def checkExit(self, log):
+        token_uid = log.args['tokenId']
+        if token_uid not in self.histories.keys():
+            return  # Not on our watchlist
+
+        prev_txn, exit_txn = self._get_exit(log)
+        if not exit_txn:
+            logger.warning("Could not decode exit of token %d!", token_uid)
+            return
+
+        challenge = self.find_challenge(token_uid, prev_txn, exit_txn)
+        if not challenge:
+            return
+
+        # NOTE The rest of the exits we were told about still need checking if this fails
+        try:
+            txn_hash = transact(
+                    self._rootchain.functions.challengeExit,
+                    (
+                        challenge.to_tuple,
+                        self._operator.get_branch(token_uid, challenge.prevBlkNum),
+                        challenge.prevBlkNum,
+                    ),
+                    {'from': self.address},
+                )
+        except Exception:
+            logger.exception("Could not challenge exit of token %d!", token_uid)
+            return
+        self.challenges.append(txn_hash)
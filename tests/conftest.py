@@ -1,6 +1,8 @@
 import pytest
 import vyper
 
+from types import SimpleNamespace
+
 from eth_account import Account
 from eth_tester.backends.pyevm.main import get_default_account_keys
 
@@ -10,6 +12,7 @@ from plasma_cash import (
     Token,
     User,
 )
+from plasma_cash.scenario import ChainSnapshot
 
 
 DEFAULT_KEYS = get_default_account_keys()
@@ -63,45 +66,53 @@ def pytest_configure(config):
 # NOTE This should come for free with pytest-ethereum
 from web3 import Web3, EthereumTesterProvider
 from eth_tester.backends.pyevm import main
-@pytest.fixture
-def w3():
+def make_w3():
     # Monkeypatch
     main.GENESIS_GAS_LIMIT = 6283184 # FIXME 2x'd this from 3141592
     return Web3(EthereumTesterProvider())
 
-# NOTE Replace with pytest-ethereum mining API
 @pytest.fixture
-def mine(w3):
+def w3():
+    return make_w3()
+
+# NOTE Replace with pytest-ethereum mining API
+def make_miner(w3):
     def _mine(numBlocks=1):
         w3.provider.ethereum_tester.mine_blocks(numBlocks)
     return _mine
 
-
 @pytest.fixture
-def token_contract(w3):
+def mine(w3):
+    return make_miner(w3)
+
+
+def deploy(w3, interface, *args):
     # NOTE Operator "deploys" this contract (for testing)
-    txn_hash = w3.eth.contract(**token_interface).constructor().transact()
+    txn_hash = w3.eth.contract(**interface).constructor(*args).transact()
     address = w3.eth.waitForTransactionReceipt(txn_hash)['contractAddress']
-    return w3.eth.contract(address, **token_interface)
+    return w3.eth.contract(address, **interface)
+
+@pytest.fixture
+def token_contract(w3):
+    return deploy(w3, token_interface)
 
 
 @pytest.fixture
 def rootchain_contract(w3, token_contract):
-    # NOTE Operator "deploys" this contract (for testing)
-    txn_hash = w3.eth.contract(**rootchain_interface).constructor(token_contract.address).transact()
-    address = w3.eth.waitForTransactionReceipt(txn_hash)['contractAddress']
-    return w3.eth.contract(address, **rootchain_interface)
+    return deploy(w3, rootchain_interface, token_contract.address)
 
 
-@pytest.fixture
-def operator(w3, rootchain_contract):
+def make_operator(w3, rootchain_contract):
     for i, a in enumerate(w3.eth.accounts):
         assert DEFAULT_ACCOUNTS[i] == a
     return Operator(w3, rootchain_contract.address, DEFAULT_KEYS[0])
 
-
 @pytest.fixture
-def users(w3, token_contract, rootchain_contract, operator):
+def operator(w3, rootchain_contract):
+    return make_operator(w3, rootchain_contract)
+
+
+def make_users(w3, token_contract, rootchain_contract, operator):
     # Mint the first user a token
     t = Token(123)
     token_contract.functions.mint(w3.eth.accounts[1], t.uid).transact()
@@ -111,3 +122,46 @@ def users(w3, token_contract, rootchain_contract, operator):
              for k in DEFAULT_KEYS[1:]]  # Skip operator account
     users[0].purse.append(t)
     return users
+
+@pytest.fixture
+def users(w3, token_contract, rootchain_contract, operator):
+    users = make_users(w3, token_contract, rootchain_contract, operator)
+    yield users
+    for user in users:
+        user.close()
+
+
+# Scenarios share one chain for the whole session (see `scenario`)
+@pytest.fixture(scope='session')
+def chain():
+    w3 = make_w3()
+    token_contract = deploy(w3, token_interface)
+    rootchain_contract = deploy(w3, rootchain_interface, token_contract.address)
+    operator = make_operator(w3, rootchain_contract)
+    chain = SimpleNamespace(
+            w3=w3,
+            mine=make_miner(w3),
+            token_contract=token_contract,
+            rootchain_contract=rootchain_contract,
+            operator=operator,
+            users=make_users(w3, token_contract, rootchain_contract, operator),
+            snapshots={},  # Dict mapping setup function to snapshot after running it
+        )
+    chain.genesis = ChainSnapshot(w3, chain.operator, chain.users)
+    return chain
+
+@pytest.fixture
+def scenario(chain):
+    """
+    `scenario(setup)` gives the chain after `setup(chain)` ran on it
+    NOTE Setup only runs the first time, after that it reverts to a snapshot of the result
+    """
+    def _scenario(setup):
+        if setup in chain.snapshots.keys():
+            chain.snapshots[setup].revert()
+        else:
+            chain.genesis.revert()
+            setup(chain)
+            chain.snapshots[setup] = ChainSnapshot(chain.w3, chain.operator, chain.users)
+        return chain
+    return _scenario
@@ -11,20 +11,28 @@ PLASMA_SYNC_PERIOD = 7
 PLASMA_WITHDRAW_PERIOD = 7
 
 
-def test_challengeAfter(w3, mine, operator, rootchain_contract, users):
+def deposited(chain):
+    """ u1 deposits their token (every test starts from here) """
+    u1 = chain.users[0]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        chain.mine()
+        chain.operator.monitor()  # FIXME Remove when async
+        u1.monitor()  # FIXME Remove when async
+
+
+def test_challengeAfter(scenario):
     """
     A challenger notices a coin spend occured
     after a withdrawal was initiated
     """
-    # Setup (u1 has tokens, u2, u3 does not)
-    u1, u2, u3 = users[:3]
+    # Setup (u1 has deposited their token, u2, u3 does not have any)
+    chain = scenario(deposited)
+    w3, mine, operator, rootchain_contract = \
+            chain.w3, chain.mine, chain.operator, chain.rootchain_contract
+    u1, u2, u3 = chain.users[:3]
     token = u1.purse[0]
-    # u1 deposits their token
-    u1.deposit(token.uid)
-    while not token.transferrable:
-        mine()
-        operator.monitor()  # FIXME Remove when async
-        u1.monitor()  # FIXME Remove when async
 
     # u1 gives token to u2
     u1.transfer(u2.address, token.uid)
@@ -62,22 +70,19 @@ def test_challengeAfter(w3, mine, operator, rootchain_contract, users):
     assert log.args.tokenId == token.uid
     
 
-def test_challengeBetween(w3, mine, operator, rootchain_contract, users):
+def test_challengeBetween(scenario):
     """
     A challenger notices a coin spend occured
     between the exit and the parent, where
     the exit occurs after the challenge
     (double spend attack)
     """
-    # Setup (u1 has tokens, u2, u3 does not)
-    u1, u2, u3 = users[:3]
+    # Setup (u1 has deposited their token, u2, u3 does not have any)
+    chain = scenario(deposited)
+    w3, mine, operator, rootchain_contract = \
+            chain.w3, chain.mine, chain.operator, chain.rootchain_contract
+    u1, u2, u3 = chain.users[:3]
     token = u1.purse[0]
-    # u1 deposits their token
-    u1.deposit(token.uid)
-    while not token.transferrable:
-        mine()
-        operator.monitor()  # FIXME Remove when async
-        u1.monitor()  # FIXME Remove when async
 
     # u1 gives token to u2
     u1.transfer(u2.address, token.uid)
@@ -115,21 +120,18 @@ def test_challengeBetween(w3, mine, operator, rootchain_contract, users):
     assert log.args.tokenId == token.uid
 
 
-def test_challengeBefore_invalidHistory(w3, mine, operator, rootchain_contract, users):
+def test_challengeBefore_invalidHistory(scenario):
     """
     A challenger notices a coin exit with
     invalid history, so they begin an interactive
     challenge with the exiting user to falsify the exit
     """
-    # Setup (u1 has tokens, u2, u3 does not)
-    u1, u2, u3 = users[:3]
+    # Setup (u1 has deposited their token, u2, u3 does not have any)
+    chain = scenario(deposited)
+    w3, mine, operator, rootchain_contract = \
+            chain.w3, chain.mine, chain.operator, chain.rootchain_contract
+    u1, u2, u3 = chain.users[:3]
     token = u1.purse[0]
-    # u1 deposits their token
-    u1.deposit(token.uid)
-    while not token.transferrable:
-        mine()
-        operator.monitor()  # FIXME Remove when async
-        u1.monitor()  # FIXME Remove when async
 
     # u1 never sends the token to anyone
 
@@ -193,21 +195,18 @@ def test_challengeBefore_invalidHistory(w3, mine, operator, rootchain_contract,
     assert log.args.tokenId == token.uid
 
 
-def test_challengeBefore_validHistory(w3, mine, operator, rootchain_contract, users):
+def test_challengeBefore_validHistory(scenario):
     """
     A malicious challenger notices a coin exit with
     history they have, so they begin an interactive
     challenge with the exiting user to attempt to censor
     """
-    # Setup (u1 has tokens, u2, u3 does not)
-    u1, u2, u3 = users[:3]
+    # Setup (u1 has deposited their token, u2, u3 does not have any)
+    chain = scenario(deposited)
+    w3, mine, operator, rootchain_contract = \
+            chain.w3, chain.mine, chain.operator, chain.rootchain_contract
+    u1, u2, u3 = chain.users[:3]
     token = u1.purse[0]
-    # u1 deposits their token
-    u1.deposit(token.uid)
-    while not token.transferrable:
-        mine()
-        operator.monitor()  # FIXME Remove when async
-        u1.monitor()  # FIXME Remove when async
 
     # u1 gives token to u2
     u1.transfer(u2.address, token.uid)
@@ -262,3 +261,61 @@ def test_challengeBefore_validHistory(w3, mine, operator, rootchain_contract, us
         mine()
     u1.finalize(token.uid)
     assert not token.deposited
+
+
+def test_challengeBefore_autoRespond(scenario):
+    """
+    The exiting user notices the interactive challenge
+    on their own, and responds to it automatically
+    """
+    # Setup (u1 has deposited their token, u2, u3 does not have any)
+    chain = scenario(deposited)
+    w3, mine, operator, rootchain_contract = \
+            chain.w3, chain.mine, chain.operator, chain.rootchain_contract
+    u1, u2, u3 = chain.users[:3]
+    token = u1.purse[0]
+
+    # u1 gives token to u2
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)  # FIXME Remove when messaging implementated
+    logger = rootchain_contract.events.BlockPublished.createFilter(fromBlock=w3.eth.blockNumber)
+    while len(logger.get_all_entries()) < 2:
+        mine()
+        operator.monitor()  # FIXME Remove when async
+
+    # u2 has token, sends it to u3
+    u2.transfer(u3.address, token.uid)
+    u3.purse.append(token)  # FIXME Remove when messaging implementated
+    while len(logger.get_all_entries()) < 3:
+        mine()
+        operator.monitor()  # FIXME Remove when async
+
+    u3.withdraw(token.uid)
+
+    # Someone challenges that with older history
+    rootchain_contract.functions.challengeExit(
+            token.history[0].to_tuple,
+            operator.get_branch(token.uid, token.history[0].prevBlkNum),
+            token.history[0].prevBlkNum,
+        ).transact()
+
+    # u3 responds with the transaction that spent it
+    # NOTE Even after a response that can't go through (nothing to respond to)
+    u3._responses.append((token.uid, token.history[1].prevBlkNum))
+    logger = rootchain_contract.events.ChallengeCancelled.createFilter(fromBlock=w3.eth.blockNumber)
+    u3.monitor()
+    assert not u3._responses
+    assert u3.challenges[token.uid] == {token.history[0].prevBlkNum}
+    mine()
+    u3.monitor()
+    assert not u3.challenges.get(token.uid)
+
+    # Interactive challenge was responded!
+    log = logger.get_all_entries()[0]
+    assert log.args.tokenId == token.uid
+
+    # Our token is withdrawn automatically (after the challenge period is over)!
+    while w3.eth.blockNumber < 20:
+        mine()
+    u3.monitor()
+    assert not token.deposited
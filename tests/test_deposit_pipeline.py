@@ -0,0 +1,58 @@
+# Test depositing many tokens at once without waiting on each step
+from plasma_cash import (
+    Token,
+    TokenStatus,
+)
+
+
+def test_deposit_many(w3, mine, operator, token_contract, rootchain_contract, users):
+    u1 = users[0]
+    for uid in range(1000, 1005):
+        token_contract.functions.mint(u1.address, uid).transact()
+        u1.purse.append(Token(uid))
+    tokens = list(u1.purse)
+
+    # Everything is sent at once (approval included)
+    u1.deposit_many([t.uid for t in tokens])
+    assert len(u1.pending_deposit_txns) == len(tokens)
+    assert token_contract.functions.isApprovedForAll(u1.address, rootchain_contract.address).call()
+
+    assert not u1._approved  # Not until we've seen it go through
+
+    # Statuses are updated as the receipts come in
+    u1.monitor()
+    assert u1._approved
+    assert all(t.status is TokenStatus.DEPOSIT for t in tokens)
+    while not all(t.transferrable for t in tokens):
+        mine()
+        operator.monitor()
+        u1.monitor()
+    assert all(operator.is_tracking(t.uid) for t in tokens)
+
+
+def test_deposit_many_late(w3, mine, operator, token_contract, rootchain_contract, users):
+    u1 = users[0]
+    tokens = list(u1.purse)
+    height = u1.chain_height.update()
+    # NOTE eth-tester checks nonces against the latest state, so only one transaction
+    #      can be waiting for the next block (approve ahead of time)
+    token_contract.functions.setApprovalForAll(rootchain_contract.address, True).transact(
+            {'from': u1.address})
+
+    # A block gets published before our deposit is mined
+    tester = w3.provider.ethereum_tester
+    tester.disable_auto_mine_transactions()
+    try:
+        rootchain_contract.functions.submitBlock(b'\x01' * 32).transact(
+                {'from': operator.address, 'gas': 100000})
+        u1.deposit_many([t.uid for t in tokens])
+        mine()
+    finally:
+        tester.enable_auto_mine_transactions()
+
+    # So it is rejected, and sent again for the next block
+    u1.monitor()
+    assert all(t.status is TokenStatus.ROOTCHAIN for t in tokens)
+    u1.monitor()
+    assert all(t.status is TokenStatus.DEPOSIT for t in tokens)
+    assert all(t.history[-1].prevBlkNum == height + 1 for t in tokens)
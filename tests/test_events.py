@@ -0,0 +1,44 @@
+# Test everyone's rootchain events come from one shared dispatcher
+from plasma_cash import Token
+from plasma_cash.events import get_dispatcher
+
+
+def test_events(w3, mine, operator, token_contract, rootchain_contract, users):
+    dispatcher = get_dispatcher(w3, rootchain_contract.address)
+    assert all(u._events is dispatcher for u in users) and operator._events is dispatcher
+    u1, u2 = users[:2]
+    token_contract.functions.mint(u2.address, 456).transact()
+    u2.purse.append(Token(456))
+    deposits = dispatcher.subscribe('DepositAdded')
+    u1_deposits = dispatcher.subscribe('DepositAdded', newOwner=u1.address)
+
+    for user in (u1, u2):
+        user.deposit(user.purse[0].uid)
+    mine()
+
+    operator.monitor()
+
+    # One query for every listener of every user
+    queries = dispatcher.queries
+    for user in users:
+        user.monitor()
+    assert dispatcher.queries == queries + 1
+
+    # Decoded the same as web3 does it
+    logs = deposits.drain()
+    assert len(logs) == 2
+    event = rootchain_contract.events.DepositAdded()
+    for log, expected in zip(logs, event.getLogs(fromBlock=0)):
+        assert log == expected
+
+    # Matched on the arguments
+    assert [log.args.newOwner for log in u1_deposits.get_new_entries()] == [u1.address]
+
+    # Subscribing late catches up on what was already dispatched
+    late = dispatcher.subscribe('DepositAdded', 0, tokenId=u2.purse[0].uid)
+    assert [log.args.newOwner for log in late.drain()] == [u2.address]
+
+    # Nothing new, nothing to ask for
+    queries = dispatcher.queries
+    deposits.get_new_entries()
+    assert dispatcher.queries == queries
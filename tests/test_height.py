@@ -0,0 +1,44 @@
+# Test the child chain height is tracked from events (shared by every user)
+import threading
+
+from plasma_cash.height import get_tracker
+
+
+def test_height(w3, mine, operator, rootchain_contract, users):
+    u1, u2 = users[:2]
+    tracker = get_tracker(w3, rootchain_contract.address)
+    assert u1.chain_height is tracker and u2.chain_height is tracker
+    assert tracker.height == 0
+
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    assert tracker.height == rootchain_contract.functions.childChain_len().call()
+    for blk_num, root in enumerate(tracker.roots):
+        assert root == rootchain_contract.functions.childChain(blk_num).call()
+
+    # Many threads updating it at once still see every block once
+    operator.publish_block()
+    operator.publish_block()
+    threads = [threading.Thread(target=tracker.update) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert tracker.height == rootchain_contract.functions.childChain_len().call()
+
+    # A block gets published while u1 isn't monitoring, they still sign for the next one
+    height = tracker.height
+    operator.publish_block()
+    assert tracker.height == height  # Hasn't seen it yet
+    submitted = []
+    add_transaction = operator.addTransaction
+    operator.addTransaction = lambda txn: submitted.append(txn) or add_transaction(txn)
+    u1.transfer(u2.address, token.uid)
+    assert len(submitted) == 1  # Not rejected first
+    assert token.history[-1].prevBlkNum == height + 1
+    assert operator.deposits[token.uid] == token.history[-1]
+    assert tracker.height == height + 1
@@ -0,0 +1,99 @@
+# Test token histories are checked as they stream in
+from plasma_cash import (
+    Token,
+    TokenStatus,
+    Transaction,
+)
+from plasma_cash.history import (
+    RECORD,
+    compress_proof,
+    encode_record,
+    expand_proof,
+    stream_history,
+)
+
+
+def sign(user, transaction):
+    signature = user._acct.sign_message(transaction.msg)
+    transaction.add_signature((signature.v, signature.r, signature.s))
+    return transaction
+
+
+def test_valid(w3, rootchain_contract, users):
+    u1, u2, u3 = users[:3]
+    chain_id = w3.eth.chainId
+    deposit = sign(u1, Transaction(chain_id, rootchain_contract.address, 0, 123, u1.address))
+    transfer = sign(u1, Transaction(chain_id, rootchain_contract.address, 1, 123, u2.address))
+    token = Token(123, status=TokenStatus.PLASMACHAIN, history=[deposit, transfer])
+
+    # u1 already gave it away, so can't give it away again
+    double_spend = sign(u1, Transaction(chain_id, rootchain_contract.address, 2, 123, u3.address))
+    token.addTransaction(double_spend)
+    assert not token.valid
+
+    # Swapping in the right one is noticed (even though the length didn't change)
+    token.history[-1] = sign(u2, Transaction(chain_id, rootchain_contract.address, 2, 123, u3.address))
+    assert token.valid
+    token.history[-1] = double_spend
+    assert not token.valid
+
+
+def test_stream(w3, mine, operator, rootchain_contract, users):
+    u1, u2, u3, u4 = users[:4]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+
+    # Pass it around a few times (so every record has a proof)
+    for sender, receiver in [(u1, u2), (u2, u3)]:
+        height = sender.chain_height.update()
+        sender.transfer(receiver.address, token.uid)
+        receiver.purse.append(token)
+        while receiver.chain_height.update() == height:
+            mine()
+            operator.monitor()
+    height = u3.chain_height.height
+
+    # Proofs of a sparse tree are mostly empty siblings
+    proof = operator.get_branch(token.uid, token.history[-1].prevBlkNum)
+    assert expand_proof(compress_proof(proof)) == proof
+    assert len(encode_record(token.history[-1], proof)) < 300
+
+    # Chunks split records anywhere, and the proofs are only fetched as they are read
+    chunks = list(stream_history(token, operator.get_branch, height, chunk_size=100))
+    assert max(len(c) for c in chunks) == 100
+    assert u4.receive_stream(u3.address, token.uid, iter(chunks))
+    received = u4.purse[-1]
+    assert received.status is TokenStatus.PLASMACHAIN
+    assert [t.to_bytes for t in received.history] == [t.to_bytes for t in token.history]
+    assert all(u4.verifier.is_verified(txn) for txn in token.history)
+
+    # u3 adds a transfer to u1 that was never in a block, and we stop reading right after it
+    forged = sign(u3, Transaction(
+            w3.eth.chainId,
+            rootchain_contract.address,
+            token.history[-1].prevBlkNum,
+            token.uid,
+            u1.address,
+        ))
+    fake_token = Token(token.uid, status=TokenStatus.PLASMACHAIN, history=token.history + [forged])
+    records = [encode_record(t, operator.get_branch(t.tokenId, t.prevBlkNum)) for t in fake_token.history]
+    records += [b'\x00' * RECORD.size] * 5  # Never read
+    read = []
+    def chunks():
+        for record in records:
+            read.append(record)
+            yield record
+    assert not u1.receive_stream(u3.address, token.uid, chunks())
+    assert len(read) == len(fake_token.history)
+    assert all(t.uid != token.uid for t in u1.purse)
+
+    # A published transaction without its proof can't be checked
+    assert not u1.receive_stream(u3.address, token.uid, [encode_record(token.history[0])])
+    # Nor can a history that stops partway through a record
+    deposit = token.history[0]
+    record = encode_record(deposit, operator.get_branch(deposit.tokenId, deposit.prevBlkNum))
+    assert not u1.receive_stream(u3.address, token.uid, [record[:-1]])
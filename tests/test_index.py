@@ -0,0 +1,72 @@
+# Test the index of which blocks touched each token
+import random
+
+from plasma_cash.index import (
+    EXACT_MAX,
+    FALSE_POSITIVE_RATE,
+    BlockIndex,
+    BloomFilter,
+    ExactFilter,
+    ScalableBloomFilter,
+    token_hashes,
+)
+
+
+def test_block_index():
+    rng = random.Random(0)
+    index = BlockIndex(segment_size=16, group_size=2)
+    blocks = []
+    for blk_num in range(100):
+        size = rng.choice([0, 3, EXACT_MAX + 1, 500])
+        tokens = [rng.randrange(2**256) for _ in range(size)]
+        index.add(blk_num, tokens)
+        blocks.append(set(tokens))
+    assert len(index.segments) == 7
+    assert len(index.groups) == 4
+    assert any(isinstance(f, ExactFilter) for f in index.filters)
+    assert any(isinstance(f, BloomFilter) for f in index.filters)
+
+    # No false negatives
+    for blk_num, tokens in enumerate(blocks):
+        for token_uid in list(tokens)[:5]:
+            assert blk_num in index.candidates(token_uid)
+
+    # Few false positives
+    token_uid = 2**255 + 1
+    assert len(index.candidates(token_uid)) < 10
+    a, b = list(blocks[2] or blocks[1])[0], 2**255 + 1
+    assert index.candidates_any([a, b]) == sorted(set(index.candidates(a)) |
+                                                  set(index.candidates(b)))
+
+
+def test_scalable_bloom_filter():
+    rng = random.Random(1)
+    bloom = ScalableBloomFilter(capacity=100)
+    tokens = [token_hashes(rng.randrange(2**256)) for _ in range(5000)]
+    for h in tokens:
+        bloom.add(h)
+    assert len(bloom.filters) > 1  # Grew instead of saturating
+    assert all(h in bloom for h in tokens)
+
+    # Still has the false positive rate it was made for
+    others = [token_hashes(rng.randrange(2**256)) for _ in range(5000)]
+    assert sum(h in bloom for h in others) < 5000 * FALSE_POSITIVE_RATE * 2
+
+
+def test_blocks_touching(w3, mine, operator, users):
+    u1, u2 = users[:2]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    for _ in range(3):
+        operator.publish_block()  # Empty blocks
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+    operator.publish_block()
+
+    assert len(operator.index) == len(operator.transactions) - 1
+    assert operator.blocks_touching(token.uid) == [t.prevBlkNum for t in token.history]
+    assert operator.blocks_touching(456) == []
@@ -0,0 +1,60 @@
+# Test instrumentation of operator and user hot paths
+import contextlib
+import urllib.request
+
+from plasma_cash import (
+    Operator,
+    User,
+)
+from plasma_cash.metrics import Metrics
+
+
+def test_metrics(w3, mine, token_contract, rootchain_contract, users):
+    metrics = Metrics()
+    spans = []
+
+    @contextlib.contextmanager
+    def record_span(name, attrs):
+        spans.append(name)
+        yield
+
+    metrics.add_span_hook(record_span)
+
+    operator = Operator(w3, rootchain_contract.address, users[0]._operator._acct.key,
+                        metrics=metrics)
+    u1, u2 = [User(w3, token_contract.address, rootchain_contract.address, operator,
+                   u._acct.key, purse=u.purse, metrics=metrics) for u in users[:2]]
+    token = u1.purse[0]
+
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+    u1.purse.append(token)  # u1 pretends they still have it
+    try:
+        u1.transfer(u2.address, token.uid)  # Not signed by current holder
+    except AssertionError:
+        pass
+
+    assert 'l1.deposit' in spans
+    assert 'l1.submitBlock' in spans
+    assert 'tree.set' in spans
+    assert metrics.counter('plasma_user_transfers_total', '').value(result='accepted') == 1
+    assert metrics.counter('plasma_user_transfers_total', '').value(result='rejected') == 1
+    assert metrics.counter('plasma_operator_rejected_transactions_total', '') \
+            .value(reason='wrong_signer') == 1
+    assert metrics.gauge('plasma_operator_tracked_tokens', '').value() == 1
+    assert metrics.histogram('plasma_operator_publish_block_seconds', '').count() >= 1
+
+    server = metrics.serve(port=0)
+    try:
+        url = 'http://127.0.0.1:{}/metrics'.format(server.server_address[1])
+        body = urllib.request.urlopen(url).read().decode('utf-8')
+    finally:
+        server.shutdown()
+    assert '# TYPE plasma_operator_publish_block_seconds histogram' in body
+    assert 'plasma_operator_publish_block_seconds_bucket{le="+Inf"}' in body
+    assert 'plasma_operator_rejected_transactions_total{reason="wrong_signer"} 1.0' in body
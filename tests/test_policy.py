@@ -0,0 +1,66 @@
+# Test the operator publishes blocks according to its policy
+from plasma_cash import (
+    Operator,
+    Token,
+    User,
+)
+from plasma_cash.policy import PublishPolicy
+
+
+def test_should_publish():
+    no_gas = lambda: 0
+
+    # Legacy behavior (every 3 blocks, even if empty)
+    policy = PublishPolicy()
+    assert not policy.should_publish(12, 10, 0, 10, no_gas)
+    assert policy.should_publish(13, 10, 0, 10, no_gas)
+
+    policy = PublishPolicy(interval=None, max_pending=10, max_age=5,
+                           cheap_gas_price=10**9, skip_empty=True)
+    assert not policy.should_publish(100, 0, 0, 0, no_gas)  # Empty
+    assert policy.should_publish(1, 0, 10, 0, lambda: 10**10)  # Full
+    assert policy.should_publish(5, 0, 1, 0, lambda: 10**10)  # Old
+    assert not policy.should_publish(4, 0, 1, 0, lambda: 10**10)
+    assert policy.should_publish(1, 0, 1, 0, lambda: 10**9)  # Cheap
+
+    policy = PublishPolicy(max_mempool=2)
+    assert policy.accepts(1)
+    assert not policy.accepts(2)
+
+
+def test_operator_policy(w3, mine, token_contract, rootchain_contract, users):
+    policy = PublishPolicy(interval=None, max_pending=2, skip_empty=True, max_mempool=1)
+    operator = Operator(w3, rootchain_contract.address, users[0]._operator._acct.key,
+                        policy=policy)
+    u1, u2 = [User(w3, token_contract.address, rootchain_contract.address, operator,
+                   u._acct.key, purse=u.purse) for u in users[:2]]
+    # Give u1 another token
+    token_contract.functions.mint(u1.address, 456).transact()
+    u1.purse.append(Token(456))
+    logger = rootchain_contract.events.BlockPublished.createFilter(fromBlock=w3.eth.blockNumber)
+
+    # Nothing waiting, so no blocks are published
+    mine(5)
+    operator.monitor()
+    assert len(logger.get_all_entries()) == 0
+
+    # One deposit isn't enough to publish, but two are
+    t1, t2 = u1.purse
+    u1.deposit(t1.uid)
+    mine(5)
+    operator.monitor()
+    assert len(logger.get_all_entries()) == 0
+    u1.deposit(t2.uid)
+    operator.monitor()
+    assert len(logger.get_all_entries()) == 1
+    u1.monitor()
+    assert t1.transferrable and t2.transferrable
+
+    # Only room for one transfer in the block
+    u1.transfer(u2.address, t1.uid)
+    try:
+        u1.transfer(u2.address, t2.uid)
+    except AssertionError:
+        pass
+    assert operator.is_tracking(t2.uid)
+    assert operator.deposits[t2.uid].newOwner == u1.address
@@ -0,0 +1,36 @@
+# Test proofs kept in one buffer match the tree, and encode like web3 does
+import random
+
+from eth_utils import keccak, to_bytes
+from trie.smt import SparseMerkleTree, calc_root
+
+from plasma_cash.proof import PROOF_SIZE, Proof, encode_call
+from plasma_cash.smt import TokenToTxnHashIdSMT, to_bytes32
+
+
+def test_proof():
+    rng = random.Random(0)
+    keys = [rng.randrange(2**256) for _ in range(20)] + [0, 2**256 - 1]
+    tree = TokenToTxnHashIdSMT()
+    reference = SparseMerkleTree(key_size=32)
+    for k in keys:
+        tree.set_leaf(k, keccak(to_bytes32(k)))
+        reference.set(to_bytes32(k), keccak(to_bytes32(k)))
+
+    for k in keys:
+        proof = tree.branch(k)
+        assert isinstance(proof, Proof) and len(proof.buffer) == PROOF_SIZE
+        assert proof == reference.branch(to_bytes32(k))
+        assert proof[-1] == bytes(proof.view(255)) == proof.buffer[-32:]
+        assert proof.calc_root(to_bytes32(k), keccak(to_bytes32(k))) == tree.root_hash
+        assert calc_root(to_bytes32(k), keccak(to_bytes32(k)), proof) == tree.root_hash
+
+
+def test_encode_call(rootchain_contract):
+    tree = TokenToTxnHashIdSMT()
+    tree.set_leaf(123, keccak(b'txn'))
+    proof = tree.branch(123)
+    txn = (rootchain_contract.address, 123, 1, 27, 2, 3)
+    data = encode_call(rootchain_contract.functions.startExit, txn, proof, txn, proof)
+    expected = rootchain_contract.functions.startExit(txn, tuple(proof), txn, tuple(proof))
+    assert data == to_bytes(hexstr=expected._encode_transaction_data())
@@ -0,0 +1,27 @@
+# Test coins covering a range of tokens
+from plasma_cash import Token
+
+
+def test_range_deposit(w3, mine, token_contract, rootchain_contract, operator, users):
+    u1, u2 = users[:2]
+    for token_uid in range(200, 204):
+        token_contract.functions.mint(u1.address, token_uid).transact()
+    t = Token(200, end=204)
+    u1.purse.append(t)
+
+    # The whole range is deposited as one coin
+    u1.deposit(t.uid)
+    for token_uid in range(200, 204):
+        assert token_contract.functions.ownerOf(token_uid).call() == rootchain_contract.address
+    while not t.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    assert operator.is_tracking(200)
+    assert not operator.is_tracking(201)  # Only one leaf for the coin
+
+    # Which moves as a whole
+    u1.transfer(u2.address, t.uid)
+    assert u2.receive(u1.address, t)
+    # NOTE Claiming a bigger range than was deposited is rejected
+    assert not u2.receive(u1.address, Token(200, end=205))
@@ -0,0 +1,82 @@
+# Test one watcher fetches the receipts of everything we sent
+import threading
+
+import pytest
+
+from web3.exceptions import TimeExhausted
+
+from plasma_cash.receipts import (
+    ReceiptWatcher,
+    get_watcher,
+)
+from plasma_cash.rpc import RequestBatch
+
+
+def test_receipts(w3, mine, monkeypatch, token_contract, rootchain_contract, users):
+    u1 = users[0]
+    watcher = ReceiptWatcher(w3)
+    assert get_watcher(w3) is get_watcher(w3)
+    assert u1._receipts is get_watcher(w3)
+
+    # Nothing is mined until the next block, so nothing is resolved
+    # NOTE eth-tester checks nonces against the latest state, so send from different users
+    tester = w3.provider.ethereum_tester
+    tester.disable_auto_mine_transactions()
+    try:
+        txn_hashes = []
+        for u in users[:3]:
+            txn_hashes.append(token_contract.functions.setApprovalForAll(
+                rootchain_contract.address,
+                True,
+            ).transact({'from': u.address, 'gas': 100000}))
+
+        # A failed fetch is tried again on the next poll
+        lost = watcher.watch(txn_hashes[0])
+        def fail(batch):
+            raise ValueError("Connection lost")
+        monkeypatch.setattr(RequestBatch, 'send', fail)
+        with pytest.raises(ValueError):
+            watcher.poll()
+        monkeypatch.undo()
+        watcher.poll()
+        assert watcher.fetches == 1 and not lost.done()
+        watcher.reset()
+        assert lost.cancelled() and len(watcher) == 0
+
+        seen = []
+        futures = [watcher.watch(h, callback=seen.append) for h in txn_hashes]
+        assert watcher.watch(txn_hashes[0]) is futures[0]
+        watcher.poll()
+        assert len(watcher) == 3 and not any(f.done() for f in futures)
+        assert watcher.fetches == 4
+
+        # Polling again in the same block doesn't fetch anything
+        watcher.poll()
+        assert watcher.fetches == 4
+        with pytest.raises(TimeExhausted):
+            watcher.wait(txn_hashes[0], timeout=0)
+
+        mine()
+    finally:
+        tester.enable_auto_mine_transactions()
+
+    # Everyone waiting at once gets their receipt from a single fetch, by one poller
+    receipts = [None] * 3
+    pollers = set()
+    poll = watcher.poll
+    def spy():
+        pollers.add(threading.current_thread())
+        poll()
+    watcher.poll = spy
+    def wait(i):
+        receipts[i] = watcher.wait(txn_hashes[i])
+    threads = [threading.Thread(target=wait, args=(i,)) for i in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert watcher.fetches == 7 and len(watcher) == 0
+    assert len(pollers) == 1 and not pollers & set(threads)
+    for txn_hash, receipt in zip(txn_hashes, receipts):
+        assert receipt == w3.eth.getTransactionReceipt(txn_hash)
+    assert seen == [f.result() for f in futures]
@@ -0,0 +1,39 @@
+# Test rebuilding operator state from rootchain events
+from plasma_cash import Operator
+from plasma_cash.replay import replay
+
+
+def test_replay(w3, mine, operator, rootchain_contract, users):
+    u1, u2 = users[:2]
+    token = u1.purse[0]
+
+    # Deposit, transfer and publish a few blocks
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+    while len(operator.transactions) < 5:
+        mine()
+        operator.monitor()
+
+    # Without transaction data, only blocks with just deposits (or nothing) check out
+    replica = Operator(w3, rootchain_contract.address, operator._acct.key)
+    stats = replay(replica, chunk_size=3, workers=2)
+    assert stats.blocks == len(operator.transactions) - 1
+    assert stats.unverified == [token.history[-1].prevBlkNum]
+    assert not stats.mismatched
+    assert replica.deposits[token.uid].newOwner == u1.address
+
+    # With an archive of the transfers, everything is verified
+    archive = {txn.prevBlkNum: [txn] for txn in token.history[1:]}
+    replica = Operator(w3, rootchain_contract.address, operator._acct.key)
+    stats = replay(replica, chunk_size=3, workers=2, archive=archive)
+    assert stats.verified == list(range(len(operator.transactions) - 1))
+    assert replica.deposits[token.uid].newOwner == u2.address
+    for blk_num, block in enumerate(operator.transactions[:-1]):
+        assert replica.transactions[blk_num].root_hash == block.root_hash
+        assert replica.transactions[blk_num].root_hash == \
+                rootchain_contract.functions.childChain(blk_num).call()
@@ -0,0 +1,129 @@
+# Test published blocks can be kept as just their leaves
+import random
+
+from eth_utils import keccak
+from trie.smt import calc_root
+
+from plasma_cash import Operator
+from plasma_cash.smt import (
+    NodeStore,
+    SealedBlock,
+    TokenToTxnHashIdSMT,
+    TreeCache,
+    branch_from_leaves,
+    to_bytes32,
+)
+
+
+def test_branch_from_leaves():
+    rng = random.Random(0)
+    keys = [rng.randrange(2**256) for _ in range(20)]
+    keys += [0, 1, 2**256 - 1, keys[0] ^ 1]  # Edges, and siblings at the bottom
+    leaves = {k: keccak(to_bytes32(k)) for k in keys}
+    tree = TokenToTxnHashIdSMT.from_leaves(leaves)
+    for k in keys:
+        branch = branch_from_leaves(sorted(leaves), leaves, k)
+        assert branch == tree.branch(k)
+        assert calc_root(to_bytes32(k), leaves[k], branch) == tree.root_hash
+
+    # Without room for any trees, sealed blocks compute branches from their leaves
+    block = SealedBlock(tree.root_hash, leaves, cache=TreeCache(0))
+    assert block.branch(keys[0]) == tree.branch(keys[0])
+    assert len(block.cache) == 0
+
+    # Only keeping the subtrees off the branch points, which is all any branch needs
+    hashes = len(block._paths)
+    assert hashes < 2 * len(keys)
+    for k in keys:
+        assert block.branch(k) == tree.branch(k)
+    assert len(block._paths) == hashes
+
+
+def test_leaf_retention(w3, mine, rootchain_contract, users):
+    operator = Operator(w3, rootchain_contract.address, users[0]._operator._acct.key,
+                        max_trees=1)
+    u1, u2 = users[:2]
+    u1._operator = u2._operator = operator
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+
+    # Send it back and forth over a few blocks
+    for _ in range(3):
+        u1.transfer(u2.address, token.uid)
+        u2.purse.append(token)
+        operator.publish_block()
+        u1, u2 = u2, u1
+
+    # Only the leaves are kept, but the proofs still check out
+    for txn in token.history:
+        block = operator.transactions[txn.prevBlkNum]
+        assert not isinstance(block, TokenToTxnHashIdSMT)
+        branch = operator.get_branch(token.uid, txn.prevBlkNum)
+        root = rootchain_contract.functions.childChain(txn.prevBlkNum).call()
+        assert calc_root(to_bytes32(token.uid), txn.msg_hash, branch) == root
+        assert len(operator._tree_cache) == 1
+
+
+def test_node_store():
+    rng = random.Random(1)
+    store = NodeStore()
+    pinned = len(store)
+    trees = []
+    for _ in range(3):
+        leaves = {k: keccak(to_bytes32(k)) for k in (rng.randrange(2**256) for _ in range(5))}
+        tree = TokenToTxnHashIdSMT.from_leaves(leaves)
+        block = SealedBlock(tree.root_hash, leaves, store=store)
+        block.retain(tree.db)
+        trees.append((block, tree))
+    for block, tree in trees:
+        for k in tree.leaves:
+            assert block.branch(k) == tree.branch(k)
+
+    # The same tree twice is only stored once
+    num_nodes = len(store)
+    block, tree = trees[0]
+    copy = SealedBlock(tree.root_hash, tree.leaves, store=store)
+    copy.retain()
+    assert len(store) == num_nodes
+
+    # Nodes go once nothing points at them
+    block.release()
+    assert len(store) == num_nodes
+    copy.release()
+    assert len(store) < num_nodes
+    for k in tree.leaves:
+        assert block.branch(k) == tree.branch(k)  # From the leaves now
+    for block, _ in trees[1:]:
+        block.release()
+    assert len(store) == pinned and not store.refs
+
+
+def test_collect(w3, mine, rootchain_contract, users):
+    operator = users[0]._operator
+    u1, u2 = users[:2]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    for _ in range(3):
+        u1.transfer(u2.address, token.uid)
+        u2.purse.append(token)
+        operator.publish_block()
+        u1, u2 = u2, u1
+
+    # Published trees share one store, and old ones can be taken out of it
+    assert all(b.store is operator.nodes for b in operator.transactions[:-1])
+    assert operator.collect(horizon=1) > 0
+    assert operator.collect(horizon=1) == 0
+    assert operator.transactions[-2].store is operator.nodes
+    assert operator.transactions[0].store is None
+    for txn in token.history:
+        branch = operator.get_branch(token.uid, txn.prevBlkNum)
+        root = rootchain_contract.functions.childChain(txn.prevBlkNum).call()
+        assert calc_root(to_bytes32(token.uid), txn.msg_hash, branch) == root
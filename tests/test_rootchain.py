@@ -0,0 +1,198 @@
+# Test the Python model of the RootChain against the contract
+import pytest
+
+from eth_account import Account
+from eth_tester.backends.pyevm.main import get_default_account_keys
+
+from plasma_cash.proof import Proof
+from plasma_cash.rootchain import (
+    ZERO_ADDRESS,
+    ContractRootChain,
+    DifferentialRootChain,
+    RootChain,
+)
+from plasma_cash.smt import TokenToTxnHashIdSMT
+from plasma_cash.transaction import Transaction
+
+
+KEYS = get_default_account_keys()[:4]
+ACCOUNTS = [Account.privateKeyToAccount(k) for k in KEYS]
+
+
+def test_differential(w3, token_contract, rootchain_contract):
+    operator, u1, u2, u3 = [a.address for a in ACCOUNTS]
+    model = RootChain(61, rootchain_contract.address, operator, challenge_period=1)
+    chain = DifferentialRootChain(
+            model,
+            ContractRootChain(w3, token_contract.address, rootchain_contract.address),
+        )
+
+    def sign(key, new_owner, token_uid, blk_num):
+        txn = Transaction(61, rootchain_contract.address, blk_num, token_uid, new_owner)
+        signature = Account.from_key(key).sign_message(txn.msg)
+        txn.add_signature((signature.v, signature.r, signature.s))
+        assert model._txn_hash(txn.to_tuple) == txn.msg_hash
+        return txn
+
+    def publish(*txns):
+        tree = TokenToTxnHashIdSMT()
+        for txn in txns:
+            tree.set(txn.tokenId, txn)
+        chain.submitBlock(operator, tree.root_hash)
+        return {txn.tokenId: tree.branch(txn.tokenId) for txn in txns}
+
+    def reverts(name, *args):
+        try:
+            getattr(chain, name)(*args)
+        except AssertionError as e:
+            assert "reverted" in str(e)  # Not a difference between the two!
+            return True
+        return False
+
+    for token_uid in (1, 2):
+        token_contract.functions.mint(u1, token_uid).transact()
+        model.token.mint(u1, token_uid)
+    token_contract.functions.setApprovalForAll(rootchain_contract.address, True).transact({'from': u1})
+    model.token.setApprovalForAll(u1, rootchain_contract.address, True)
+
+    # Deposits
+    assert reverts('submitBlock', u1, b'\x01' * 32)  # Not the operator
+    deposit1 = sign(KEYS[1], u1, 1, 0)
+    assert reverts('deposit', u1, u2, deposit1.to_tuple)  # Not signed by u2
+    assert reverts('deposit', u1, u1, sign(KEYS[1], u1, 1, 1).to_tuple)  # Wrong block
+    chain.deposit(u1, u1, deposit1.to_tuple)
+    deposit2 = sign(KEYS[1], u1, 2, 0)
+    chain.deposit(u1, u1, deposit2.to_tuple)
+    assert reverts('withdraw', u2, 2)  # Not the depositor
+    chain.withdraw(u1, 2)
+    assert reverts('withdraw', u1, 2)  # Already withdrawn
+
+    # u1 -> u2 -> u3
+    proofs = [publish(deposit1)]
+    t12 = sign(KEYS[1], u2, 1, 1)
+    proofs.append(publish(t12))
+    t23 = sign(KEYS[2], u3, 1, 2)
+    proofs.append(publish(t23))
+    assert reverts('withdraw', u1, 1)  # Already published
+
+    # u2 exits after spending, and gets challenged
+    assert reverts('startExit', u3, deposit1.to_tuple, proofs[0][1], t12.to_tuple, proofs[1][1])
+    assert reverts('startExit', u2, deposit1.to_tuple, proofs[0][1], t12.to_tuple, Proof())  # Bad proof
+    assert reverts('startExit', u2, deposit2.to_tuple, proofs[0][1], t12.to_tuple, proofs[1][1])
+    assert reverts('startExit', u2, t23.to_tuple, proofs[2][1], t12.to_tuple, proofs[1][1])
+    chain.startExit(u2, deposit1.to_tuple, proofs[0][1], t12.to_tuple, proofs[1][1])
+    assert reverts('startExit', u2, deposit1.to_tuple, proofs[0][1], t12.to_tuple, proofs[1][1])
+    chain.challengeExit(u3, t23.to_tuple, proofs[2][1], 2)
+    assert reverts('challengeExit', u3, t23.to_tuple, proofs[2][1], 2)  # Already cancelled
+
+    # u3 exits, gets challenged with an earlier transaction, and responds
+    chain.startExit(u3, t12.to_tuple, proofs[1][1], t23.to_tuple, proofs[2][1])
+    chain.challengeExit(u1, deposit1.to_tuple, proofs[0][1], 0)
+    assert reverts('respondChallenge', u3, deposit1.to_tuple, proofs[0][1], 0)  # Not after it
+    chain.respondChallenge(u3, t12.to_tuple, proofs[1][1], 0)
+    assert reverts('respondChallenge', u3, t12.to_tuple, proofs[1][1], 0)  # Already responded
+
+    w3.provider.ethereum_tester.time_travel(chain.contract.timestamp + 2)
+    assert reverts('finalizeExit', u2, 1)  # Not the owner
+    chain.finalizeExit(u3, 1)
+    assert chain.owner_of(1) == u3
+    assert reverts('finalizeExit', u3, 1)  # Already finalized
+
+
+def test_range_differential(w3, token_contract, rootchain_contract):
+    operator, u1, u2 = [a.address for a in ACCOUNTS[:3]]
+    model = RootChain(61, rootchain_contract.address, operator, challenge_period=1)
+    chain = DifferentialRootChain(
+            model,
+            ContractRootChain(w3, token_contract.address, rootchain_contract.address),
+        )
+
+    def sign(key, new_owner, token_uid, blk_num):
+        txn = Transaction(61, rootchain_contract.address, blk_num, token_uid, new_owner)
+        signature = Account.from_key(key).sign_message(txn.msg)
+        txn.add_signature((signature.v, signature.r, signature.s))
+        return txn
+
+    def reverts(name, *args):
+        try:
+            getattr(chain, name)(*args)
+        except AssertionError as e:
+            assert "reverted" in str(e)  # Not a difference between the two!
+            return True
+        return False
+
+    for token_uid in range(10, 16):
+        token_contract.functions.mint(u1, token_uid).transact()
+        model.token.mint(u1, token_uid)
+    token_contract.functions.setApprovalForAll(rootchain_contract.address, True).transact({'from': u1})
+    model.token.setApprovalForAll(u1, rootchain_contract.address, True)
+
+    # One coin covers tokens 10 to 13
+    deposit = sign(KEYS[1], u1, 10, 0)
+    assert reverts('depositRange', u1, u1, deposit.to_tuple, 10)  # Empty
+    assert reverts('depositRange', u1, u1, deposit.to_tuple, 10 + 65)  # Too big
+    chain.depositRange(u1, u1, deposit.to_tuple, 14)
+    assert all(chain.owner_of(t) == rootchain_contract.address for t in range(10, 14))
+    # Coins can't overlap
+    assert reverts('depositRange', u1, u1, sign(KEYS[1], u1, 13, 0).to_tuple, 16)
+    chain.depositRange(u1, u1, sign(KEYS[1], u1, 14, 0).to_tuple, 16)
+    chain.withdraw(u1, 14)
+    assert chain.owner_of(15) == u1
+
+    # The whole coin exits at once
+    tree = TokenToTxnHashIdSMT()
+    tree.set(10, deposit)
+    chain.submitBlock(operator, tree.root_hash)
+    t12 = sign(KEYS[1], u2, 10, 1)
+    tree = TokenToTxnHashIdSMT()
+    tree.set(10, t12)
+    chain.submitBlock(operator, tree.root_hash)
+    deposit_proof = TokenToTxnHashIdSMT.from_leaves({10: deposit.msg_hash}).branch(10)
+    chain.startExit(u2, deposit.to_tuple, deposit_proof, t12.to_tuple, tree.branch(10))
+    w3.provider.ethereum_tester.time_travel(chain.contract.timestamp + 2)
+    chain.finalizeExit(u2, 10)
+    assert all(chain.owner_of(t) == u2 for t in range(10, 14))
+    assert chain.deposit_of(10)[0] == ZERO_ADDRESS
+
+
+def test_last_token_differential(w3, token_contract, rootchain_contract):
+    operator, u1 = [a.address for a in ACCOUNTS[:2]]
+    model = RootChain(61, rootchain_contract.address, operator, challenge_period=1)
+    chain = DifferentialRootChain(
+            model,
+            ContractRootChain(w3, token_contract.address, rootchain_contract.address),
+        )
+    token_uid = 2**256 - 1
+    token_contract.functions.mint(u1, token_uid).transact()
+    model.token.mint(u1, token_uid)
+    token_contract.functions.setApprovalForAll(rootchain_contract.address, True).transact({'from': u1})
+    model.token.setApprovalForAll(u1, rootchain_contract.address, True)
+
+    # The last tokenId can be deposited (and withdrawn) like any other
+    txn = Transaction(61, rootchain_contract.address, 0, token_uid, u1)
+    signature = Account.from_key(KEYS[1]).sign_message(txn.msg)
+    txn.add_signature((signature.v, signature.r, signature.s))
+    chain.deposit(u1, u1, txn.to_tuple)
+    assert chain.owner_of(token_uid) == rootchain_contract.address
+    assert chain.deposit_of(token_uid) == (u1, 0, 1)
+    chain.withdraw(u1, token_uid)
+    assert chain.owner_of(token_uid) == u1
+
+
+def test_unchecked():
+    # Nothing but the bookkeeping, for capacity planning
+    operator, u1, u2 = [a.address for a in ACCOUNTS[:3]]
+    model = RootChain(61, '0x' + '11' * 20, operator,
+                      challenge_period=0, check_proofs=False, check_signatures=False)
+    model.token.mint(u1, 1)
+    model.token.setApprovalForAll(u1, model.address, True)
+    unsigned = (u1, 1, 0, 0, 0, 0)
+    model.deposit(u1, u1, unsigned)
+    model.submitBlock(operator, b'\x01' * 32)
+    model.submitBlock(operator, b'\x01' * 32)
+    transfer = (u2, 1, 1, 0, 0, 0)
+    model.startExit(u2, unsigned, [], transfer, [])
+    with pytest.raises(AssertionError, match="Not included!"):
+        model.startExit(u2, unsigned, [], (u2, 1, 5, 0, 0, 0), [])  # Unpublished block
+    assert model.finalizeExit(u2, 1) == [('ExitFinished', {'tokenId': 1, 'owner': u2})]
+    assert model.owner_of(1) == u2
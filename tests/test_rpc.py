@@ -0,0 +1,86 @@
+# Test batching and caching of rootchain reads
+import json
+import threading
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from web3 import HTTPProvider, Web3
+
+from plasma_cash import rootchain_interface
+from plasma_cash.rpc import (
+    RequestBatch,
+    RpcCache,
+    get_cache,
+)
+
+
+def test_batch_fallback(w3, rootchain_contract, users):
+    batch = RequestBatch(w3)
+    nonce = batch.transaction_count(users[0].address)
+    blk_num = batch.call(rootchain_contract.functions.childChain_len())
+    block_number = batch.block_number()
+    batch.send()
+    assert nonce.value == w3.eth.getTransactionCount(users[0].address)
+    assert blk_num.value == 0
+    assert block_number.value == w3.eth.blockNumber
+
+
+def test_batch_http():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            requests.append(payload)
+            results = {
+                'eth_getTransactionCount': '0x5',
+                'eth_blockNumber': '0x10',
+                'eth_call': '0x' + (3).to_bytes(32, 'big').hex(),
+                'eth_getTransactionReceipt': None,  # Not mined yet
+            }
+            response = [{'jsonrpc': '2.0', 'id': r['id'], 'result': results[r['method']]}
+                        for r in reversed(payload)]
+            body = json.dumps(response).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        w3 = Web3(HTTPProvider('http://127.0.0.1:{}'.format(server.server_address[1])))
+        rootchain = w3.eth.contract('0x' + '11' * 20, **rootchain_interface)
+        batch = RequestBatch(w3)
+        nonce = batch.transaction_count('0x' + '22' * 20)
+        blk_num = batch.call(rootchain.functions.childChain_len())
+        block_number = batch.block_number()
+        receipt = batch.transaction_receipt(b'\x33' * 32)
+        batch.send()
+    finally:
+        server.shutdown()
+
+    # All in one round trip
+    assert len(requests) == 1
+    assert [r['method'] for r in requests[0]] == \
+            ['eth_getTransactionCount', 'eth_call', 'eth_blockNumber', 'eth_getTransactionReceipt']
+    assert nonce.value == 5
+    assert blk_num.value == 3
+    assert block_number.value == 16
+    assert receipt.value is None
+
+
+def test_cache(w3):
+    assert get_cache(w3) is get_cache(w3)
+    calls = []
+    cache = RpcCache(w3, ttl=0)
+    assert cache.get('key', lambda: calls.append(1) or len(calls)) == 1
+    assert cache.get('key', lambda: calls.append(1) or len(calls)) == 2  # Expired
+    cache.ttl = 60
+    assert cache.get('key', lambda: calls.append(1) or len(calls)) == 3
+    assert cache.get('key', lambda: calls.append(1) or len(calls)) == 3
+    assert cache.chain_id == w3.eth.chainId
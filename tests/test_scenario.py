@@ -0,0 +1,54 @@
+# Test reverting the chain, the operator and the users to a snapshot
+from plasma_cash import TokenStatus
+from plasma_cash.scenario import ChainSnapshot
+
+
+def published(chain):
+    """ u1 deposits their token, and a couple more blocks get published """
+    u1 = chain.users[0]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        chain.mine()
+        chain.operator.monitor()
+        u1.monitor()
+    chain.operator.publish_block()
+    chain.operator.publish_block()
+
+
+def test_scenario(scenario):
+    chain = scenario(published)
+    w3, mine, operator = chain.w3, chain.mine, chain.operator
+    u1, u2 = chain.users[:2]
+    token = u1.purse[0]
+    block_number = w3.eth.blockNumber
+    height = u1.chain_height.height
+    root = operator.transactions[-2].root_hash
+    assert height == len(operator.transactions) - 1
+
+    snapshot = ChainSnapshot(w3, operator, chain.users)
+    # u2 never handled any events, so they are still waiting for it
+    waiting = sorted(len(f.logs) for f in u2.listeners.keys())
+    assert waiting[-1] >= height
+    for _ in range(2):
+        # Move on from there
+        u1.transfer(u2.address, token.uid)
+        u2.purse.append(token)
+        while u2.chain_height.update() == height:
+            mine()
+            operator.monitor()
+        u2.monitor()
+        assert operator.deposits[token.uid].newOwner == u2.address
+
+        # And back again
+        snapshot.revert()
+        assert w3.eth.blockNumber == block_number
+        assert len(operator.transactions) - 1 == height == u1.chain_height.height
+        assert operator.transactions[-2].root_hash == root
+        token = u1.purse[0]
+        assert token.status is TokenStatus.PLASMACHAIN and len(token.history) == 1
+        assert operator.deposits[token.uid].newOwner == u1.address
+        assert not u2.purse
+
+        # Including the events u2 handled since
+        assert sorted(len(f.logs) for f in u2.listeners.keys()) == waiting
@@ -0,0 +1,75 @@
+# Test exits are finalized automatically once their challenge period is over
+from plasma_cash import User
+from plasma_cash.scheduler import ExitScheduler
+
+
+def test_exit_scheduler(tmp_path):
+    path = str(tmp_path / 'exits.json')
+    scheduler = ExitScheduler(path)
+    scheduler.schedule(1, 30)
+    scheduler.schedule(2, 10)
+    scheduler.schedule(3, 20)
+    scheduler.cancel(3)
+    assert scheduler.next_deadline == 10
+    assert scheduler.ripe(5) == []
+    scheduler.challenge(1, 7)
+
+    # Survives a restart (challenges too)
+    scheduler = ExitScheduler(path)
+    assert len(scheduler) == 2
+    assert scheduler.challenges == {1: {7}}
+    assert scheduler.ripe(30) == [2, 1]
+
+    # Ripe exits stay scheduled until they are done
+    assert ExitScheduler(path).ripe(30) == [2, 1]
+    scheduler.cancel(2)
+    scheduler.unchallenge(1, 7)
+    assert ExitScheduler(path).ripe(30) == [1] and not ExitScheduler(path).challenges[1]
+    scheduler.cancel(1)
+    assert scheduler.next_deadline is None
+    assert len(ExitScheduler(path)) == 0 and not ExitScheduler(path).challenges
+
+    # Rescheduled exits only count once, and a batch is saved once at the end
+    scheduler.schedule(4, 10)
+    scheduler.schedule(4, 40)
+    assert scheduler.next_deadline == 40 and scheduler.ripe(30) == []
+    with scheduler.batch():
+        scheduler.schedule(5, 50)
+        scheduler.cancel(4)
+        assert 4 in ExitScheduler(path) and 5 not in ExitScheduler(path)
+    assert ExitScheduler(path).scheduled == [5]
+
+
+def test_auto_finalize(tmp_path, w3, mine, token_contract, rootchain_contract, operator, users):
+    u1, u2 = users[:2]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+    logger = rootchain_contract.events.BlockPublished.createFilter(fromBlock=w3.eth.blockNumber)
+    while len(logger.get_all_entries()) < 2:
+        mine()
+        operator.monitor()
+
+    # u2 starts an exit, and then restarts
+    path = str(tmp_path / 'exits.json')
+    u2 = User(w3, token_contract.address, rootchain_contract.address, operator,
+              u2._acct.key, purse=u2.purse, exits_path=path)
+    u2.withdraw(token.uid)
+    assert token.in_withdrawal
+    u2 = User(w3, token_contract.address, rootchain_contract.address, operator,
+              u2._acct.key, purse=u2.purse, exits_path=path)
+    assert u2.tokens_in_withdrawal == {token.uid: token}
+
+    # Exit is finalized on its own after the challenge period
+    deadline = u2.exit_scheduler.next_deadline
+    while w3.eth.getBlock('latest')['timestamp'] < deadline:
+        mine()
+    u2.monitor()
+    assert len(u2.exit_scheduler) == 0
+    assert token_contract.functions.ownerOf(token.uid).call() == u2.address
+    assert not token.deposited
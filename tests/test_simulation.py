@@ -0,0 +1,29 @@
+# Test the simulation harness runs a small workload end to end
+from plasma_cash.simulation import Simulation
+
+
+def test_simulation(w3, token_contract, rootchain_contract):
+    sim = Simulation(
+            w3,
+            token_contract.address,
+            rootchain_contract.address,
+            operator_key=w3.provider.ethereum_tester.backend.account_keys[0],
+            num_users=4,
+            num_tokens=6,
+            seed=1,
+            challenge_period=1,  # See conftest
+            trace_memory=True,
+        )
+    report = sim.run(steps=16, workload={'transfer': 75, 'malicious_exit': 25})
+
+    assert report.operations['deposit'] >= 6
+    assert report.operations['transfer'] > 0
+    assert report.transfers_per_second > 0
+    assert report.publish_latencies
+    assert report.memory_per_token > 0
+    assert report.gas_per_operation['deposit'] > 0
+    assert report.gas_per_operation['submitBlock'] > 0
+    assert report.operations['malicious_exit'] > 0
+    assert report.gas_per_operation['challengeExit'] > 0
+    assert report.tracked_tokens == len(sim.operator.deposits)
+    assert str(report)
@@ -0,0 +1,75 @@
+# Test operator snapshots (full and incremental) restore the same state
+from plasma_cash import Operator
+
+
+def run_until_published(w3, mine, operator, users, num_blocks=1):
+    target = len(operator.transactions) + num_blocks
+    while len(operator.transactions) < target:
+        mine()
+        operator.monitor()
+        for u in users:
+            u.monitor()
+
+
+def assert_same_state(a, b):
+    assert a.last_sync_time == b.last_sync_time
+    assert a.deposits.keys() == b.deposits.keys()
+    for token_uid, txn in a.deposits.items():
+        assert txn.to_bytes == b.deposits[token_uid].to_bytes
+    assert a.pending_deposits.keys() == b.pending_deposits.keys()
+    assert len(a.transactions) == len(b.transactions)
+    for blk_a, blk_b in zip(a.transactions, b.transactions):
+        assert blk_a.root_hash == blk_b.root_hash
+        assert dict(blk_a.leaves) == dict(blk_b.leaves)
+        for token_uid in blk_a.leaves.keys():
+            assert blk_a.branch(token_uid) == blk_b.branch(token_uid)
+
+
+def test_snapshot_restore(tmpdir, w3, mine, operator, rootchain_contract, users):
+    path = str(tmpdir.join('operator.snapshot'))
+    u1, u2 = users[:2]
+    token = u1.purse[0]
+
+    # Deposit and get it published
+    u1.deposit(token.uid)
+    run_until_published(w3, mine, operator, [u1])
+    assert token.transferrable
+
+    operator.snapshot(path)
+    restored = Operator(w3, rootchain_contract.address, operator._acct.key)
+    restored.restore(path)
+    assert_same_state(operator, restored)
+
+    # Transfer it, and then only write the changes
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+    run_until_published(w3, mine, operator, [], num_blocks=2)
+    operator.snapshot(path, incremental=True)
+
+    restored = Operator(w3, rootchain_contract.address, operator._acct.key)
+    restored.restore(path)
+    assert_same_state(operator, restored)
+    assert restored.deposits[token.uid].newOwner == u2.address
+
+    # The restored operator can keep snapshotting incrementally
+    restored.snapshot(path, incremental=True)
+
+    # A torn write of the last segment falls back to the prior segment
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-3])
+    restored = Operator(w3, rootchain_contract.address, operator._acct.key)
+    restored.restore(path)
+    assert_same_state(operator, restored)
+
+    # Appending after a torn write drops what was left of it first
+    restored.snapshot(path, incremental=True)
+    again = Operator(w3, rootchain_contract.address, operator._acct.key)
+    again.restore(path)
+    assert_same_state(operator, again)
+
+    # A full snapshot replaces the file, so what was restored from it is untouched
+    operator.snapshot(path)
+    assert_same_state(operator, again)
+    assert_same_state(operator, restored)
@@ -0,0 +1,62 @@
+# Test signing many transfers at once and sending them as one batch
+from plasma_cash import Token, User
+
+
+def test_transfer_many(tmpdir, w3, mine, operator, token_contract, rootchain_contract, users):
+    u1, u2, u3 = users[:3]
+    operator.open_wal(str(tmpdir.join('operator.wal')))
+    for uid in range(2000, 2006):
+        token_contract.functions.mint(u1.address, uid).transact()
+        u1.purse.append(Token(uid))
+    tokens = list(u1.purse)
+    u1.deposit_many([t.uid for t in tokens])
+    u1.monitor()
+    while not all(t.transferrable for t in tokens):
+        mine()
+        operator.monitor()
+        u1.monitor()
+
+    # Signatures match signing one at a time, even when split across workers
+    pool = u1.signer_pool
+    assert pool is u1.signer_pool and pool is not u2.signer_pool  # One per account
+    pool.chunk_size = 2
+    txns = u1._sign_transfers([(u2.address, t) for t in tokens], 1)
+    for txn in txns:
+        assert txn.signer == u1.address
+        assert txn.signature == u1._sign_transfer(u2.address, txn.tokenId, 1).signature
+
+    # One bad transfer doesn't stop the rest
+    syncs = operator.wal.syncs
+    # NOTE Nothing is applied before it is durable
+    sync = operator.wal.sync
+    def spy(seq=None):
+        assert all(operator.deposits[t.uid].newOwner == u1.address for t in tokens)
+        sync(seq)
+    operator.wal.sync = spy
+    results = u1.transfer_many(
+        [(u2.address, t.uid) for t in tokens[:3]] +
+        [(u3.address, 999)] +  # Not ours
+        [(u3.address, t.uid) for t in tokens[3:]]
+    )
+    assert results.pop(999) is False
+    assert results == {t.uid: True for t in tokens}
+    assert operator.wal.syncs == syncs + 1  # Logged together
+    assert all(operator.deposits[t.uid].newOwner == u2.address for t in tokens[:3])
+    assert all(operator.deposits[t.uid].newOwner == u3.address for t in tokens[3:])
+    assert all(t.history[-1] == operator.deposits[t.uid] for t in tokens)
+    assert not any(t in u1.purse for t in tokens)
+
+    # Rejected ones stay in the purse with their history untouched
+    token = Token(3000)
+    u2.purse.append(token)
+    assert u2.transfer_many([(u1.address, token.uid)]) == {token.uid: False}
+    assert token in u2.purse and token.history == []
+
+    # The pool is only stopped once nobody on the account uses it
+    other = User(w3, token_contract.address, rootchain_contract.address, operator, u1._acct.key)
+    assert other.signer_pool is pool
+    u1.close()
+    messages = [txn.msg for txn in txns]
+    assert pool.sign(messages) == [txn.signature for txn in txns]  # Still has its workers
+    other.close()
+    assert u1.signer_pool is not pool
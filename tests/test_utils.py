@@ -3,9 +3,11 @@ import pytest
 from web3 import Web3, EthereumTesterProvider
 import vyper
 
-from hypothesis import given, strategies as st
+from hypothesis import given, settings, strategies as st
 from trie.smt import calc_root
 
+from plasma_cash.smt import EMPTY_HASHES
+
 
 @pytest.fixture(scope="module")
 def merkle_root_contract():
@@ -33,3 +35,21 @@ def test_calc_root(merkle_root_contract, tokenId, txnHash, proof):
     a = merkle_root_contract.functions.getMerkleRoot(tokenId, txnHash, proof).call()
     b = calc_root(to_bytes32(tokenId), txnHash, proof)
     assert a == b, "Mismatch\nl: {}\nr: {}".format("0x"+a.hex(), "0x"+b.hex())
+
+
+@settings(deadline=None)  # NOTE Calls into the contract are slow
+@given(
+    tokenId=st.integers(min_value=0, max_value=2**256-1),
+    txnHash=st.binary(min_size=32, max_size=32),
+    # Proofs of a sparse tree: default hashes, except for a few siblings
+    siblings=st.dictionaries(
+        keys=st.integers(min_value=0, max_value=255),
+        values=st.binary(min_size=32, max_size=32),
+        max_size=16,
+    ),
+)
+def test_calc_root_sparse(merkle_root_contract, tokenId, txnHash, siblings):
+    proof = [siblings.get(depth, EMPTY_HASHES[255 - depth]) for depth in range(256)]
+    a = merkle_root_contract.functions.getMerkleRoot(tokenId, txnHash, proof).call()
+    b = calc_root(to_bytes32(tokenId), txnHash, proof)
+    assert a == b, "Mismatch\nl: {}\nr: {}".format("0x"+a.hex(), "0x"+b.hex())
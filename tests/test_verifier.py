@@ -0,0 +1,45 @@
+# Test received tokens are checked against the published roots
+from plasma_cash import (
+    Token,
+    TokenStatus,
+    Transaction,
+)
+
+
+def test_receive(w3, mine, operator, rootchain_contract, users):
+    u1, u2, u3 = users[:3]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    assert u1.verifier.is_verified(token.history[0])
+
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+    logger = rootchain_contract.events.BlockPublished.createFilter(fromBlock=w3.eth.blockNumber)
+    while len(logger.get_all_entries()) < 2:
+        mine()
+        operator.monitor()
+
+    # u1 forges a transfer to u3 that was never in a block
+    forged = Transaction(
+            w3.eth.chainId,
+            rootchain_contract.address,
+            token.history[-1].prevBlkNum,
+            token.uid,
+            u3.address,
+        )
+    signature = u1._acct.sign_message(forged.msg)
+    forged.add_signature((signature.v, signature.r, signature.s))
+    fake_token = Token(token.uid, status=TokenStatus.PLASMACHAIN,
+                       history=[token.history[0], forged])
+    assert not u3.receive(u1.address, fake_token)
+    assert fake_token not in u3.purse
+
+    # The real history checks out (and each root is only fetched once)
+    assert u3.receive(u2.address, token)
+    assert token in u3.purse
+    assert all(u3.verifier.is_verified(txn) for txn in token.history)
+    assert set(u3.verifier.roots.keys()) == {txn.prevBlkNum for txn in token.history}
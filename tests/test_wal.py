@@ -0,0 +1,69 @@
+# Test transactions the operator accepted survive a crash (write-ahead log)
+import threading
+
+from plasma_cash import (
+    Operator,
+    Transaction,
+)
+from plasma_cash.wal import WriteAheadLog
+
+
+def test_group_commit(tmpdir, w3, rootchain_contract, users):
+    path = str(tmpdir.join('operator.wal'))
+    wal = WriteAheadLog(path, w3.eth.chainId, rootchain_contract.address, commit_delay=0.001)
+
+    def log_transfers(user):
+        for blk_num in range(50):
+            txn = Transaction(w3.eth.chainId, rootchain_contract.address,
+                              blk_num, 123, user.address)
+            signature = user._acct.sign_message(txn.msg)
+            txn.add_signature((signature.v, signature.r, signature.s))
+            wal.log(blk_num, txn)
+
+    threads = [threading.Thread(target=log_transfers, args=(u,)) for u in users[:8]]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(list(wal.records())) == 8 * 50
+    assert wal.syncs < 8 * 50  # Concurrent transactions shared their fsyncs
+    wal.close()
+
+    # A torn write at the end is dropped
+    with open(path, 'ab') as f:
+        f.write(b'\x00' * 100)
+    wal = WriteAheadLog(path, w3.eth.chainId, rootchain_contract.address)
+    archive = wal.archive()
+    assert len(archive) == 50
+    assert {t.newOwner for t in archive[0]} == {u.address for u in users[:8]}
+    wal.truncate()
+    assert len(list(wal.records())) == 0
+
+
+def test_crash_recovery(tmpdir, w3, mine, operator, rootchain_contract, users):
+    snapshot_path = str(tmpdir.join('operator.snapshot'))
+    wal_path = str(tmpdir.join('operator.wal'))
+    operator.open_wal(wal_path)
+    u1, u2 = users[:2]
+    token = u1.purse[0]
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    operator.snapshot(snapshot_path)
+
+    # The operator acknowledges a transfer, and then crashes
+    u1.transfer(u2.address, token.uid)
+    u2.purse.append(token)
+
+    restored = Operator(w3, rootchain_contract.address, operator._acct.key)
+    restored.restore(snapshot_path)
+    assert restored.deposits[token.uid].newOwner == u1.address
+    assert restored.open_wal(wal_path) == 1
+    assert restored.deposits[token.uid].to_bytes == token.history[-1].to_bytes
+    assert restored.transactions[-1].root_hash == operator.transactions[-1].root_hash
+
+    # Logged transactions are dropped once they're in a snapshot
+    restored.snapshot(snapshot_path)
+    assert len(list(restored.wal.records())) == 0
@@ -0,0 +1,101 @@
+# Test the watchtower challenges fraudulent exits on its own
+from plasma_cash import Token, watchtower as watchtower_module
+from plasma_cash.watchtower import Watchtower
+
+
+def test_watchtower(w3, mine, operator, rootchain_contract, users):
+    u1, u2, u3 = users[:3]
+    token = u1.purse[0]
+    watchtower = Watchtower(w3, rootchain_contract.address, operator, u3._acct.key)
+
+    # u1 deposits, and it goes u1 -> u2 -> u3
+    u1.deposit(token.uid)
+    while not token.transferrable:
+        mine()
+        operator.monitor()
+        u1.monitor()
+    logger = rootchain_contract.events.BlockPublished.createFilter(fromBlock=w3.eth.blockNumber)
+    for sender, receiver in [(u1, u2), (u2, u3)]:
+        sender.transfer(receiver.address, token.uid)
+        receiver.purse.append(token)
+        num_blocks = len(logger.get_all_entries())
+        while len(logger.get_all_entries()) == num_blocks:
+            mine()
+            operator.monitor()
+    watchtower.watch(token.uid, token.history)
+
+    # u2 tries to exit with the token they already spent
+    rootchain_contract.functions.startExit(
+            token.history[0].to_tuple,
+            operator.get_branch(token.uid, token.history[0].prevBlkNum),
+            token.history[1].to_tuple,
+            operator.get_branch(token.uid, token.history[1].prevBlkNum),
+        ).transact({'from': u2.address})
+
+    # Watchtower notices and challenges it
+    logger = rootchain_contract.events.ExitCancelled.createFilter(fromBlock=w3.eth.blockNumber)
+    watchtower.monitor()
+    assert len(watchtower.challenges) == 1
+    log = logger.get_all_entries()[0]
+    assert log.args.tokenId == token.uid
+
+    # u3 makes a valid exit, and the watchtower leaves it alone
+    u3.withdraw(token.uid)
+    watchtower.monitor()
+    assert len(watchtower.challenges) == 1
+    assert watchtower.find_challenge(token.uid, *token.history[-2:]) is None
+
+    # Nor is an honest exit of a spend it hasn't recorded yet
+    watchtower.watch(token.uid, token.history[:-1])
+    assert watchtower.find_challenge(token.uid, *token.history[-2:]) is None
+
+
+def test_failed_challenge(w3, mine, monkeypatch, operator, token_contract, rootchain_contract, users):
+    u1, u2, u3 = users[:3]
+    tokens = [Token(uid) for uid in (2000, 2001)]
+    for token in tokens:
+        token_contract.functions.mint(u1.address, token.uid).transact()
+        u1.purse.append(token)
+    watchtower = Watchtower(w3, rootchain_contract.address, operator, u3._acct.key)
+
+    # u1 deposits both, and they go u1 -> u2 -> u3
+    u1.deposit_many([t.uid for t in tokens])
+    u1.monitor()
+    while not all(t.transferrable for t in tokens):
+        mine()
+        operator.monitor()
+        u1.monitor()
+    logger = rootchain_contract.events.BlockPublished.createFilter(fromBlock=w3.eth.blockNumber)
+    for sender, receiver in [(u1, u2), (u2, u3)]:
+        for token in tokens:
+            sender.transfer(receiver.address, token.uid)
+            receiver.purse.append(token)
+        num_blocks = len(logger.get_all_entries())
+        while len(logger.get_all_entries()) == num_blocks:
+            mine()
+            operator.monitor()
+    for token in tokens:
+        watchtower.watch(token.uid, token.history)
+
+    # u2 tries to exit with both (seen in the same poll)
+    for token in tokens:
+        rootchain_contract.functions.startExit(
+                token.history[0].to_tuple,
+                operator.get_branch(token.uid, token.history[0].prevBlkNum),
+                token.history[1].to_tuple,
+                operator.get_branch(token.uid, token.history[1].prevBlkNum),
+            ).transact({'from': u2.address})
+
+    # The first challenge fails, but the second still goes out
+    transact = watchtower_module.transact
+    calls = []
+    def fail_first(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ValueError("Challenge reverted")
+        return transact(*args)
+    monkeypatch.setattr(watchtower_module, 'transact', fail_first)
+    logger = rootchain_contract.events.ExitCancelled.createFilter(fromBlock=w3.eth.blockNumber)
+    watchtower.monitor()
+    assert len(calls) == 2 and len(watchtower.challenges) == 1
+    assert [log.args.tokenId for log in logger.get_all_entries()] == [tokens[1].uid]